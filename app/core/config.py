@@ -1,4 +1,6 @@
 import os
+import json
+from typing import Dict
 from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Campus Security System"
@@ -10,5 +12,71 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "480"))
     
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./campus_security.db")
+    
+    # Serve scans from the per-process credential index; disable to read `credentials` on every scan
+    CREDENTIAL_INDEX_ENABLED: bool = os.getenv("CREDENTIAL_INDEX_ENABLED", "true").lower() == "true"
+    # How often each worker asks the database whether other workers changed what its caches hold
+    CACHE_CHECK_SECONDS: float = float(os.getenv("CACHE_CHECK_SECONDS", "1"))
+    
+    # Repeats of a rejected QR code at the same gate within this window update the first violation
+    UNAUTHORIZED_SCAN_COALESCE_SECONDS: int = int(os.getenv("UNAUTHORIZED_SCAN_COALESCE_SECONDS", "30"))
+    REJECTED_SCAN_CACHE_SIZE: int = int(os.getenv("REJECTED_SCAN_CACHE_SIZE", "10000"))
+    
+    # Write-behind: answer the gate once violations are in the local journal, insert them in the background
+    VIOLATION_WRITE_BEHIND: bool = os.getenv("VIOLATION_WRITE_BEHIND", "false").lower() == "true"
+    VIOLATION_JOURNAL_PATH: str = os.getenv("VIOLATION_JOURNAL_PATH", "./violation_journal.jsonl")
+    VIOLATION_JOURNAL_FSYNC: bool = os.getenv("VIOLATION_JOURNAL_FSYNC", "true").lower() == "true"
+    VIOLATION_JOURNAL_FLUSH_SECONDS: float = float(os.getenv("VIOLATION_JOURNAL_FLUSH_SECONDS", "1.0"))
+    
+    # Retried scans with the same Idempotency-Key, or gate/code/timestamp, replay the first response
+    IDEMPOTENCY_TTL_SECONDS: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "120"))
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    
+    # Face matching: implementation as "module:Class", default threshold and per-gate overrides ({"gate_id": 0.8})
+    FACE_MATCHER: str = os.getenv("FACE_MATCHER", "app.services.face_matcher:GradientHistogramMatcher")
+    FACE_MATCH_THRESHOLD: float = float(os.getenv("FACE_MATCH_THRESHOLD", "0.75"))
+    FACE_MATCH_GATE_THRESHOLDS: Dict[str, float] = json.loads(os.getenv("FACE_MATCH_GATE_THRESHOLDS", "{}"))
+    # Enrolled photos, stored by content hash, and the URL prefix they are served under
+    PHOTO_STORE_PATH: str = os.getenv("PHOTO_STORE_PATH", "./student_photos")
+    PHOTO_URL_BASE: str = os.getenv("PHOTO_URL_BASE", "/api/v1/photos")
+    # Photos are served to staff tokens, or to URLs signed for gate screens that stay valid for
+    # one to two of these periods (signed with a key derived from SECRET_KEY)
+    PHOTO_URL_TTL_SECONDS: int = int(os.getenv("PHOTO_URL_TTL_SECONDS", "3600"))
+    # Uploads are downscaled to this longest side; gate screens get thumbnails of the second size,
+    # and the most recently served thumbnails are kept in memory up to the byte budget
+    PHOTO_MAX_SIDE: int = int(os.getenv("PHOTO_MAX_SIDE", "1024"))
+    PHOTO_THUMB_SIDE: int = int(os.getenv("PHOTO_THUMB_SIDE", "160"))
+    PHOTO_CACHE_BYTES: int = int(os.getenv("PHOTO_CACHE_BYTES", str(32 * 1024 * 1024)))
+    # Unreferenced photos older than the grace period are removed every interval (0 disables the background run)
+    PHOTO_GC_INTERVAL_SECONDS: float = float(os.getenv("PHOTO_GC_INTERVAL_SECONDS", "21600"))
+    PHOTO_GC_GRACE_SECONDS: float = float(os.getenv("PHOTO_GC_GRACE_SECONDS", "86400"))
+    # Memory-mapped reference embeddings shared by all workers (<path>.f32 matrix, <path>.json index)
+    EMBEDDING_STORE_PATH: str = os.getenv("EMBEDDING_STORE_PATH", "./face_embeddings")
+    # Largest image accepted by face verify/identify and photo enrollment, in any upload form
+    MAX_IMAGE_UPLOAD_BYTES: int = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+    # 1:N identification switches from exact search to an IVF index at this many enrolled faces (0: always exact)
+    FACE_IVF_MIN_ROWS: int = int(os.getenv("FACE_IVF_MIN_ROWS", "20000"))
+    FACE_IVF_NPROBE: int = int(os.getenv("FACE_IVF_NPROBE", "8"))
+    # Probe images are decoded and embedded in a process pool; when FACE_WORKER_QUEUE_LIMIT images are
+    # in flight or one takes longer than the timeout, verification falls back to a manual check.
+    # Every uvicorn worker starts its own pool, so by default the CPUs are split between the
+    # WEB_CONCURRENCY workers (the variable uvicorn reads for --workers) instead of each taking all of them
+    FACE_WORKERS: int = int(os.getenv("FACE_WORKERS", str(max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1"))))))
+    FACE_WORKER_QUEUE_LIMIT: int = int(os.getenv("FACE_WORKER_QUEUE_LIMIT", str(4 * FACE_WORKERS)))
+    FACE_WORKER_TIMEOUT_SECONDS: float = float(os.getenv("FACE_WORKER_TIMEOUT_SECONDS", "2.0"))
+    # Captures failing these checks get a "recapture" answer instead of a match attempt: shorter side in
+    # pixels, mean brightness (0-255) and Laplacian variance of a 128px grayscale copy (8-bit units)
+    FACE_QUALITY_MIN_SIZE: int = int(os.getenv("FACE_QUALITY_MIN_SIZE", "96"))
+    FACE_QUALITY_MIN_BRIGHTNESS: float = float(os.getenv("FACE_QUALITY_MIN_BRIGHTNESS", "40"))
+    FACE_QUALITY_MAX_BRIGHTNESS: float = float(os.getenv("FACE_QUALITY_MAX_BRIGHTNESS", "225"))
+    FACE_QUALITY_MIN_SHARPNESS: float = float(os.getenv("FACE_QUALITY_MIN_SHARPNESS", "50"))
+    # This many failed verifications of one subject at one gate within the window lock them out there
+    FACE_FAIL_LOCKOUT_THRESHOLD: int = int(os.getenv("FACE_FAIL_LOCKOUT_THRESHOLD", "3"))
+    FACE_FAIL_WINDOW_SECONDS: float = float(os.getenv("FACE_FAIL_WINDOW_SECONDS", "300"))
+    FACE_FAIL_LOCKOUT_SECONDS: float = float(os.getenv("FACE_FAIL_LOCKOUT_SECONDS", "600"))
+    
+    # Ed25519 private key (PKCS#8 PEM) that signs offline credential snapshots; generated on first use if
+    # missing. Gates only get the public half, from GET /gates/credentials/public-key
+    CREDENTIAL_SNAPSHOT_KEY_PATH: str = os.getenv("CREDENTIAL_SNAPSHOT_KEY_PATH", "./credential_snapshot_key.pem")
 
 settings = Settings()
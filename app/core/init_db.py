@@ -1,4 +1,5 @@
-from sqlmodel import Session
+from sqlalchemy import inspect, text
+from sqlmodel import Session, select
 from app.core.database import engine, create_db_and_tables
 from app.utils.sample_data import (
     create_gates, create_departments, create_security_staff
@@ -8,12 +9,69 @@ from app.utils.sample_data_subjects import (
 )
 from app.utils.mock_data import populate_mock_data
 
+def backfill_credentials(session: Session):
+    """Populate `credentials` for databases created before the table existed."""
+    from app.models.credential import Credential, credential_for
+    from app.models.student import Student
+    from app.models.staff import StaffMember
+    from app.models.visitor import Visitor
+    if session.exec(select(Credential)).first():
+        return
+    for model in (Student, StaffMember, Visitor):
+        for subject in session.exec(select(model)).all():
+            if not session.get(Credential, subject.qr_code):
+                session.add(credential_for(subject))
+                session.flush()
+    session.commit()
+
+def backfill_visitor_gates(session: Session):
+    """Populate `visitor_gates` from `visitors.allowed_gates` for databases created before it existed."""
+    from app.models.visitor import Visitor
+    from app.models.visitor_gate import VisitorGate, gate_ids
+    if session.exec(select(VisitorGate)).first():
+        return
+    for visitor in session.exec(select(Visitor).where(Visitor.allowed_gates != None)).all():
+        session.add_all(VisitorGate(visitor_id=visitor.id, gate_id=g) for g in gate_ids(visitor.allowed_gates))
+    session.commit()
+
+def seed_credential_version(session: Session):
+    """Start the credential version counter at the highest version already issued."""
+    from sqlalchemy import func
+    from app.models.credential import Credential, CredentialVersion
+    if session.get(CredentialVersion, 1):
+        return
+    session.add(CredentialVersion(id=1, value=session.exec(select(func.max(Credential.version))).one() or 0))
+    session.commit()
+
+def create_missing_indexes():
+    """Create indexes declared on models after their table already existed."""
+    from sqlmodel import SQLModel
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def upgrade_credentials_table():
+    """Add the sync columns to a `credentials` table created before they existed."""
+    columns = {c["name"] for c in inspect(engine).get_columns("credentials")}
+    with engine.begin() as conn:
+        if "revoked" not in columns:
+            conn.execute(text("ALTER TABLE credentials ADD COLUMN revoked BOOLEAN NOT NULL DEFAULT 0"))
+        if "version" not in columns:
+            conn.execute(text("ALTER TABLE credentials ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_credentials_version ON credentials (version)"))
+
 def init_db():
     with Session(engine) as session:
         # Check if data already exists
         from app.models.gate import Gate
         try:
             if session.query(Gate).first():
+                create_db_and_tables()
+                upgrade_credentials_table()
+                create_missing_indexes()
+                backfill_credentials(session)
+                backfill_visitor_gates(session)
+                seed_credential_version(session)
                 return
         except Exception:
             pass
@@ -1,15 +1,49 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from sqlmodel import Session
 from app.core.config import settings
 from app.core.init_db import init_db
-from app.routers import auth, scan, violations, visitors, vehicles, alerts, students
+from app.core.database import engine
+from app.models.credential import CredentialConflict
+from app.services.credential_index import credential_index
+from app.services.gate_registry import gate_registry
+from app.services.active_pass_index import active_passes
+from app.services.embedding_store import embedding_store
+from app.services.face_workers import face_workers
+from app.services.failure_tracker import failure_tracker
+from app.services.photo_store import photo_store
+from app.services.violation_journal import violation_journal
+from app.routers import auth, scan, violations, visitors, vehicles, alerts, students, gates, metrics, gate_channel, photos
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(f"Starting {settings.PROJECT_NAME}...")
     init_db()
+    # Replay violations journaled before the last shutdown; harmless when write-behind is off
+    violation_journal.apply_pending(engine)
+    with Session(engine) as session:
+        credential_index.load(session)
+        gate_registry.load(session)
+        active_passes.load(session)
+        failure_tracker.load(session, violation_journal.pending())
+        embedding_store.backfill(session, photo_store.read)
+    face_workers.start()
+    journal_task = None
+    if settings.VIOLATION_WRITE_BEHIND:
+        journal_task = asyncio.create_task(violation_journal.run(engine, settings.VIOLATION_JOURNAL_FLUSH_SECONDS))
+    photo_gc_task = None
+    if settings.PHOTO_GC_INTERVAL_SECONDS > 0:
+        photo_gc_task = asyncio.create_task(photo_store.run(engine, settings.PHOTO_GC_INTERVAL_SECONDS, settings.PHOTO_GC_GRACE_SECONDS))
     yield
+    if journal_task:
+        journal_task.cancel()
+        violation_journal.apply_pending(engine)
+    if photo_gc_task:
+        photo_gc_task.cancel()
+    face_workers.shutdown()
     print(f"Shutting down {settings.PROJECT_NAME}...")
 
 app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION, lifespan=lifespan)
@@ -22,13 +56,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(CredentialConflict)
+async def credential_conflict(request: Request, exc: CredentialConflict):
+    # Services check codes up front; this catches any path that didn't
+    return JSONResponse(status_code=400, content={"detail": {
+        "status": "error", "code": "QR_CODE_EXISTS", "message": "This QR code is already in use"}})
+
 app.include_router(auth.router, prefix=settings.API_V1_STR)
 app.include_router(scan.router, prefix=settings.API_V1_STR)
 app.include_router(violations.router, prefix=settings.API_V1_STR)
 app.include_router(visitors.router, prefix=settings.API_V1_STR)
 app.include_router(vehicles.router, prefix=settings.API_V1_STR)
 app.include_router(students.router, prefix=settings.API_V1_STR)
+app.include_router(gates.router, prefix=settings.API_V1_STR)
+app.include_router(metrics.router, prefix=settings.API_V1_STR)
+app.include_router(photos.router, prefix=settings.API_V1_STR)
 app.include_router(alerts.router)
+app.include_router(gate_channel.router)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,20 @@
+from sqlalchemy import insert, update
+from sqlmodel import SQLModel, Field, Session, select
+
+class CacheGeneration(SQLModel, table=True):
+    """Counter per in-process cache, bumped by every commit that changes what the cache holds."""
+    __tablename__ = "cache_generations"
+
+    name: str = Field(primary_key=True)
+    value: int = Field(default=0)
+
+def bump(session: Session, name: str):
+    """Advance `name`'s generation inside the session's current transaction."""
+    connection = session.connection()
+    table = CacheGeneration.__table__
+    bumped = connection.execute(update(table).where(table.c.name == name).values(value=table.c.value + 1))
+    if bumped.rowcount == 0:
+        connection.execute(insert(table).values(name=name, value=1))
+
+def current(session: Session, name: str) -> int:
+    return session.exec(select(CacheGeneration.value).where(CacheGeneration.name == name)).first() or 0
@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event, inspect, func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, Field, Session, select
+from app.models.enums import SubjectTypeEnum
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.models.visitor import Visitor
+
+class Credential(SQLModel, table=True):
+    __tablename__ = "credentials"
+
+    qr_code: str = Field(primary_key=True)
+    subject_type: SubjectTypeEnum = Field(index=True)
+    subject_id: str = Field(index=True)
+    valid_from: Optional[datetime] = None
+    valid_until: Optional[datetime] = None
+    revoked: bool = Field(default=False)
+    version: int = Field(default=0, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+SUBJECT_MODELS = {Student: SubjectTypeEnum.STUDENT, StaffMember: SubjectTypeEnum.STAFF, Visitor: SubjectTypeEnum.VISITOR}
+
+class CredentialConflict(IntegrityError):
+    """A subject was given a QR code that is live for another subject; the flush is aborted."""
+
+    def __init__(self, qr_code: str):
+        super().__init__(None, None, ValueError(f"QR code {qr_code!r} is already issued to another subject"))
+        self.qr_code = qr_code
+
+def credential_for(subject) -> Credential:
+    return Credential(
+        qr_code=subject.qr_code, subject_type=SUBJECT_MODELS[type(subject)], subject_id=subject.id,
+        valid_from=getattr(subject, "valid_from", None), valid_until=getattr(subject, "valid_until", None)
+    )
+
+class CredentialVersion(SQLModel, table=True):
+    """Single-row counter behind `credentials.version`."""
+    __tablename__ = "credential_version"
+
+    id: int = Field(default=1, primary_key=True)
+    value: int = Field(default=0)
+
+def current_version(session) -> int:
+    """Highest credential version handed out by a committed transaction."""
+    return session.exec(select(CredentialVersion.value).where(CredentialVersion.id == 1)).first() or 0
+
+class _Versions:
+    """Hands out one new `credentials.version` per flush, on first use."""
+
+    def __init__(self, session):
+        self.session, self.value = session, None
+
+    def next(self) -> int:
+        if self.value is None:
+            # Incrementing the counter row write-locks it until this transaction ends, so
+            # concurrent flushes get distinct versions and commit in version order; a delta
+            # client that has seen version N can never later miss a change numbered below N
+            connection = self.session.connection()
+            counter = CredentialVersion.__table__
+            bumped = connection.execute(update(counter).where(counter.c.id == 1).values(value=counter.c.value + 1))
+            if bumped.rowcount == 0:
+                start = self.session.exec(select(func.max(Credential.version))).one() or 0
+                connection.execute(insert(counter).values(id=1, value=start + 1))
+            self.value = connection.execute(select(counter.c.value).where(counter.c.id == 1)).scalar_one()
+        return self.value
+
+def _owns(credential: Credential, subject) -> bool:
+    return credential.subject_type == SUBJECT_MODELS[type(subject)] and credential.subject_id == subject.id
+
+def _issue(session, subject, versions: _Versions):
+    credential = session.get(Credential, subject.qr_code)
+    if credential is not None and not credential.revoked and not _owns(credential, subject):
+        # Codes are unique across students, staff and visitors: never hand over a live one
+        raise CredentialConflict(subject.qr_code)
+    if credential is None:
+        credential = credential_for(subject)
+        session.add(credential)
+    elif credential.revoked:
+        # Re-issuing a revoked code reuses its tombstone row
+        fresh = credential_for(subject)
+        credential.subject_type, credential.subject_id = fresh.subject_type, fresh.subject_id
+        credential.valid_from, credential.valid_until, credential.revoked = fresh.valid_from, fresh.valid_until, False
+    credential.version = versions.next()
+    credential.updated_at = datetime.utcnow()
+    return credential
+
+def _revoke(session, qr_code: str, subject, versions: _Versions):
+    credential = session.get(Credential, qr_code)
+    # Only the subject a code was issued to can give it up
+    if credential and not credential.revoked and _owns(credential, subject):
+        credential.revoked, credential.version, credential.updated_at = True, versions.next(), datetime.utcnow()
+
+@event.listens_for(Session, "before_flush")
+def _sync_credentials(session, flush_context, instances):
+    """
+    Mirror subject QR codes into `credentials` inside the same flush, so both commit
+    or roll back together. Every change bumps the row's version; codes that stop
+    being valid are kept as revoked tombstones so delta sync can report them. A code
+    that is live for another subject raises CredentialConflict.
+    """
+    versions = _Versions(session)
+    with session.no_autoflush:
+        for obj in list(session.deleted):
+            if type(obj) in SUBJECT_MODELS:
+                _revoke(session, obj.qr_code, obj, versions)
+        for obj in list(session.new):
+            if type(obj) in SUBJECT_MODELS:
+                _issue(session, obj, versions)
+        for obj in list(session.dirty):
+            if type(obj) not in SUBJECT_MODELS or not session.is_modified(obj):
+                continue
+            history = inspect(obj).attrs.qr_code.history
+            if history.deleted and history.deleted[0] != obj.qr_code:
+                _revoke(session, history.deleted[0], obj, versions)
+            credential = _issue(session, obj, versions)
+            if isinstance(obj, Visitor):
+                credential.valid_from, credential.valid_until = obj.valid_from, obj.valid_until
@@ -23,7 +23,7 @@ class FailAttempt(SQLModel, table=True):
     captured_image_url: Optional[str] = None
     confidence_score: Optional[float] = None
     violation_id: Optional[str] = Field(default=None, foreign_key="violations.id")
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     
     gate: "Gate" = Relationship(back_populates="fail_attempts")
     student: Optional["Student"] = Relationship(back_populates="fail_attempts")
@@ -19,7 +19,7 @@ class Student(SQLModel, table=True):
     enrollment_status: EnrollmentStatusEnum = Field(default=EnrollmentStatusEnum.ACTIVE)
     qr_code: str = Field(unique=True, index=True)
     enrolled_at: datetime = Field(default_factory=datetime.utcnow)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     department: Optional["Department"] = Relationship(back_populates="students")
@@ -0,0 +1,34 @@
+import json
+from sqlalchemy import event, inspect, delete
+from sqlmodel import SQLModel, Field, Session
+from app.models.visitor import Visitor
+
+class VisitorGate(SQLModel, table=True):
+    """One row per gate a visitor pass is limited to; passes valid at every gate have none."""
+    __tablename__ = "visitor_gates"
+
+    visitor_id: str = Field(foreign_key="visitors.id", primary_key=True)
+    gate_id: str = Field(foreign_key="gates.id", primary_key=True, index=True)
+
+def gate_ids(allowed_gates) -> list:
+    return sorted(set(json.loads(allowed_gates))) if allowed_gates else []
+
+@event.listens_for(Session, "before_flush")
+def _sync_visitor_gates(session, flush_context, instances):
+    """Keep `visitor_gates` in step with `visitors.allowed_gates` within the same flush."""
+    stale, fresh = set(), []
+    for obj in list(session.new):
+        if isinstance(obj, Visitor):
+            fresh.append(obj)
+    for obj in list(session.dirty):
+        if isinstance(obj, Visitor) and inspect(obj).attrs.allowed_gates.history.has_changes():
+            stale.add(obj.id)
+            fresh.append(obj)
+    for obj in list(session.deleted):
+        if isinstance(obj, Visitor):
+            stale.add(obj.id)
+    if stale:
+        with session.no_autoflush:
+            session.execute(delete(VisitorGate).where(VisitorGate.visitor_id.in_(stale)))
+    for visitor in fresh:
+        session.add_all(VisitorGate(visitor_id=visitor.id, gate_id=g) for g in gate_ids(visitor.allowed_gates))
@@ -1 +1 @@
-from . import auth, scan, violations, visitors, vehicles, alerts
+from . import auth, scan, violations, visitors, vehicles, alerts, gates, metrics, gate_channel
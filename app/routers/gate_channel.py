@@ -0,0 +1,31 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlmodel import Session
+from app.core.database import get_session
+from app.services.auth_service import AuthService
+from app.services.gate_channel_service import GateChannel
+
+router = APIRouter(prefix="/ws", tags=["Gate Devices"])
+
+@router.websocket("/gate/{gate_id}")
+async def gate_channel(websocket: WebSocket, gate_id: str, token: Optional[str] = None, session: Session = Depends(get_session)):
+    """Opens only for a staff token, sent as `?token=` or as an `Authorization: Bearer` header."""
+    channel = GateChannel(gate_id)
+    try:
+        bearer = websocket.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not (token or bearer):
+            raise HTTPException(status_code=401, detail="Missing token")
+        AuthService.user_for_token(session, token or bearer)
+        channel.validate(session)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    # The session lives as long as the connection (get_session closes it); end the handshake's
+    # transaction so an idle gate doesn't hold a pooled connection
+    session.rollback()
+    await websocket.accept()
+    try:
+        while True:
+            await websocket.send_text(await channel.handle(session, await websocket.receive_text()))
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,33 @@
+import base64
+from fastapi import APIRouter, Depends, Query, Response
+from sqlmodel import Session
+from app.core.database import get_session
+from app.services.auth_service import AuthService
+from app.services.credential_sync_service import CredentialSyncService, public_key
+from app.schemas.common import SuccessResponse
+from app.models.security_staff import SecurityStaff
+
+router = APIRouter(prefix="/gates", tags=["Gates"])
+
+SNAPSHOT_MEDIA_TYPE = "application/vnd.campus-security.credentials"
+
+@router.get("/credentials/snapshot")
+async def credential_snapshot(session: Session = Depends(get_session), user: SecurityStaff = Depends(AuthService.get_current_user)):
+    """Signed binary snapshot of every active credential, for offline validation on gate devices."""
+    version, payload = CredentialSyncService.snapshot(session)
+    return Response(content=payload, media_type=SNAPSHOT_MEDIA_TYPE, headers={"X-Credential-Version": str(version)})
+
+@router.get("/credentials/delta")
+async def credential_delta(
+    since: int = Query(..., ge=0),
+    session: Session = Depends(get_session),
+    user: SecurityStaff = Depends(AuthService.get_current_user)
+):
+    """Signed binary delta of credentials changed after version `since`."""
+    version, payload = CredentialSyncService.delta(session, since)
+    return Response(content=payload, media_type=SNAPSHOT_MEDIA_TYPE, headers={"X-Credential-Version": str(version)})
+
+@router.get("/credentials/public-key", response_model=SuccessResponse)
+async def credential_public_key(user: SecurityStaff = Depends(AuthService.get_current_user)):
+    """Ed25519 public key that verifies snapshot and delta signatures; safe to provision on every gate."""
+    return {"status": "success", "data": {"algorithm": "Ed25519", "publicKey": base64.b64encode(public_key()).decode()}}
@@ -0,0 +1,28 @@
+from typing import Optional
+from fastapi import APIRouter, Depends
+from app.schemas.common import SuccessResponse
+from app.services.auth_service import require_admin
+from app.services.scan_metrics import scan_latency, BUCKET_BOUNDS_MS
+from app.services.face_workers import face_workers
+from app.services.face_quality import face_quality
+from app.models.security_staff import SecurityStaff
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@router.get("/scan-latency", response_model=SuccessResponse)
+async def scan_latency_histograms(
+    gateId: Optional[str] = None, pipeline: Optional[str] = None,
+    user: SecurityStaff = Depends(require_admin)
+):
+    """Per-gate, per-stage latency histograms for the scan_qr, verify_face and identify_face pipelines since startup."""
+    return {"status": "success", "data": {"bucketBoundsMs": list(BUCKET_BOUNDS_MS), "histograms": scan_latency.snapshot(gateId, pipeline)}}
+
+@router.get("/face-workers", response_model=SuccessResponse)
+async def face_worker_pool(user: SecurityStaff = Depends(require_admin)):
+    """Face matching process pool: queue depth, rejections, timeouts and utilization since startup."""
+    return {"status": "success", "data": face_workers.snapshot()}
+
+@router.get("/face-quality", response_model=SuccessResponse)
+async def face_capture_quality(user: SecurityStaff = Depends(require_admin)):
+    """Per-gate face captures checked and rejected for recapture, by reason, since startup."""
+    return {"status": "success", "data": face_quality.snapshot()}
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import time
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.database import get_session
+from app.schemas.common import SuccessResponse
+from app.services.auth_service import AuthService, require_admin
+from app.models.security_staff import SecurityStaff
+from app.services.photo_store import photo_store, thumbnails, PHOTO_NAME, HASH_NAME, CONTENT_TYPES
+
+router = APIRouter(prefix="/photos", tags=["Photos"])
+optional_bearer = HTTPBearer(auto_error=False)
+
+@router.post("/collect", response_model=SuccessResponse)
+async def collect_photos(
+    dryRun: bool = False,
+    session: Session = Depends(get_session),
+    user: SecurityStaff = Depends(require_admin)
+):
+    """Remove photos no subject refers to that are older than PHOTO_GC_GRACE_SECONDS; reports reclaimed bytes."""
+    stats = await asyncio.to_thread(photo_store.collect, session, settings.PHOTO_GC_GRACE_SECONDS, dryRun)
+    return {"status": "success", "data": stats}
+
+@router.get("/{name}")
+async def get_photo(
+    request: Request, name: str, size: str = Query("full", pattern="^(full|thumb)$"),
+    expires: Optional[int] = None, signature: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    session: Session = Depends(get_session)
+):
+    """
+    An enrolled photo, as stored (`full`, for the dashboard) or scaled to
+    PHOTO_THUMB_SIDE (`thumb`, for gate screens), for a staff Bearer token or
+    a URL signed by the server (the `photoUrl` in scan responses). Photo
+    contents never change under a name, so responses carry a strong ETag and
+    may be kept by the client's own cache, until the signature expires;
+    single byte ranges are answered with 206.
+    """
+    if not PHOTO_NAME.fullmatch(name):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    if credentials:
+        AuthService.user_for_token(session, credentials.credentials)
+        max_age = 31536000 if HASH_NAME.fullmatch(name) else 3600
+    elif photo_store.verify_signature(name, expires, signature):
+        max_age = expires - int(time.time())
+    else:
+        raise HTTPException(status_code=401, detail="A staff token or a signed photo URL is required")
+    session.close()
+    stem, extension = os.path.splitext(name)
+    side = settings.PHOTO_THUMB_SIDE if size == "thumb" else None
+    etag = f'"{stem}-{side or "full"}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes",
+               "Cache-Control": f"private, max-age={max_age}" + (", immutable" if HASH_NAME.fullmatch(name) else "")}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if side:
+        body = thumbnails.get((name, side))
+        if body is None:
+            body = await asyncio.to_thread(photo_store.derivative, name, side)
+            if body is not None: thumbnails.put((name, side), body)
+        media_type = "image/jpeg"
+    else:
+        body = await asyncio.to_thread(photo_store.read, name)
+        media_type = CONTENT_TYPES[extension.lstrip(".")]
+    if body is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    if_range = request.headers.get("if-range")
+    byte_range = _byte_range(request.headers.get("range"), len(body)) if if_range in (None, etag) else None
+    if byte_range is None:
+        return Response(content=body, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+    return Response(content=body[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match: return False
+    return any(tag.strip() in ("*", etag, "W/" + etag) for tag in if_none_match.split(","))
+
+def _byte_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte of a single `bytes=` range; None to send the whole photo."""
+    if not header or not header.startswith("bytes=") or "," in header: return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else length - 1
+        else:
+            start, end = max(0, length - int(last)), length - 1
+    except ValueError:
+        return None
+    if start > end or start >= length:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{length}"})
+    return start, min(end, length - 1)
@@ -1,31 +1,72 @@
-from fastapi import APIRouter, Depends
+import hashlib
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Request, Response
 from sqlmodel import Session
 from app.core.database import get_session
-from app.schemas.scan import QRScanRequest, FaceVerifyRequest
+from app.schemas.scan import (
+    QRScanRequest, QRBatchScanRequest, FaceVerifyFields, FaceVerifyRequest, FaceIdentifyFields, FaceIdentifyRequest
+)
 from app.schemas.common import SuccessResponse
 from app.services.qr_service import QRService
-from app.services.visitor_qr_service import VisitorQRService
+from app.services.credential_index import CredentialEntry
 from app.services.face_match_service import FaceMatchService
+from app.services.scan_metrics import scan_latency
+from app.services.idempotency_cache import scan_replays
+from app.services.auth_service import AuthService
+from app.models.security_staff import SecurityStaff
+from app.utils.uploads import read_image_request, image_request_body
 
 router = APIRouter(prefix="/scan", tags=["Gate Scanning"])
 
 @router.post("/qr", response_model=SuccessResponse)
-async def scan_qr(scan_data: QRScanRequest, session: Session = Depends(get_session)):
-    QRService.validate_gate(session, scan_data.gateId)
-    
-    res = QRService.check_student(session, scan_data.qrCode)
-    if res: return {"status": "success", "data": res}
-    
-    res = QRService.check_staff(session, scan_data.qrCode)
-    if res: return {"status": "success", "data": res}
-    
-    res = await VisitorQRService.check_visitor(session, scan_data.qrCode, scan_data.gateId, scan_data.scanTimestamp)
-    if res: return {"status": "success", "data": res}
-    
-    res = await QRService.handle_unauthorized_qr(session, scan_data.qrCode, scan_data.gateId, scan_data.scanTimestamp)
+async def scan_qr(
+    scan_data: QRScanRequest, response: Response, session: Session = Depends(get_session),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    key = scan_replays.key("scan_qr", scan_data.gateId, idempotency_key, scan_data.qrCode, scan_data.scanTimestamp)
+    with scan_latency.timed(session, "scan_qr", scan_data.gateId) as timer:
+        res, replayed = await scan_replays.run(
+            key, lambda: QRService.scan(session, scan_data.qrCode, scan_data.gateId, scan_data.scanTimestamp)
+        )
+    headers = {"Server-Timing": timer.server_timing(), "Idempotent-Replayed": "true" if replayed else "false"}
+    if isinstance(res, CredentialEntry):
+        # Success bodies are rendered once per credential; skip model validation and encoding
+        return Response(content=res.body, media_type="application/json", headers=headers)
+    response.headers.update(headers)
     return {"status": "success", "data": res}
 
-@router.post("/face/verify", response_model=SuccessResponse)
-async def verify_face(verify_data: FaceVerifyRequest, session: Session = Depends(get_session)):
-    res = await FaceMatchService.verify(session, verify_data.subjectId, verify_data.subjectType, verify_data.gateId, verify_data.scanTimestamp)
+@router.post("/qr/batch", response_model=SuccessResponse)
+async def scan_qr_batch(batch: QRBatchScanRequest, session: Session = Depends(get_session)):
+    results = await QRService.scan_batch(session, batch.scans)
+    return {"status": "success", "data": {"results": results}}
+
+@router.post("/face/verify", response_model=SuccessResponse,
+             openapi_extra=image_request_body(FaceVerifyFields, FaceVerifyRequest, "faceImage"))
+async def verify_face(
+    request: Request, response: Response, session: Session = Depends(get_session),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """JSON with a base64 `faceImage`, multipart with a `faceImage` file, or a raw image/* body with query fields."""
+    verify_data, face_image, _ = await read_image_request(request, FaceVerifyFields, FaceVerifyRequest, "faceImage")
+    key = scan_replays.key("verify_face", verify_data.gateId, idempotency_key, verify_data.subjectType,
+                           verify_data.subjectId, verify_data.scanTimestamp, hashlib.sha256(face_image).digest())
+    with scan_latency.timed(session, "verify_face", verify_data.gateId) as timer:
+        res, replayed = await scan_replays.run(key, lambda: FaceMatchService.verify(
+            session, verify_data.subjectId, verify_data.subjectType, face_image,
+            verify_data.gateId, verify_data.scanTimestamp
+        ))
+    response.headers.update({"Server-Timing": timer.server_timing(), "Idempotent-Replayed": "true" if replayed else "false"})
+    return {"status": "success", "data": res}
+
+@router.post("/face/identify", response_model=SuccessResponse,
+             openapi_extra=image_request_body(FaceIdentifyFields, FaceIdentifyRequest, "faceImage"))
+async def identify_face(
+    request: Request, response: Response, session: Session = Depends(get_session),
+    user: SecurityStaff = Depends(AuthService.get_current_user)
+):
+    """Top-k enrolled students and staff for a face, e.g. when the person has no QR code."""
+    identify_data, face_image, _ = await read_image_request(request, FaceIdentifyFields, FaceIdentifyRequest, "faceImage")
+    with scan_latency.timed(session, "identify_face", identify_data.gateId) as timer:
+        res = await FaceMatchService.identify(session, face_image, identify_data.gateId, identify_data.topK)
+    response.headers["Server-Timing"] = timer.server_timing()
     return {"status": "success", "data": res}
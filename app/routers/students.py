@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlmodel import Session
 from app.core.database import get_session
 from app.schemas.student import (
-    EnrollPhotoRequest, EnrollPhotoResponse, 
+    EnrollPhotoFields, EnrollPhotoRequest, EnrollPhotoResponse, 
     CreateStudentRequest, UpdateStudentRequest, StudentResponse
 )
 from app.schemas.common import SuccessResponse
 from app.services.student_service import StudentService
 from app.services.auth_service import AuthService
 from app.models.security_staff import SecurityStaff
+from app.utils.uploads import read_image_request, image_request_body
 
 router = APIRouter(prefix="/students", tags=["Students"])
 
@@ -27,7 +29,7 @@ async def create_student(
     Returns:
         201 Created with student data including generated QR code
     """
-    result = StudentService.create_student(
+    result = await StudentService.create_student(
         session=session,
         data=request.model_dump(exclude_none=True)
     )
@@ -41,11 +43,13 @@ async def create_student(
 async def list_students(
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous page; replaces page"),
+    includeTotal: Optional[bool] = Query(None, description="Count all students (default: only in page mode)"),
     session: Session = Depends(get_session),
     current_user: SecurityStaff = Depends(AuthService.get_current_user)
 ):
     """Get list of students with pagination."""
-    result = StudentService.get_students(session=session, page=page, limit=limit)
+    result = StudentService.get_students(session=session, page=page, limit=limit, cursor=cursor, include_total=includeTotal)
     
     return {
         "status": "success",
@@ -85,9 +89,10 @@ async def update_student(
         "data": result
     }
 
-@router.post("/enroll-photo", response_model=SuccessResponse)
+@router.post("/enroll-photo", response_model=SuccessResponse,
+             openapi_extra=image_request_body(EnrollPhotoFields, EnrollPhotoRequest, "photo"))
 async def enroll_student_photo(
-    request: EnrollPhotoRequest,
+    request: Request,
     session: Session = Depends(get_session),
     current_user: SecurityStaff = Depends(AuthService.get_current_user)
 ):
@@ -97,8 +102,12 @@ async def enroll_student_photo(
     This endpoint allows authenticated security staff to add or update the photo
     that will be used as the reference for face verification at gates.
     
+    The photo can be sent as JSON with a base64 `photo`, as multipart/form-data
+    with a `studentId` field and a `photo` file, or as a raw image/* body with
+    `?studentId=`.
+    
     Args:
-        request: Contains studentId and base64 encoded photo
+        request: studentId and the photo, in one of the forms above
         session: Database session
         current_user: Authenticated security staff user
         
@@ -108,12 +117,15 @@ async def enroll_student_photo(
     Raises:
         404: Student not found
         400: Invalid image format
+        413: Image larger than MAX_IMAGE_UPLOAD_BYTES
         401: Unauthorized (no valid token)
     """
-    result = StudentService.enroll_photo(
+    data, image_bytes, extension = await read_image_request(request, EnrollPhotoFields, EnrollPhotoRequest, "photo")
+    result = await StudentService.enroll_photo(
         session=session,
-        student_id=request.studentId,
-        photo_base64=request.photo
+        student_id=data.studentId,
+        image_bytes=image_bytes,
+        extension=extension
     )
     
     return {
@@ -39,8 +39,8 @@ async def list_vehicles(session: Session = Depends(get_session), user: SecurityS
     return {"status": "success", "data": {"vehicles": data, "total": len(data)}}
 
 @router.get("/alerts", response_model=SuccessResponse)
-async def list_alerts(page: int = 1, limit: int = 20, alertType: str = None, resolved: bool = None, session: Session = Depends(get_session), user: SecurityStaff = Depends(AuthService.get_current_user)):
-    alerts, pagination = VehicleAlertService.list_alerts(session, page, limit, alertType, resolved)
+async def list_alerts(page: int = 1, limit: int = 20, alertType: str = None, resolved: bool = None, cursor: Optional[str] = None, includeTotal: Optional[bool] = None, session: Session = Depends(get_session), user: SecurityStaff = Depends(AuthService.get_current_user)):
+    alerts, pagination = VehicleAlertService.list_alerts(session, page, limit, alertType, resolved, cursor, includeTotal)
     data = []
     for a in alerts:
         data.append({
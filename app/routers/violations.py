@@ -16,11 +16,13 @@ async def list_violations(
     type: Optional[str] = None, subjectType: Optional[str] = None,
     gateId: Optional[str] = None, startDate: Optional[datetime] = None,
     endDate: Optional[datetime] = None, resolved: Optional[bool] = None,
+    cursor: Optional[str] = None, includeTotal: Optional[bool] = None,
     session: Session = Depends(get_session),
     user: SecurityStaff = Depends(AuthService.get_current_user)
 ):
+    """Newest first. Pass the previous page's `nextCursor` as `cursor` for keyset paging; `page` still works."""
     filters = {"type": type, "subjectType": subjectType, "gateId": gateId, "startDate": startDate, "endDate": endDate, "resolved": resolved}
-    items, pagination = ViolationService.list_violations(session, page, limit, filters)
+    items, pagination = ViolationService.list_violations(session, page, limit, filters, cursor, includeTotal)
     return {"status": "success", "data": {"violations": [i.model_dump() for i in items], "pagination": pagination.model_dump()}}
 
 @router.patch("/{violation_id}/resolve", response_model=SuccessResponse)
@@ -1,3 +1,4 @@
+from typing import Optional
 from fastapi import APIRouter, Depends
 from sqlmodel import Session
 from app.core.database import get_session
@@ -41,3 +42,15 @@ async def list_passes(session: Session = Depends(get_session), user: SecuritySta
             "createdAt": v.created_at.isoformat() + "Z"
         })
     return {"status": "success", "data": {"visitors": data}}
+
+@router.get("/active", response_model=SuccessResponse)
+async def list_active(gateId: Optional[str] = None, session: Session = Depends(get_session), user: SecurityStaff = Depends(AuthService.get_current_user)):
+    passes = VisitorService.list_active(session, gateId)
+    data = [{
+        "passId": p.id,
+        "visitorName": p.name,
+        "validFrom": p.valid_from.isoformat() + "Z",
+        "validUntil": p.valid_until.isoformat() + "Z",
+        "allowedGates": sorted(p.gates) if p.gates is not None else None
+    } for p in passes]
+    return {"status": "success", "data": {"gateId": gateId, "count": len(data), "visitors": data}}
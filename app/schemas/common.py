@@ -12,9 +12,12 @@ class ErrorResponse(BaseModel):
     details: Optional[List[dict]] = None
 
 class PaginationInfo(BaseModel):
-    currentPage: int
-    totalPages: int
-    totalItems: int
+    # currentPage is null in cursor mode; totals are null when not counted
+    currentPage: Optional[int]
+    totalPages: Optional[int]
+    totalItems: Optional[int]
     itemsPerPage: int
     hasNextPage: bool
     hasPreviousPage: bool
+    # Pass as `cursor` to fetch the next page without an offset; null on the last page
+    nextCursor: Optional[str] = None
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel, Field
 
 class QRScanRequest(BaseModel):
@@ -7,6 +7,9 @@ class QRScanRequest(BaseModel):
     gateId: str
     scanTimestamp: datetime
 
+class QRBatchScanRequest(BaseModel):
+    scans: List[QRScanRequest] = Field(min_length=1, max_length=500)
+
 class QRScanResponseValid(BaseModel):
     valid: bool = True
     subjectType: str
@@ -24,13 +27,23 @@ class QRScanResponseInvalid(BaseModel):
     subjectPersisted: bool
     subject: Optional[dict] = None
 
-class FaceVerifyRequest(BaseModel):
+class FaceVerifyFields(BaseModel):
+    """FaceVerifyRequest without the image, for multipart and raw image uploads."""
     subjectId: str
     subjectType: str
-    faceImage: str = Field(description="Base64 encoded face image")
     gateId: str
     scanTimestamp: datetime
 
+class FaceVerifyRequest(FaceVerifyFields):
+    faceImage: str = Field(description="Base64 encoded face image")
+
+class FaceIdentifyFields(BaseModel):
+    gateId: str
+    topK: int = Field(default=5, ge=1, le=50)
+
+class FaceIdentifyRequest(FaceIdentifyFields):
+    faceImage: str = Field(description="Base64 encoded face image")
+
 class FaceVerifyResponseSuccess(BaseModel):
     verified: bool = True
     confidence: float
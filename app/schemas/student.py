@@ -9,8 +9,11 @@ class SubjectStudent(BaseModel):
     department: Optional[str]
     enrollmentStatus: str
 
-class EnrollPhotoRequest(BaseModel):
+class EnrollPhotoFields(BaseModel):
+    """EnrollPhotoRequest without the image, for multipart and raw image uploads."""
     studentId: str = Field(..., description="Student ID")
+
+class EnrollPhotoRequest(EnrollPhotoFields):
     photo: str = Field(..., description="Base64 encoded image string (data:image/jpeg;base64,...)")
 
 class EnrollPhotoResponse(BaseModel):
@@ -0,0 +1,127 @@
+import heapq
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event
+from sqlmodel import Session, select
+from app.models.visitor import Visitor
+from app.models.visitor_gate import VisitorGate
+from app.services.credential_index import _utc_naive
+
+@dataclass(frozen=True)
+class ActivePass:
+    id: str
+    name: str
+    valid_from: datetime
+    valid_until: datetime
+    gates: Optional[FrozenSet[str]]  # None: every gate
+
+class ActivePassIndex:
+    """
+    Visitor passes that are valid now or will become valid, per process.
+
+    Upcoming passes wait in a heap ordered by valid_from and move to the active set
+    when their window opens; active passes sit in a heap ordered by valid_until and
+    are evicted as it passes. Active passes are also indexed by gate, so "who may
+    enter at gate X right now" costs O(log n) per transition plus the size of the
+    answer. Heap entries of replaced or removed passes are skipped lazily.
+    Committed changes to visitors are re-read on the next query.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._passes: Dict[str, ActivePass] = {}
+        self._upcoming: List[Tuple[datetime, str]] = []
+        self._expiring: List[Tuple[datetime, str]] = []
+        self._active: Set[str] = set()
+        self._by_gate: Dict[str, Set[str]] = {}
+        self._all_gates: Set[str] = set()
+        self._changed: Set[str] = set()
+        self.loaded = False
+
+    def load(self, session: Session, now: Optional[datetime] = None):
+        self.clear()
+        now = now or datetime.utcnow()
+        rows = session.exec(select(Visitor.id, Visitor.name, Visitor.valid_from, Visitor.valid_until, Visitor.allowed_gates)
+                            .where(Visitor.valid_until > now)).all()
+        self._put_rows(session, rows)
+        self.loaded = True
+
+    def mark_changed(self, visitor_ids: Iterable[str]):
+        if self.loaded: self._changed.update(visitor_ids)
+
+    def active_at(self, session: Session, gate_id: Optional[str] = None, now: Optional[datetime] = None) -> List[ActivePass]:
+        """Passes valid at `now`, optionally limited to those admitted at `gate_id`."""
+        self._refresh(session, now)
+        ids = self._active if gate_id is None else self._by_gate.get(gate_id, set()) | self._all_gates
+        return sorted((self._passes[i] for i in ids), key=lambda p: p.valid_until)
+
+    def _refresh(self, session: Session, now: Optional[datetime]):
+        if not self.loaded: self.load(session, now)
+        elif self._changed:
+            changed, self._changed = self._changed, set()
+            for visitor_id in changed: self._remove(visitor_id)
+            rows = session.exec(select(Visitor.id, Visitor.name, Visitor.valid_from, Visitor.valid_until, Visitor.allowed_gates)
+                                .where(Visitor.id.in_(changed))).all()
+            self._put_rows(session, rows)
+        self._advance(now or datetime.utcnow())
+
+    def _put_rows(self, session: Session, rows):
+        restricted = {r[0] for r in rows if r[4]}
+        gates: Dict[str, Set[str]] = {}
+        if restricted:
+            for link in session.exec(select(VisitorGate).where(VisitorGate.visitor_id.in_(restricted))).all():
+                gates.setdefault(link.visitor_id, set()).add(link.gate_id)
+        for visitor_id, name, valid_from, valid_until, allowed_gates in rows:
+            p = ActivePass(visitor_id, name, _utc_naive(valid_from), _utc_naive(valid_until),
+                           frozenset(gates.get(visitor_id, ())) if allowed_gates else None)
+            self._passes[visitor_id] = p
+            heapq.heappush(self._upcoming, (p.valid_from, visitor_id))
+
+    def _advance(self, now: datetime):
+        while self._upcoming and self._upcoming[0][0] <= now:
+            valid_from, visitor_id = heapq.heappop(self._upcoming)
+            p = self._passes.get(visitor_id)
+            if p is None or p.valid_from != valid_from or visitor_id in self._active: continue
+            if p.valid_until <= now:
+                del self._passes[visitor_id]
+                continue
+            self._active.add(visitor_id)
+            for gate_id in (p.gates if p.gates is not None else ()):
+                self._by_gate.setdefault(gate_id, set()).add(visitor_id)
+            if p.gates is None: self._all_gates.add(visitor_id)
+            heapq.heappush(self._expiring, (p.valid_until, visitor_id))
+        while self._expiring and self._expiring[0][0] <= now:
+            valid_until, visitor_id = heapq.heappop(self._expiring)
+            p = self._passes.get(visitor_id)
+            if p is not None and p.valid_until == valid_until and visitor_id in self._active:
+                self._remove(visitor_id)
+
+    def _remove(self, visitor_id: str):
+        p = self._passes.pop(visitor_id, None)
+        if p is None or visitor_id not in self._active: return
+        self._active.discard(visitor_id)
+        self._all_gates.discard(visitor_id)
+        for gate_id in p.gates or ():
+            members = self._by_gate.get(gate_id)
+            if members is not None:
+                members.discard(visitor_id)
+                if not members: del self._by_gate[gate_id]
+
+active_passes = ActivePassIndex()
+
+@event.listens_for(Session, "after_flush")
+def _track_visitor_changes(session, flush_context):
+    ids = {obj.id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Visitor)}
+    if ids: session.info.setdefault("visitor_pass_changes", set()).update(ids)
+
+@event.listens_for(Session, "after_commit")
+def _refresh_on_commit(session):
+    ids = session.info.pop("visitor_pass_changes", None)
+    if ids: active_passes.mark_changed(ids)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("visitor_pass_changes", None)
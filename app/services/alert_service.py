@@ -1,6 +1,6 @@
 import json
 from datetime import datetime
-from typing import Set
+from typing import List, Set
 from fastapi import WebSocket
 
 class AlertService:
@@ -22,6 +22,15 @@ class AlertService:
         }
         await self._broadcast(message)
     
+    async def broadcast_violations(self, violations: List[dict]):
+        """Coalesce violations from one batch into a single message."""
+        message = {
+            "type": "violation_alert_batch",
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "data": {"count": len(violations), "violations": violations}
+        }
+        await self._broadcast(message)
+    
     async def broadcast_vehicle_alert(self, alert_data: dict):
         message = {
             "type": "vehicle_alert",
@@ -8,6 +8,7 @@ from sqlmodel import Session, select
 from app.core.config import settings
 from app.core.database import get_session
 from app.models.security_staff import SecurityStaff
+from app.models.enums import UserRoleEnum
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -26,8 +27,12 @@ class AuthService:
 
     @staticmethod
     async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), session: Session = Depends(get_session)):
+        return AuthService.user_for_token(session, credentials.credentials)
+
+    @staticmethod
+    def user_for_token(session: Session, token: str) -> SecurityStaff:
         try:
-            payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
             user_id = payload.get("sub")
             if not user_id: raise HTTPException(status_code=401, detail="Invalid token")
         except JWTError: raise HTTPException(status_code=401, detail="Invalid token")
@@ -46,3 +51,7 @@ class AuthService:
             session.refresh(user)
             return user
         return None
+
+async def require_admin(user: SecurityStaff = Depends(AuthService.get_current_user)):
+    if user.role != UserRoleEnum.ADMIN: raise HTTPException(status_code=403, detail="Admin access required")
+    return user
@@ -0,0 +1,286 @@
+import json
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Optional, Dict, Tuple, FrozenSet, List, Set, Iterable
+from sqlalchemy import event
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import cache_generation
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.models.visitor import Visitor
+from app.models.department import Department
+from app.models.credential import Credential, current_version
+from app.models.enums import SubjectTypeEnum
+from app.services.photo_store import photo_store
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is None: return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _render(payload: dict) -> bytes:
+    # Same bytes FastAPI's JSONResponse would produce for {"status": "success", "data": payload}
+    return json.dumps({"status": "success", "data": payload}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+@dataclass(frozen=True)
+class CredentialEntry:
+    subject_type: str
+    subject_id: str
+    status: str
+    payload: dict
+    body: bytes
+    depends_on: Tuple[Tuple[str, object], ...] = ()
+    valid_from: Optional[datetime] = None
+    valid_until: Optional[datetime] = None
+    allowed_gates: Optional[FrozenSet[str]] = None
+    photo_url: Optional[str] = None  # unsigned; payload and body carry it signed
+    resign_at: Optional[float] = None  # when the signed photo URL gets too close to expiry
+
+def _signed_photo(photo_url: Optional[str]) -> Tuple[Optional[str], Optional[float]]:
+    """The photo URL as gate screens get it, and when to sign it again (None: never)."""
+    expires = photo_store.signature_expiry()
+    signed = photo_store.signed_url(photo_url, expires)
+    return signed, (expires - settings.PHOTO_URL_TTL_SECONDS if signed != photo_url else None)
+
+def resign_photo(entry: CredentialEntry) -> CredentialEntry:
+    """`entry` with a freshly signed photo URL."""
+    signed, resign_at = _signed_photo(entry.photo_url)
+    payload = {**entry.payload, "subject": {**entry.payload["subject"], "photoUrl": signed}}
+    return replace(entry, payload=payload, body=_render(payload), resign_at=resign_at)
+
+def student_entry(student: Student, department_name: Optional[str]) -> CredentialEntry:
+    photo_url, resign_at = _signed_photo(student.photo_url)
+    payload = {
+        "valid": True, "subjectType": "student", "accessGranted": True,
+        "message": "Access granted", "requiresFaceVerification": True,
+        "subject": {
+            "id": student.id, "name": student.name, "photoUrl": photo_url,
+            "department": department_name,
+            "enrollmentStatus": student.enrollment_status.value
+        }
+    }
+    return CredentialEntry("student", student.id, student.enrollment_status.value, payload, _render(payload),
+                           (("department", student.department_id),), photo_url=student.photo_url, resign_at=resign_at)
+
+def staff_entry(staff: StaffMember, department_name: Optional[str]) -> CredentialEntry:
+    photo_url, resign_at = _signed_photo(staff.photo_url)
+    payload = {
+        "valid": True, "subjectType": "staff", "accessGranted": True,
+        "message": "Access granted", "requiresFaceVerification": True,
+        "subject": {
+            "id": staff.id, "name": staff.name, "photoUrl": photo_url,
+            "department": department_name,
+            "position": staff.position, "employmentStatus": staff.employment_status.value
+        }
+    }
+    return CredentialEntry("staff", staff.id, staff.employment_status.value, payload, _render(payload),
+                           (("department", staff.department_id), ("staff", staff.id)),
+                           photo_url=staff.photo_url, resign_at=resign_at)
+
+def visitor_entry(visitor: Visitor, host: Optional[StaffMember], host_department: Optional[str]) -> CredentialEntry:
+    valid_from, valid_until = _utc_naive(visitor.valid_from), _utc_naive(visitor.valid_until)
+    photo_url, resign_at = _signed_photo(visitor.photo_url)
+    payload = {
+        "valid": True, "subjectType": "visitor", "accessGranted": True,
+        "message": "Visitor pass valid", "requiresFaceVerification": False,
+        "subject": {
+            "id": visitor.id, "name": visitor.name, "photoUrl": photo_url,
+            "purpose": visitor.purpose, "hostName": host.name if host else None,
+            "hostDepartment": host_department,
+            "validFrom": valid_from.isoformat() + "Z",
+            "validUntil": valid_until.isoformat() + "Z"
+        }
+    }
+    allowed = frozenset(json.loads(visitor.allowed_gates)) if visitor.allowed_gates else None
+    depends_on = (("staff", visitor.host_staff_id), ("department", host.department_id if host else None))
+    return CredentialEntry("visitor", visitor.id, "active", payload, _render(payload), depends_on,
+                           valid_from, valid_until, allowed, visitor.photo_url, resign_at)
+
+def build_entries(session: Session, students: Iterable[Student], staff_members: Iterable[StaffMember],
+                  visitors: Iterable[Visitor]) -> List[Tuple[str, CredentialEntry]]:
+    """
+    Render entries for the given subjects, fetching hosts and departments with one
+    IN query each. Ordered so that, for a code held by several subjects, the one
+    the legacy probe order (student, staff, visitor) would pick comes last.
+    """
+    students, staff_members, visitors = list(students), list(staff_members), list(visitors)
+    hosts = {s.id: s for s in staff_members}
+    host_ids = {v.host_staff_id for v in visitors} - hosts.keys()
+    if host_ids:
+        hosts.update({s.id: s for s in session.exec(select(StaffMember).where(StaffMember.id.in_(host_ids))).all()})
+    department_ids = {s.department_id for s in [*students, *hosts.values()] if s.department_id}
+    departments = {}
+    if department_ids:
+        departments = {d.id: d.name for d in session.exec(select(Department).where(Department.id.in_(department_ids))).all()}
+
+    entries = []
+    for v in visitors:
+        host = hosts.get(v.host_staff_id)
+        entries.append((v.qr_code, visitor_entry(v, host, departments.get(host.department_id) if host else None)))
+    entries.extend((s.qr_code, staff_entry(s, departments.get(s.department_id))) for s in staff_members)
+    entries.extend((s.qr_code, student_entry(s, departments.get(s.department_id))) for s in students)
+    return entries
+
+def entry_for_credential(session: Session, credential: Credential) -> Optional[CredentialEntry]:
+    """Build an entry straight from the DB: one PK read per subject, department and host."""
+    if credential.subject_type == SubjectTypeEnum.STUDENT:
+        student = session.get(Student, credential.subject_id)
+        if not student: return None
+        department = session.get(Department, student.department_id) if student.department_id else None
+        return student_entry(student, department.name if department else None)
+    if credential.subject_type == SubjectTypeEnum.STAFF:
+        staff = session.get(StaffMember, credential.subject_id)
+        if not staff: return None
+        department = session.get(Department, staff.department_id) if staff.department_id else None
+        return staff_entry(staff, department.name if department else None)
+    visitor = session.get(Visitor, credential.subject_id)
+    if not visitor: return None
+    host = session.get(StaffMember, visitor.host_staff_id)
+    department = session.get(Department, host.department_id) if host and host.department_id else None
+    return visitor_entry(visitor, host, department.name if department else None)
+
+class CredentialIndex:
+    """
+    Process-wide qr_code -> CredentialEntry map used by the gate scan path.
+
+    Loaded once (at startup, or lazily on the first scan). The services that write
+    students and visitor passes update it immediately; beyond that, any committed
+    change to a subject, department or host staff member re-renders only the
+    entries that display it, on the next lookup. Each uvicorn worker holds its
+    own copy, and at most once per CACHE_CHECK_SECONDS a lookup asks the
+    database what other workers committed: subjects whose credential version
+    moved past the last one seen are re-rendered, and a bumped "departments"
+    cache generation reloads everything.
+    """
+
+    SUBJECT_MODELS = {"student": Student, "staff": StaffMember, "visitor": Visitor}
+
+    def __init__(self):
+        self._entries: Dict[str, CredentialEntry] = {}
+        self._codes: Dict[Tuple[str, str], str] = {}
+        self._dependents: Dict[Tuple[str, object], Set[str]] = {}
+        self._changed: Set[Tuple[str, object]] = set()
+        self.loaded = False
+        self._version = 0
+        self._departments = 0
+        self._checked = 0.0
+
+    def load(self, session: Session):
+        self._entries, self._codes, self._dependents, self._changed = {}, {}, {}, set()
+        # Read before the subjects, so anything committed meanwhile is picked up by the next check
+        self._version, self._departments = current_version(session), cache_generation.current(session, "departments")
+        self._checked = time.monotonic()
+        entries = build_entries(session, session.exec(select(Student)).all(),
+                                session.exec(select(StaffMember)).all(), session.exec(select(Visitor)).all())
+        for qr_code, entry in entries:
+            self._set(qr_code, entry)
+        self.loaded = True
+
+    def lookup(self, session: Session, qr_code: str) -> Optional[CredentialEntry]:
+        self.refresh(session)
+        if self._changed: self._rebuild(session)
+        entry = self._entries.get(qr_code)
+        if entry is not None and entry.resign_at is not None and time.time() >= entry.resign_at:
+            entry = self._entries[qr_code] = resign_photo(entry)
+        return entry
+
+    def refresh(self, session: Session):
+        """Load, or pick up other workers' changes if CACHE_CHECK_SECONDS have passed since the last check."""
+        if not self.loaded: self.load(session)
+        elif time.monotonic() - self._checked >= settings.CACHE_CHECK_SECONDS: self._check(session)
+
+    def seen_version(self, session: Session) -> int:
+        """Newest credential version this index has taken in, after a due check."""
+        self.refresh(session)
+        return self._version
+
+    def clear(self):
+        self._entries, self._codes, self._dependents, self._changed = {}, {}, {}, set()
+        self.loaded = False
+
+    def mark_changed(self, keys: Iterable[Tuple[str, object]]):
+        if self.loaded: self._changed.update(keys)
+
+    def put_student(self, student: Student, department_name: Optional[str]):
+        if self.loaded: self._set(student.qr_code, student_entry(student, department_name))
+
+    def put_staff(self, staff: StaffMember, department_name: Optional[str]):
+        if self.loaded: self._set(staff.qr_code, staff_entry(staff, department_name))
+
+    def put_visitor(self, visitor: Visitor, host: Optional[StaffMember], host_department: Optional[str]):
+        if self.loaded: self._set(visitor.qr_code, visitor_entry(visitor, host, host_department))
+
+    def _check(self, session: Session):
+        """Pick up changes committed by other workers since the last check."""
+        self._checked = time.monotonic()
+        if cache_generation.current(session, "departments") != self._departments:
+            self.load(session)
+            return
+        version = current_version(session)
+        if version <= self._version: return
+        rows = session.exec(select(Credential.subject_type, Credential.subject_id)
+                            .where(Credential.version > self._version, Credential.version <= version)).all()
+        self._changed.update((subject_type.value, subject_id) for subject_type, subject_id in rows)
+        self._version = version
+
+    def _rebuild(self, session: Session):
+        changed, self._changed = self._changed, set()
+        subjects = {key for key in changed if key[0] in self.SUBJECT_MODELS}
+        for key in changed:
+            for code in self._dependents.get(key, ()):
+                entry = self._entries.get(code)
+                if entry: subjects.add((entry.subject_type, entry.subject_id))
+
+        rows = {}
+        for subject_type, model in self.SUBJECT_MODELS.items():
+            ids = {subject_id for t, subject_id in subjects if t == subject_type}
+            rows[subject_type] = session.exec(select(model).where(model.id.in_(ids))).all() if ids else []
+        for qr_code, entry in build_entries(session, rows["student"], rows["staff"], rows["visitor"]):
+            self._set(qr_code, entry)
+
+        found = {(t, r.id) for t, rs in rows.items() for r in rs}
+        for key in subjects - found:
+            code = self._codes.pop(key, None)
+            entry = self._entries.get(code)
+            if entry and (entry.subject_type, entry.subject_id) == key: self._drop(code)
+
+    def _set(self, qr_code: str, entry: CredentialEntry):
+        key = (entry.subject_type, entry.subject_id)
+        previous = self._codes.get(key)
+        stale = self._entries.get(previous) if previous and previous != qr_code else None
+        if stale and (stale.subject_type, stale.subject_id) == key:
+            self._drop(previous)
+        if qr_code in self._entries: self._drop(qr_code)
+        self._codes[key] = qr_code
+        self._entries[qr_code] = entry
+        for dep in entry.depends_on:
+            self._dependents.setdefault(dep, set()).add(qr_code)
+
+    def _drop(self, qr_code: str):
+        entry = self._entries.pop(qr_code)
+        for dep in entry.depends_on:
+            self._dependents.get(dep, set()).discard(qr_code)
+
+credential_index = CredentialIndex()
+
+@event.listens_for(Session, "after_flush")
+def _track_display_changes(session, flush_context):
+    keys = session.info.setdefault("credential_display_changes", set())
+    changed = (*session.new, *session.dirty, *session.deleted)
+    for obj in changed:
+        if isinstance(obj, Department): keys.add(("department", obj.id))
+        elif isinstance(obj, StaffMember): keys.add(("staff", obj.id))
+        elif isinstance(obj, Student): keys.add(("student", obj.id))
+        elif isinstance(obj, Visitor): keys.add(("visitor", obj.id))
+    # Subject changes reach other workers through credential versions; department names need this
+    if any(isinstance(obj, Department) for obj in changed): cache_generation.bump(session, "departments")
+
+@event.listens_for(Session, "after_commit")
+def _rebuild_on_commit(session):
+    keys = session.info.pop("credential_display_changes", None)
+    if keys: credential_index.mark_changed(keys)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("credential_display_changes", None)
@@ -0,0 +1,228 @@
+"""
+Signed credential snapshots for gate devices that must keep working offline.
+
+Payload layout (little-endian):
+
+    header   b"CSCS", u8 format (1), u8 kind (0 snapshot, 1 delta),
+             u64 version, u64 since (0 for snapshots),
+             u16 gate count, then per gate: u8 length + gate id (UTF-8)
+    records  u8 flags (bit0 active, bit1 validity window, bit2 gate mask),
+             u8 subject type (0 student, 1 staff, 2 visitor),
+             u16 length + qr code, u16 length + subject id,
+             [i64 valid_from, i64 valid_until as UTC epoch seconds],
+             [ceil(gate count / 8) bytes, bit i = gate i of the header]
+    trailer  u8 0xFF, u32 record count, 64-byte Ed25519 signature of everything before it
+
+A snapshot holds every active credential with version <= `version`. A delta holds
+every credential whose version moved into (since, version]; records without the
+active flag (revoked codes, suspended or departed subjects) must be removed.
+
+Payloads are signed with the server's Ed25519 private key; gates verify them
+with the public key alone, so a gate device holds no secret that could mint
+snapshots (or API tokens).
+"""
+import json
+import os
+import struct
+import tempfile
+from functools import lru_cache
+from datetime import datetime
+from io import BytesIO
+from typing import Iterable, List, Optional, Tuple
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models.credential import Credential
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.models.visitor import Visitor
+from app.models.enums import SubjectTypeEnum, EnrollmentStatusEnum, EmploymentStatusEnum
+from app.services.credential_index import _utc_naive
+from app.services.gate_registry import gate_registry
+
+MAGIC = b"CSCS"
+FORMAT_VERSION = 2
+SIGNATURE_SIZE = 64
+KIND_SNAPSHOT, KIND_DELTA = 0, 1
+FLAG_ACTIVE, FLAG_WINDOW, FLAG_GATES = 1, 2, 4
+END_OF_RECORDS = 0xFF
+SUBJECT_CODES = {SubjectTypeEnum.STUDENT: 0, SubjectTypeEnum.STAFF: 1, SubjectTypeEnum.VISITOR: 2}
+SUBJECT_TYPES = {code: subject_type.value for subject_type, code in SUBJECT_CODES.items()}
+STREAM_BATCH_SIZE = 1000
+EPOCH = datetime(1970, 1, 1)
+
+@lru_cache(maxsize=None)
+def _signing_key(path: str) -> Ed25519PrivateKey:
+    """The key at `path`, created on first use; concurrent workers all end up with the first one written."""
+    if not os.path.exists(path):
+        pem = Ed25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pem)
+            try:
+                os.link(temp_path, path)  # fails if another worker got there first
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(temp_path)
+    with open(path, "rb") as f:
+        key = serialization.load_pem_private_key(f.read(), password=None)
+    if not isinstance(key, Ed25519PrivateKey):
+        raise RuntimeError(f"{path} is not an Ed25519 private key")
+    return key
+
+def _sign(data: bytes) -> bytes:
+    return _signing_key(settings.CREDENTIAL_SNAPSHOT_KEY_PATH).sign(data)
+
+def public_key() -> bytes:
+    """Raw 32-byte Ed25519 public key gate devices verify payloads with."""
+    return _signing_key(settings.CREDENTIAL_SNAPSHOT_KEY_PATH).public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+def _text(value: str, width: str = "H") -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("<" + width, len(data)) + data
+
+def _epoch(value: datetime) -> int:
+    return int((_utc_naive(value) - EPOCH).total_seconds())
+
+class _PayloadWriter:
+    def __init__(self, kind: int, version: int, since: int, gate_ids: List[str]):
+        self.buffer = BytesIO()
+        self.count = 0
+        self.gate_bits = {gate_id: i for i, gate_id in enumerate(gate_ids)}
+        self.mask_size = (len(gate_ids) + 7) // 8
+        self.buffer.write(MAGIC + struct.pack("<BBQQH", FORMAT_VERSION, kind, version, since, len(gate_ids)))
+        for gate_id in gate_ids:
+            self.buffer.write(_text(gate_id, "B"))
+
+    def record(self, subject_type: SubjectTypeEnum, qr_code: str, subject_id: str, active: bool,
+               window: Optional[Tuple[datetime, datetime]] = None, gates: Optional[Iterable[str]] = None):
+        flags = (FLAG_ACTIVE if active else 0) | (FLAG_WINDOW if window else 0) | (FLAG_GATES if gates is not None else 0)
+        out = self.buffer
+        out.write(struct.pack("<BB", flags, SUBJECT_CODES[subject_type]))
+        out.write(_text(qr_code))
+        out.write(_text(subject_id))
+        if window:
+            out.write(struct.pack("<qq", _epoch(window[0]), _epoch(window[1])))
+        if gates is not None:
+            mask = 0
+            for gate_id in gates:
+                # Gates unknown to the registry cannot scan anything, so they are dropped
+                if gate_id in self.gate_bits: mask |= 1 << self.gate_bits[gate_id]
+            out.write(mask.to_bytes(self.mask_size, "little"))
+        self.count += 1
+
+    def finish(self) -> bytes:
+        self.buffer.write(struct.pack("<BI", END_OF_RECORDS, self.count))
+        data = self.buffer.getvalue()
+        return data + _sign(data)
+
+class CredentialSyncService:
+    @staticmethod
+    def current_version(session: Session) -> int:
+        return session.exec(select(func.max(Credential.version))).one() or 0
+
+    @staticmethod
+    def snapshot(session: Session) -> Tuple[int, bytes]:
+        version = CredentialSyncService.current_version(session)
+        return version, CredentialSyncService._build(session, KIND_SNAPSHOT, version, None)
+
+    @staticmethod
+    def delta(session: Session, since: int) -> Tuple[int, bytes]:
+        version = CredentialSyncService.current_version(session)
+        if since > version:
+            raise HTTPException(status_code=409, detail={
+                "status": "error", "code": "SNAPSHOT_REQUIRED",
+                "message": "Requested version is newer than the server's; download a full snapshot"
+            })
+        return version, CredentialSyncService._build(session, KIND_DELTA, version, since)
+
+    @staticmethod
+    def _rows(session: Session, subject_type: SubjectTypeEnum, model, columns, version: int, since: Optional[int]):
+        # Plain column tuples, fetched in batches; no ORM objects are built
+        stmt = (
+            select(Credential.qr_code, Credential.subject_id, Credential.revoked,
+                   Credential.valid_from, Credential.valid_until, *columns)
+            .outerjoin(model, model.id == Credential.subject_id)
+            .where(Credential.subject_type == subject_type, Credential.version <= version)
+        )
+        stmt = stmt.where(Credential.revoked == False) if since is None else stmt.where(Credential.version > since)
+        return session.exec(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+    @staticmethod
+    def _build(session: Session, kind: int, version: int, since: Optional[int]) -> bytes:
+        writer = _PayloadWriter(kind, version, since or 0, sorted(g.id for g in gate_registry.all(session)))
+        snapshot = since is None
+
+        members = (
+            (SubjectTypeEnum.STUDENT, Student, Student.enrollment_status, EnrollmentStatusEnum.ACTIVE),
+            (SubjectTypeEnum.STAFF, StaffMember, StaffMember.employment_status, EmploymentStatusEnum.ACTIVE),
+        )
+        for subject_type, model, status_column, active_status in members:
+            for qr_code, subject_id, revoked, _, _, status in CredentialSyncService._rows(
+                    session, subject_type, model, (status_column,), version, since):
+                active = not revoked and status == active_status
+                if active or not snapshot:
+                    writer.record(subject_type, qr_code, subject_id, active)
+
+        now = datetime.utcnow()
+        for qr_code, subject_id, revoked, valid_from, valid_until, exists, allowed_gates in CredentialSyncService._rows(
+                session, SubjectTypeEnum.VISITOR, Visitor, (Visitor.id, Visitor.allowed_gates), version, since):
+            active = not revoked and exists is not None and valid_from is not None and valid_until is not None
+            if snapshot and (not active or _utc_naive(valid_until) < now):
+                continue
+            gates = json.loads(allowed_gates) if active and allowed_gates else None
+            writer.record(SubjectTypeEnum.VISITOR, qr_code, subject_id, active,
+                          (valid_from, valid_until) if active else None, gates)
+        return writer.finish()
+
+    @staticmethod
+    def decode(data: bytes, key: Optional[bytes] = None) -> dict:
+        """Reference decoder for the payload format above, verified with a raw public key; raises ValueError on a bad signature."""
+        body, signature = data[:-SIGNATURE_SIZE], data[-SIGNATURE_SIZE:]
+        try:
+            Ed25519PublicKey.from_public_bytes(key or public_key()).verify(signature, body)
+        except InvalidSignature:
+            raise ValueError("Invalid credential snapshot signature")
+        if body[:4] != MAGIC:
+            raise ValueError("Not a credential snapshot")
+        _, kind, version, since, gate_count = struct.unpack_from("<BBQQH", body, 4)
+        pos = 4 + struct.calcsize("<BBQQH")
+        gate_ids = []
+        for _ in range(gate_count):
+            size = body[pos]
+            gate_ids.append(body[pos + 1:pos + 1 + size].decode("utf-8"))
+            pos += 1 + size
+        mask_size = (gate_count + 7) // 8
+
+        records = []
+        while body[pos] != END_OF_RECORDS:
+            flags, subject_code = struct.unpack_from("<BB", body, pos)
+            pos += 2
+            fields = []
+            for _ in range(2):
+                (size,) = struct.unpack_from("<H", body, pos)
+                fields.append(body[pos + 2:pos + 2 + size].decode("utf-8"))
+                pos += 2 + size
+            record = {"qrCode": fields[0], "subjectId": fields[1], "subjectType": SUBJECT_TYPES[subject_code],
+                      "active": bool(flags & FLAG_ACTIVE)}
+            if flags & FLAG_WINDOW:
+                record["validFrom"], record["validUntil"] = struct.unpack_from("<qq", body, pos)
+                pos += 16
+            if flags & FLAG_GATES:
+                mask = int.from_bytes(body[pos:pos + mask_size], "little")
+                record["allowedGates"] = [g for i, g in enumerate(gate_ids) if mask >> i & 1]
+                pos += mask_size
+            records.append(record)
+        (count,) = struct.unpack_from("<I", body, pos + 1)
+        if count != len(records):
+            raise ValueError("Truncated credential snapshot")
+        return {"kind": "snapshot" if kind == KIND_SNAPSHOT else "delta", "version": version, "since": since,
+                "gates": gate_ids, "records": records}
@@ -0,0 +1,188 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.services.face_matcher import get_face_matcher, InvalidImageError
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker only
+    fcntl = None
+
+INITIAL_CAPACITY = 1024
+
+class EmbeddingStore:
+    """
+    Reference face embeddings as one contiguous float32 matrix in a memory-mapped
+    file (`<path>.f32`), with a JSON index mapping "type:id" to a row (`<path>.json`).
+
+    Every uvicorn worker maps the same file, so the pages are shared. Writers take
+    an exclusive lock on `<path>.lock`, write the row in place (or append,
+    doubling the file when full) and atomically replace the index. Readers notice
+    a new index by its inode, so a lookup costs one stat() and returns a view
+    into the map. Rows are append-only: re-enrolling or removing a subject zeroes
+    the old row and never reuses it, so a reader holding a stale index can't get
+    someone else's vector and search indexes over earlier rows stay valid.
+    """
+
+    def __init__(self, path: str):
+        self.open(path)
+
+    def open(self, path: str):
+        self.path = path
+        self._matrix: Optional[np.memmap] = None
+        self._rows: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        self._count = 0
+        self._stamp = None
+
+    @property
+    def data_path(self) -> str:
+        return self.path + ".f32"
+
+    @property
+    def index_path(self) -> str:
+        return self.path + ".json"
+
+    @staticmethod
+    def key(subject_type: str, subject_id: str) -> str:
+        return f"{subject_type}:{subject_id}"
+
+    def get(self, subject_type: str, subject_id: str) -> Optional[np.ndarray]:
+        self._refresh()
+        row = self._rows.get(self.key(subject_type, subject_id))
+        return None if row is None else self._matrix[row]
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        """(keys, rows) for every stored row; rows is a read-only view of the map, removed rows are None and zero."""
+        self._refresh()
+        # Searches call this from worker threads while another may be refreshing. _refresh assigns
+        # the map before the keys, so a map read after the keys always covers them
+        keys = self._keys
+        matrix = self._matrix
+        if matrix is None or not keys: return [], np.empty((0, get_face_matcher().dim), np.float32)
+        return keys, matrix[:len(keys)]
+
+    @property
+    def removed(self) -> int:
+        """Number of zeroed rows in matrix()."""
+        self._refresh()
+        return self._count - len(self._rows)
+
+    def put(self, subject_type: str, subject_id: str, vector: np.ndarray):
+        self.put_many([(subject_type, subject_id, vector)])
+
+    def put_many(self, items: Iterable[Tuple[str, str, np.ndarray]]):
+        """Store (subject type, subject id, vector) items under one lock and one index write."""
+        with self._locked():
+            index = self._writable_index()
+            writes = []
+            for subject_type, subject_id, vector in items:
+                key = self.key(subject_type, subject_id)
+                old = index["rows"].get(key)
+                if old is not None: writes.append((old, None))
+                index["rows"][key] = index["count"]
+                writes.append((index["count"], vector))
+                index["count"] += 1
+            if index["count"] > index["capacity"]:
+                while index["count"] > index["capacity"]: index["capacity"] *= 2
+                os.truncate(self.data_path, index["capacity"] * index["dim"] * 4)
+            self._write_rows(index, writes)
+            self._write_index(index)
+
+    def remove(self, subject_type: str, subject_id: str):
+        with self._locked():
+            index = self._writable_index()
+            row = index["rows"].pop(self.key(subject_type, subject_id), None)
+            if row is None: return
+            self._write_rows(index, [(row, None)])
+            self._write_index(index)
+
+    def put_image(self, subject_type: str, subject_id: str, image_bytes: bytes) -> bool:
+        """Embed and store a newly enrolled photo; an undecodable one removes the old embedding."""
+        try:
+            vector = get_face_matcher().embed(image_bytes)
+        except InvalidImageError:
+            self.remove(subject_type, subject_id)
+            return False
+        self.put(subject_type, subject_id, vector)
+        return True
+
+    def backfill(self, session: Session, read_photo: Callable[[str], Optional[bytes]]) -> int:
+        """Embed enrolled photos that have no row yet, e.g. on first start; returns how many."""
+        self._refresh()
+        added = 0
+        for subject_type, model in (("student", Student), ("staff", StaffMember)):
+            for subject_id, photo_url in session.exec(select(model.id, model.photo_url).where(model.photo_url != None)):
+                if self.key(subject_type, subject_id) in self._rows: continue
+                image_bytes = read_photo(photo_url)
+                if image_bytes is not None:
+                    added += self.put_image(subject_type, subject_id, image_bytes)
+        return added
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            stat = None
+        stamp = stat and (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp: return
+        index = self._load_index() if stat else None
+        if index is None:
+            self._matrix, self._rows, self._keys, self._count, self._stamp = None, {}, [], 0, stamp
+            return
+        if self._matrix is None or self._matrix.shape != (index["capacity"], index["dim"]):
+            self._matrix = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(index["capacity"], index["dim"]))
+        keys = [None] * index["count"]
+        for key, row in index["rows"].items(): keys[row] = key
+        self._rows, self._keys, self._count, self._stamp = index["rows"], keys, index["count"], stamp
+
+    def _load_index(self) -> Optional[dict]:
+        """The on-disk index, or None if missing or written for a matcher with another dimension."""
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return None
+        return index if index["dim"] == get_face_matcher().dim else None
+
+    def _writable_index(self) -> dict:
+        index = self._load_index()
+        if index is not None: return index
+        # New store, or the matcher changed: start over and let backfill re-embed
+        dim = get_face_matcher().dim
+        with open(self.data_path, "wb") as f:
+            f.truncate(INITIAL_CAPACITY * dim * 4)
+        return {"dim": dim, "capacity": INITIAL_CAPACITY, "count": 0, "rows": {}}
+
+    def _write_rows(self, index: dict, writes: List[Tuple[int, Optional[np.ndarray]]]):
+        """Write (row, vector) pairs; None zeroes the row."""
+        matrix = np.memmap(self.data_path, dtype=np.float32, mode="r+", shape=(index["capacity"], index["dim"]))
+        for row, vector in writes:
+            matrix[row] = 0 if vector is None else vector
+        matrix.flush()
+        del matrix
+
+    def _write_index(self, index: dict):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    @contextmanager
+    def _locked(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl: fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl: fcntl.flock(lock, fcntl.LOCK_UN)
+
+embedding_store = EmbeddingStore(settings.EMBEDDING_STORE_PATH)
@@ -0,0 +1,112 @@
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.embedding_store import EmbeddingStore, embedding_store
+
+# Rebuild the IVF index once this fraction of rows was added after it was built
+REBUILD_FRACTION = 0.1
+
+class IVFIndex:
+    """
+    Inverted-file index over unit vectors: spherical k-means splits the rows into
+    about sqrt(n) clusters, kept as a permutation of row numbers grouped by
+    cluster. A search scores the centroids, then gathers and scores only the rows
+    of the `nprobe` closest clusters straight from the shared map, trading a
+    little recall for touching a few percent of the matrix. The index itself
+    holds no vectors, so each worker's copy costs a few bytes per row.
+    """
+
+    def __init__(self, rows: np.ndarray, lists: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.size = len(rows)
+        lists = max(1, min(self.size, lists or int(np.sqrt(self.size))))
+        # Train on a sample; k-means needs a few dozen points per cluster, not all of them
+        sample = np.asarray(rows[np.sort(rng.choice(self.size, min(self.size, lists * 64), replace=False))])
+        centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            onehot = np.zeros((lists, len(sample)), np.float32)
+            onehot[assign, np.arange(len(sample))] = 1
+            sums = onehot @ sample
+            empty = ~sums.any(axis=1)
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+
+        assign = np.concatenate([np.argmax(rows[i:i + 8192] @ centroids.T, axis=1) for i in range(0, self.size, 8192)])
+        order = np.argsort(assign, kind="stable")
+        self.centroids = centroids.astype(np.float32)
+        # Ascending within each cluster, so a gather walks the map forwards
+        self.row_ids = order
+        self.offsets = np.searchsorted(assign[order], np.arange(lists + 1))
+
+    def search(self, rows: np.ndarray, probe: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(row ids, scores) of every row of `rows` in the nprobe clusters closest to the probe."""
+        closeness = self.centroids @ probe
+        nprobe = min(nprobe, len(closeness))
+        nearest = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+        ids = np.concatenate([self.row_ids[self.offsets[c]:self.offsets[c + 1]] for c in nearest])
+        return ids, rows[ids] @ probe
+
+class FaceIndex:
+    """
+    Top-k search over the embedding store. Below FACE_IVF_MIN_ROWS it is one
+    matrix-vector product over the shared map. Above it an IVFIndex serves the
+    rows that existed when it was built; newer rows are scored exactly, and a
+    background rebuild starts once they pass REBUILD_FRACTION. Store rows are
+    append-only, so an index never goes stale, only incomplete.
+    """
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+        self._ivf: Optional[IVFIndex] = None
+        self._building = False
+        self._lock = threading.Lock()
+
+    def search(self, probe: np.ndarray, k: int) -> Tuple[List[Tuple[str, float]], str]:
+        """([(store key, score)] best first, "exact" or "ivf")."""
+        keys, rows = self.store.matrix()
+        ivf = self._current_ivf(len(keys))
+        if ivf is None:
+            ids, scores, method = np.arange(len(keys)), rows @ probe, "exact"
+        else:
+            ids, scores = ivf.search(rows, probe, settings.FACE_IVF_NPROBE)
+            ids = np.concatenate([ids, np.arange(ivf.size, len(keys))])
+            scores = np.concatenate([scores, rows[ivf.size:] @ probe])
+            method = "ivf"
+        # Removed rows score 0 and can outrank poor live matches; over-fetch by their count and skip them
+        take = min(len(ids), k + self.store.removed)
+        if take == 0: return [], method
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.argsort(-scores[top])]
+        hits = [(keys[ids[i]], float(scores[i])) for i in top if keys[ids[i]] is not None]
+        return hits[:k], method
+
+    def rebuild(self):
+        """Build the IVF index over the current rows (synchronously)."""
+        keys, rows = self.store.matrix()
+        try:
+            ivf = IVFIndex(rows) if len(keys) else None
+            with self._lock:
+                self._ivf = ivf
+        finally:
+            self._building = False
+
+    def clear(self):
+        with self._lock:
+            self._ivf = None
+
+    def _current_ivf(self, count: int) -> Optional[IVFIndex]:
+        if not settings.FACE_IVF_MIN_ROWS or count < settings.FACE_IVF_MIN_ROWS:
+            return None
+        ivf = self._ivf
+        if ivf is not None and ivf.size > count:
+            ivf = self._ivf = None  # the store was reset
+        if ivf is None or count - ivf.size > ivf.size * REBUILD_FRACTION:
+            with self._lock:
+                start, self._building = not self._building, True
+            if start:
+                threading.Thread(target=self.rebuild, name="face-ivf-build", daemon=True).start()
+        return ivf
+
+face_index = FaceIndex(embedding_store)
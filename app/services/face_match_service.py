@@ -1,64 +1,156 @@
-import random
+import asyncio
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from fastapi import HTTPException
 from sqlmodel import Session, select
+from app.core.config import settings
 from app.models.violation import Violation
 from app.models.fail_attempt import FailAttempt
+from app.models.student import Student
+from app.models.staff import StaffMember
 from app.models.enums import ViolationTypeEnum, SubjectTypeEnum
 from app.utils.ids import generate_violation_id
 from app.utils.subjects import get_subject_name, link_subject
+from app.utils.timing import stage
 from app.services.alert_service import alert_service
+from app.services.violation_journal import violation_journal
+from app.services.face_matcher import get_face_matcher, InvalidImageError
+from app.services.embedding_store import embedding_store
+from app.services.face_index import face_index
+from app.services.gate_registry import gate_registry
+from app.services.face_workers import face_workers, FaceWorkersBusy
+from app.services.face_quality import face_quality, PoorQualityError, RECAPTURE_MESSAGES
+from app.services.failure_tracker import failure_tracker
 
 class FaceMatchService:
-    THRESHOLD = 0.75
+    @staticmethod
+    def threshold_for(gate_id: str) -> float:
+        return settings.FACE_MATCH_GATE_THRESHOLDS.get(gate_id, settings.FACE_MATCH_THRESHOLD)
+
+    @staticmethod
+    async def embed_probe(session: Session, image_bytes: bytes, gate_id: str) -> np.ndarray:
+        """Embedding of a gate capture, computed in the worker pool; raises PoorQualityError or FaceWorkersBusy."""
+        # Unknown gate ids come from clients; don't let them grow the quality table
+        bucket = gate_id if gate_registry.get(session, gate_id) is not None else "unknown"
+        try:
+            probe = await face_workers.embed(image_bytes)
+        except InvalidImageError as e:
+            raise HTTPException(status_code=400, detail={"status": "error", "code": "INVALID_IMAGE", "message": str(e)})
+        except PoorQualityError as e:
+            face_quality.record(bucket, e.reason)
+            raise
+        face_quality.record(bucket, None)
+        return probe
+
+    @staticmethod
+    def reference_embedding(subject_id: str, subject_type: str) -> Optional[np.ndarray]:
+        """The subject's enrolled embedding: a view into the shared store, no image decoding."""
+        return embedding_store.get(subject_type, subject_id)
+
+    @staticmethod
+    def manual_check(message: str) -> dict:
+        return {"verified": False, "accessGranted": False, "manualCheckRequired": True, "message": message}
 
     @staticmethod
-    async def verify(session: Session, subject_id: str, subject_type: str, gate_id: str, scan_timestamp: datetime):
-        confidence = random.uniform(0.3, 0.98)
-        if confidence >= FaceMatchService.THRESHOLD:
+    def recapture(reason: str) -> dict:
+        return {"verified": False, "accessGranted": False, "recaptureRequired": True,
+                "reason": reason, "message": RECAPTURE_MESSAGES[reason]}
+
+    @staticmethod
+    def locked_out(until: datetime) -> dict:
+        return {"verified": False, "accessGranted": False, "lockedOut": True,
+                "message": "Access blocked: too many failed verifications", "lockoutUntil": until.isoformat() + "Z"}
+
+    @staticmethod
+    async def verify(session: Session, subject_id: str, subject_type: str, face_image: bytes, gate_id: str, scan_timestamp: datetime):
+        until = failure_tracker.locked_until(session, subject_type, subject_id, gate_id)
+        if until:
+            return FaceMatchService.locked_out(until)
+        with stage("decode"):
+            try:
+                probe = await FaceMatchService.embed_probe(session, face_image, gate_id)
+            except PoorQualityError as e:
+                # The camera's fault, not the subject's: ask for another capture, no strike or violation
+                return FaceMatchService.recapture(e.reason)
+            except FaceWorkersBusy:
+                # Saturated: answer now and let the officer check, rather than queue behind other gates
+                return FaceMatchService.manual_check("Face matching is busy; manual check required")
+        with stage("reference"):
+            reference = FaceMatchService.reference_embedding(subject_id, subject_type)
+        if reference is None:
+            # Nothing to compare against: not the subject's fault, so no violation
+            return FaceMatchService.manual_check("No enrolled reference photo; manual check required")
+        with stage("match"):
+            confidence = max(0.0, get_face_matcher().similarity(probe, reference))
+        if confidence >= FaceMatchService.threshold_for(gate_id):
             return {"verified": True, "confidence": round(confidence, 2), 
                     "accessGranted": True, "message": "Face verification successful"}
         
         return await FaceMatchService._handle_failure(session, subject_id, subject_type, gate_id, scan_timestamp, confidence)
 
+    @staticmethod
+    async def identify(session: Session, face_image: bytes, gate_id: str, top_k: int) -> dict:
+        """Best-matching enrolled students and staff for a face, without a claimed identity."""
+        with stage("decode"):
+            try:
+                probe = await FaceMatchService.embed_probe(session, face_image, gate_id)
+            except PoorQualityError as e:
+                return {"matched": False, "candidates": [], "recaptureRequired": True, "reason": e.reason, "message": str(e)}
+            except FaceWorkersBusy as e:
+                raise HTTPException(status_code=503, detail={"status": "error", "code": "FACE_MATCHING_BUSY", "message": str(e)})
+        with stage("search"):
+            # An exact scan over every enrolled face takes milliseconds; keep it off the event loop
+            hits, method = await asyncio.to_thread(face_index.search, probe, top_k)
+        with stage("hydrate"):
+            ids = {"student": [], "staff": []}
+            for key, _ in hits:
+                subject_type, _, subject_id = key.partition(":")
+                ids[subject_type].append(subject_id)
+            names = {}
+            for subject_type, model in (("student", Student), ("staff", StaffMember)):
+                if ids[subject_type]:
+                    for subject_id, name in session.exec(select(model.id, model.name).where(model.id.in_(ids[subject_type]))):
+                        names[(subject_type, subject_id)] = name
+        threshold = FaceMatchService.threshold_for(gate_id)
+        candidates = []
+        for key, score in hits:
+            subject_type, _, subject_id = key.partition(":")
+            if (subject_type, subject_id) not in names: continue  # deleted since enrollment
+            candidates.append({"subjectId": subject_id, "subjectType": subject_type, "name": names[(subject_type, subject_id)],
+                               "confidence": round(max(0.0, score), 2), "aboveThreshold": score >= threshold})
+        return {"matched": bool(candidates) and candidates[0]["aboveThreshold"], "candidates": candidates, "searchMethod": method}
+
     @staticmethod
     async def _handle_failure(session: Session, subject_id: str, subject_type: str, gate_id: str, scan_timestamp: datetime, confidence: float):
-        five_mins_ago = datetime.utcnow() - timedelta(minutes=5)
-        name = get_subject_name(session, subject_id, subject_type)
-        recent = FaceMatchService._get_recent_fails(session, subject_id, subject_type, gate_id, five_mins_ago)
-        count = len(recent) + 1
+        with stage("history"):
+            name = get_subject_name(session, subject_id, subject_type)
+            v_id = generate_violation_id()
+            count, lockout_until = failure_tracker.record(subject_type, subject_id, gate_id, violation_id=v_id)
         
-        v_type = ViolationTypeEnum.MULTIPLE_FAIL_ATTEMPT if count >= 3 else ViolationTypeEnum.FACE_VERIFICATION_MISMATCH
-        v_id = generate_violation_id()
+        v_type = ViolationTypeEnum.MULTIPLE_FAIL_ATTEMPT if lockout_until else ViolationTypeEnum.FACE_VERIFICATION_MISMATCH
         
         v = Violation(id=v_id, type=v_type, subject_type=SubjectTypeEnum(subject_type), gate_id=gate_id, occurred_at=scan_timestamp, confidence_score=confidence, details=json.dumps({"failedAttemptCount": count, "confidence": round(confidence, 2)}))
         link_subject(v, subject_id, subject_type)
-        session.add(v)
         
         f = FailAttempt(subject_type=SubjectTypeEnum(subject_type), gate_id=gate_id, attempted_at=scan_timestamp, confidence_score=confidence, violation_id=v_id)
         link_subject(f, subject_id, subject_type)
-        session.add(f)
-        session.commit()
+        with stage("commit"):
+            await violation_journal.save(session, [v, f])
         
-        await alert_service.broadcast_violation({
-            "id": v_id,
-            "type": v_type.value,
-            "gateId": gate_id,
-            "subjectType": subject_type,
-            "subjectId": subject_id,
-            "confidence": round(confidence, 2)
-        })
+        with stage("broadcast"):
+            await alert_service.broadcast_violation({
+                "id": v_id,
+                "type": v_type.value,
+                "gateId": gate_id,
+                "subjectType": subject_type,
+                "subjectId": subject_id,
+                "confidence": round(confidence, 2)
+            })
         
         res = {"verified": False, "accessGranted": False, "violationType": v_type.value, "message": "Verification failure", "violationId": v_id, "subjectPersisted": True, "subject": {"id": subject_id, "name": name, "type": subject_type}}
-        if count >= 3:
-            res["lockoutUntil"] = (datetime.utcnow() + timedelta(minutes=10)).isoformat() + "Z"
+        if lockout_until:
+            res["lockoutUntil"] = lockout_until.isoformat() + "Z"
             res["failedAttemptCount"] = count
         return res
-
-    @staticmethod
-    def _get_recent_fails(session: Session, subject_id: str, subject_type: str, gate_id: str, since: datetime):
-        q = select(FailAttempt).where(FailAttempt.attempted_at >= since, FailAttempt.gate_id == gate_id)
-        if subject_type == "student": q = q.where(FailAttempt.student_id == subject_id)
-        elif subject_type == "staff": q = q.where(FailAttempt.staff_id == subject_id)
-        elif subject_type == "visitor": q = q.where(FailAttempt.visitor_id == subject_id)
-        return session.exec(q).all()
@@ -0,0 +1,79 @@
+import importlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from io import BytesIO
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from app.core.config import settings
+
+class InvalidImageError(ValueError):
+    pass
+
+class FaceMatcher(ABC):
+    """
+    Turns a face image into a fixed-length, L2-normalised float32 embedding.
+    Scores are cosine similarities, so with unit vectors a matrix-vector product.
+    Select an implementation with FACE_MATCHER="package.module:ClassName".
+    """
+
+    dim: int
+
+    @abstractmethod
+    def embed(self, image_bytes: bytes) -> np.ndarray:
+        """Embedding of shape (dim,), dtype float32; raises InvalidImageError."""
+
+    def score(self, probe: np.ndarray, references: np.ndarray) -> np.ndarray:
+        """Cosine similarity of one probe against an (n, dim) matrix of references."""
+        return references @ probe
+
+    def similarity(self, probe: np.ndarray, reference: np.ndarray) -> float:
+        return float(np.dot(probe, reference))
+
+class GradientHistogramMatcher(FaceMatcher):
+    """
+    CPU-only reference matcher: histograms of oriented gradients over a grid of
+    cells on a normalised grayscale crop. Deterministic and dependency-light, it
+    recognises the same photo and near copies, not faces in general; deployments
+    should plug in a trained face-embedding model.
+    """
+
+    SIZE = 64
+    CELL = 8
+    BINS = 9
+    dim = (SIZE // CELL) ** 2 * BINS
+
+    def __init__(self):
+        rows, cols = np.indices((self.SIZE, self.SIZE))
+        self._cells = ((rows // self.CELL) * (self.SIZE // self.CELL) + cols // self.CELL).ravel() * self.BINS
+
+    def decode(self, image_bytes: bytes) -> np.ndarray:
+        try:
+            with Image.open(BytesIO(image_bytes)) as image:
+                # Let the JPEG decoder downscale in the DCT domain before converting
+                image.draft("L", (self.SIZE * 2, self.SIZE * 2))
+                gray = image.convert("L").resize((self.SIZE, self.SIZE), Image.BILINEAR)
+        except (UnidentifiedImageError, OSError, ValueError) as e:
+            raise InvalidImageError(f"Could not decode face image: {e}")
+        return np.asarray(gray, dtype=np.float32) * (1 / 255)
+
+    def embed(self, image_bytes: bytes) -> np.ndarray:
+        return self.embed_pixels(self.decode(image_bytes))
+
+    def embed_pixels(self, pixels: np.ndarray) -> np.ndarray:
+        gx = np.zeros_like(pixels)
+        gy = np.zeros_like(pixels)
+        gx[:, 1:-1] = pixels[:, 2:] - pixels[:, :-2]
+        gy[1:-1, :] = pixels[2:, :] - pixels[:-2, :]
+        magnitude = np.hypot(gx, gy).ravel()
+        orientation = np.arctan2(gy, gx).ravel() % np.pi
+        bins = np.minimum((orientation * (self.BINS / np.pi)).astype(np.int32), self.BINS - 1)
+        hist = np.bincount(self._cells + bins, weights=magnitude, minlength=self.dim).reshape(-1, self.BINS)
+        hist /= np.linalg.norm(hist, axis=1, keepdims=True) + 1e-6
+        vector = hist.ravel()
+        vector -= vector.mean()  # centre so unrelated images score near zero rather than high
+        return (vector / (np.linalg.norm(vector) + 1e-12)).astype(np.float32)
+
+@lru_cache(maxsize=None)
+def get_face_matcher() -> FaceMatcher:
+    module_name, _, class_name = settings.FACE_MATCHER.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
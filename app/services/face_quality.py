@@ -0,0 +1,76 @@
+import threading
+from collections import Counter
+from io import BytesIO
+from typing import Dict, Optional
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from app.core.config import settings
+from app.services.face_matcher import InvalidImageError
+
+# Edge length of the grayscale copy brightness and sharpness are measured on
+QUALITY_SIZE = 128
+
+RECAPTURE_MESSAGES = {
+    "too_small": "Face image is too small; recapture closer to the camera",
+    "too_dark": "Face image is too dark; recapture with more light",
+    "too_bright": "Face image is overexposed; recapture with less light",
+    "blurry": "Face image is blurry; hold still and recapture",
+}
+
+class PoorQualityError(Exception):
+    def __init__(self, reason: str):
+        super().__init__(RECAPTURE_MESSAGES[reason])
+        self.reason = reason
+
+def assess(image_bytes: bytes) -> Optional[str]:
+    """
+    Why a capture is unusable ("too_small", "too_dark", "too_bright", "blurry"),
+    or None. Measured on a 128px grayscale copy that the JPEG decoder produces
+    mostly by DCT downscaling: mean brightness from the histogram, sharpness as
+    the variance of the Laplacian (in 8-bit units). Raises InvalidImageError.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            if min(image.size) < settings.FACE_QUALITY_MIN_SIZE: return "too_small"
+            image.draft("L", (QUALITY_SIZE, QUALITY_SIZE))
+            gray = np.asarray(image.convert("L").resize((QUALITY_SIZE, QUALITY_SIZE), Image.BILINEAR))
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        raise InvalidImageError(f"Could not decode face image: {e}")
+
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    brightness = float(histogram @ np.arange(256)) / gray.size
+    if brightness < settings.FACE_QUALITY_MIN_BRIGHTNESS: return "too_dark"
+    if brightness > settings.FACE_QUALITY_MAX_BRIGHTNESS: return "too_bright"
+    g = gray.astype(np.float32)
+    laplacian = 4 * g[1:-1, 1:-1] - g[:-2, 1:-1] - g[2:, 1:-1] - g[1:-1, :-2] - g[1:-1, 2:]
+    if laplacian.var() < settings.FACE_QUALITY_MIN_SHARPNESS: return "blurry"
+    return None
+
+class FaceQualityStats:
+    """Per-gate counts of checked captures and rejections by reason."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def record(self, gate_id: str, reason: Optional[str]):
+        with self._lock:
+            self._checked[gate_id] += 1
+            if reason: self._rejected.setdefault(gate_id, Counter())[reason] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            stats = {}
+            for gate_id, checked in sorted(self._checked.items()):
+                rejected = self._rejected.get(gate_id, Counter())
+                total = sum(rejected.values())
+                stats[gate_id] = {"checked": checked, "rejected": total, "rejectRate": round(total / checked, 4),
+                                  "reasons": dict(rejected)}
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._checked: Counter = Counter()
+            self._rejected: Dict[str, Counter] = {}
+
+face_quality = FaceQualityStats()
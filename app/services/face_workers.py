@@ -0,0 +1,115 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.face_matcher import get_face_matcher
+from app.services.face_quality import assess, PoorQualityError
+
+class FaceWorkersBusy(Exception):
+    """The pool is at its queue limit, timed out, or lost a worker; degrade instead of waiting."""
+
+def _embed(image_bytes: bytes) -> Tuple[Optional[np.ndarray], Optional[str], float]:
+    # Runs in a worker process; the matcher is built once per process by get_face_matcher's cache
+    started = time.perf_counter()
+    reason = assess(image_bytes)
+    vector = None if reason else get_face_matcher().embed(image_bytes)
+    return vector, reason, time.perf_counter() - started
+
+def _warm_up():
+    get_face_matcher()
+
+class FaceWorkerPool:
+    """
+    Process pool for quality-checking, decoding and embedding probe images, so a burst of face
+    verifications at one gate doesn't stall the event loop (and with it QR
+    scans and alert broadcasts) for every other gate.
+
+    At most `queue_limit` images are in flight, running or waiting; beyond that,
+    or after `timeout` seconds, `embed` raises FaceWorkersBusy at once. A timed-out
+    task still holds its slot until the worker finishes it.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, timeout: float):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.clear()
+
+    async def embed(self, image_bytes: bytes) -> np.ndarray:
+        """Embedding of one usable capture; raises InvalidImageError, PoorQualityError or FaceWorkersBusy."""
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise FaceWorkersBusy("Face matching queue is full")
+            self.in_flight += 1
+        try:
+            future = self._get_executor().submit(_embed, image_bytes)
+        except (BrokenProcessPool, RuntimeError):
+            self._release(None)
+            self.shutdown()
+            raise FaceWorkersBusy("Face matching workers are unavailable")
+        future.add_done_callback(self._release)
+        try:
+            vector, reason, seconds = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock: self.timed_out += 1
+            raise FaceWorkersBusy("Face matching timed out")
+        except BrokenProcessPool:
+            self.shutdown()
+            raise FaceWorkersBusy("Face matching worker crashed")
+        with self._lock:
+            self.completed += 1
+            self.busy_seconds += seconds
+        if reason: raise PoorQualityError(reason)
+        return vector
+
+    def start(self):
+        """Start the workers and load the matcher in each, so the first scans don't pay for it."""
+        executor = self._get_executor()
+        for future in [executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._since
+            return {
+                "workers": self.workers, "queueLimit": self.queue_limit, "timeoutSeconds": self.timeout,
+                "inFlight": self.in_flight, "queued": max(0, self.in_flight - self.workers),
+                "completed": self.completed, "rejected": self.rejected, "timedOut": self.timed_out,
+                "busySeconds": round(self.busy_seconds, 3),
+                # Share of worker time spent embedding since startup (or the last clear)
+                "utilization": round(self.busy_seconds / (elapsed * self.workers), 4) if elapsed > 0 else 0.0
+            }
+
+    def clear(self):
+        """Reset the counters; in-flight work is still tracked."""
+        with self._lock:
+            self.completed = self.rejected = self.timed_out = 0
+            self.busy_seconds = 0.0
+            self._since = time.monotonic()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor: executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs an event loop and DB connections isn't safe
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+face_workers = FaceWorkerPool(settings.FACE_WORKERS, settings.FACE_WORKER_QUEUE_LIMIT, settings.FACE_WORKER_TIMEOUT_SECONDS)
@@ -0,0 +1,142 @@
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Iterable, Optional, Tuple
+from sqlalchemy import event
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import cache_generation
+from app.models.fail_attempt import FailAttempt
+
+Key = Tuple[str, str, str]  # (subject type, subject id, gate id)
+
+class FailureTracker:
+    """
+    Recent face verification failures per (subject, gate), so strikes are
+    counted and lockouts enforced without querying `fail_attempts`.
+
+    Each key keeps a ring buffer of its last `threshold` failure times: that is
+    all a "threshold failures within the window" rule can look at. Reaching the
+    threshold locks the subject out at that gate for `lockout`. Times are server
+    receive times, not gate timestamps, so a gate's clock can't shift the window.
+    State is per process and rebuilt at startup from `fail_attempts` and the
+    failures still waiting in the write-behind journal. Every commit that adds
+    fail attempts bumps the "fail_attempts" cache generation; at most once per
+    CACHE_CHECK_SECONDS a lookup asks for it and, if it moved, merges the
+    failures other workers recorded, so strikes add up across workers. With
+    write-behind, theirs arrive once the journal is applied.
+    """
+
+    def __init__(self, threshold: int, window_seconds: float, lockout_seconds: float):
+        self.threshold = threshold
+        self.window = timedelta(seconds=window_seconds)
+        self.lockout = timedelta(seconds=lockout_seconds)
+        self.clear()
+
+    def record(self, subject_type: str, subject_id: str, gate_id: str, at: Optional[datetime] = None,
+               violation_id: Optional[str] = None) -> Tuple[int, Optional[datetime]]:
+        """Count a failure; returns (failures within the window, lockout end if this one triggered it)."""
+        at = at or datetime.utcnow()
+        # Remembered so the failure isn't counted again when its row comes back from a check
+        if violation_id: self._seen[violation_id] = at
+        return self._add((subject_type, subject_id, gate_id), at)
+
+    def locked_until(self, session: Session, subject_type: str, subject_id: str, gate_id: str,
+                     now: Optional[datetime] = None) -> Optional[datetime]:
+        if time.monotonic() - self._checked >= settings.CACHE_CHECK_SECONDS: self._check(session)
+        until = self._lockouts.get((subject_type, subject_id, gate_id))
+        if until is None: return None
+        if (now or datetime.utcnow()) < until: return until
+        del self._lockouts[(subject_type, subject_id, gate_id)]
+        return None
+
+    def load(self, session: Session, journaled: Iterable[dict] = (), now: Optional[datetime] = None):
+        """
+        Replay the failures that can still count towards, or hold, a lockout:
+        rows in `fail_attempts` (by the indexed created_at) plus `journaled`
+        fail attempt inserts not applied yet.
+        """
+        self.clear()
+        # Read before the rows, so anything committed meanwhile is merged by the next check
+        self._generation, self._checked = cache_generation.current(session, "fail_attempts"), time.monotonic()
+        failures = self._stored(session, now)
+        for record in journaled:
+            data = record["data"] if record.get("model") == "fail_attempt" and record.get("op") == "insert" else None
+            if data is None: continue
+            subject_id = data.get("student_id") or data.get("staff_id") or data.get("visitor_id")
+            failures.append((datetime.fromisoformat(data["created_at"]), data["subject_type"], subject_id,
+                             data["gate_id"], data.get("violation_id")))
+        self._merge(failures, now)
+
+    def clear(self):
+        self._failures: Dict[Key, Deque[datetime]] = {}
+        self._lockouts: Dict[Key, datetime] = {}
+        self._seen: Dict[str, datetime] = {}  # violation id -> failure time, for failures already counted
+        self._next_sweep = 1024
+        self._generation: Optional[int] = None
+        self._checked = 0.0
+
+    def _check(self, session: Session):
+        """Merge failures committed by other workers since the last check."""
+        self._checked = time.monotonic()
+        generation = cache_generation.current(session, "fail_attempts")
+        if generation == self._generation: return
+        self._generation = generation
+        # Re-read the whole horizon rather than rows past the last id: ids of concurrent
+        # transactions can commit out of order, and already counted failures are skipped
+        since = self._horizon()
+        self._seen = {k: v for k, v in self._seen.items() if v >= since}
+        self._merge(self._stored(session))
+
+    def _stored(self, session: Session, now: Optional[datetime] = None) -> list:
+        """(time, subject type, subject id, gate id, violation id) of rows that can still matter."""
+        rows = session.exec(
+            select(FailAttempt.subject_type, FailAttempt.student_id, FailAttempt.staff_id, FailAttempt.visitor_id,
+                   FailAttempt.gate_id, FailAttempt.created_at, FailAttempt.violation_id, FailAttempt.id)
+            .where(FailAttempt.created_at >= self._horizon(now))
+        ).all()
+        # Attempts without a violation are told apart by row id
+        return [(created_at, subject_type.value, student_id or staff_id or visitor_id, gate_id, violation_id or f"row:{row_id}")
+                for subject_type, student_id, staff_id, visitor_id, gate_id, created_at, violation_id, row_id in rows]
+
+    def _merge(self, failures: list, now: Optional[datetime] = None):
+        since = self._horizon(now)
+        for at, subject_type, subject_id, gate_id, violation_id in sorted(failures, key=lambda f: f[0]):
+            # A journaled entry applied just before a crash, ahead of the checkpoint, is already a row
+            if at < since or not subject_id or violation_id in self._seen: continue
+            if violation_id: self._seen[violation_id] = at
+            self._add((subject_type, subject_id, gate_id), at)
+
+    def _add(self, key: Key, at: datetime) -> Tuple[int, Optional[datetime]]:
+        times = self._failures.get(key)
+        if times is None:
+            if len(self._failures) >= self._next_sweep: self._sweep(at)
+            times = self._failures[key] = deque(maxlen=self.threshold)
+        if times and at < times[-1]:
+            # Another worker's failure merged late: keep the buffer in time order (and the newest)
+            ordered = sorted([*times, at])
+            times.clear()
+            times.extend(ordered)
+        else:
+            times.append(at)
+        latest = times[-1]
+        count = sum(1 for t in times if latest - t < self.window)
+        if count < self.threshold: return count, None
+        until = self._lockouts[key] = latest + self.lockout
+        return count, until
+
+    def _horizon(self, now: Optional[datetime] = None) -> datetime:
+        return (now or datetime.utcnow()) - self.window - self.lockout
+
+    def _sweep(self, now: datetime):
+        """Drop keys whose failures have all left the window, then allow the table to double."""
+        self._failures = {k: v for k, v in self._failures.items() if now - v[-1] < self.window}
+        self._lockouts = {k: v for k, v in self._lockouts.items() if now < v}
+        self._next_sweep = max(1024, 2 * len(self._failures))
+
+failure_tracker = FailureTracker(settings.FACE_FAIL_LOCKOUT_THRESHOLD, settings.FACE_FAIL_WINDOW_SECONDS, settings.FACE_FAIL_LOCKOUT_SECONDS)
+
+@event.listens_for(Session, "after_flush")
+def _announce_failures(session, flush_context):
+    # Other workers merge the new attempts on their next check
+    if any(isinstance(obj, FailAttempt) for obj in session.new): cache_generation.bump(session, "fail_attempts")
@@ -0,0 +1,94 @@
+import hashlib
+import json
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlmodel import Session
+from app.core.config import settings
+from app.schemas.scan import QRScanRequest, FaceVerifyRequest
+from app.services.qr_service import QRService
+from app.services.face_match_service import FaceMatchService
+from app.services.credential_index import CredentialEntry
+from app.services.gate_registry import gate_registry
+from app.services.scan_metrics import scan_latency
+from app.services.idempotency_cache import scan_replays
+from app.utils.images import decode_base64_image
+
+class GateChannel:
+    """
+    One gate's persistent scan connection. Messages are JSON objects with a
+    `requestId`, a `type` ("scan_qr" or "verify_face") and the fields of the
+    matching HTTP request minus `gateId`. Replies echo the `requestId` and use
+    the HTTP response envelope, in the order requests arrived, so a gate may
+    send several requests without waiting.
+
+    The gate is validated when the channel opens and again only after the gate
+    registry has reloaded, i.e. after some gate row changed. A request that
+    fails for any reason gets an error reply; the channel stays open.
+    """
+
+    def __init__(self, gate_id: str):
+        self.gate_id = gate_id
+        self.generation = None
+
+    def validate(self, session: Session):
+        generation = gate_registry.current(session)
+        if generation != self.generation:
+            QRService.validate_gate(session, self.gate_id)
+            self.generation = generation
+
+    async def handle(self, session: Session, text: str) -> str:
+        request_id = None
+        try:
+            message = json.loads(text)
+            if not isinstance(message, dict): raise ValueError("Message must be a JSON object")
+            request_id = message.get("requestId")
+            kind = message.get("type")
+            if kind == "scan_qr":
+                return await self._scan_qr(session, request_id, message)
+            if kind == "verify_face":
+                return await self._verify_face(session, request_id, message)
+            return self._error(request_id, "UNKNOWN_TYPE", f"Unknown message type: {kind}")
+        except ValidationError as e:
+            return self._error(request_id, "VALIDATION_ERROR", "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+        except ValueError as e:
+            return self._error(request_id, "VALIDATION_ERROR", str(e))
+        except HTTPException as e:
+            return self._error(request_id, str(e.status_code), e.detail if isinstance(e.detail, str) else json.dumps(e.detail))
+        except Exception as e:
+            # One bad message must not drop the gate's connection and the requests queued behind it
+            print(f"Gate channel {self.gate_id} request {request_id!r} failed: {e!r}")
+            return self._error(request_id, "INTERNAL_ERROR", "Request failed; retry or fall back to HTTP")
+        finally:
+            # End the message's transaction: an idle gate holds no connection, and a request
+            # that failed mid-transaction leaves nothing behind for the next one
+            session.rollback()
+
+    async def _scan_qr(self, session: Session, request_id, message: dict) -> str:
+        scan = QRScanRequest(gateId=self.gate_id, **{k: v for k, v in message.items() if k in ("qrCode", "scanTimestamp")})
+        key = scan_replays.key("scan_qr", self.gate_id, message.get("idempotencyKey"), scan.qrCode, scan.scanTimestamp)
+        with scan_latency.timed(session, "scan_qr", self.gate_id):
+            self.validate(session)
+            res, _ = await scan_replays.run(
+                key, lambda: QRService.scan_at_gate(session, scan.qrCode, self.gate_id, scan.scanTimestamp)
+            )
+        if isinstance(res, CredentialEntry):
+            # Splice the pre-rendered success body into the reply instead of re-encoding it
+            return '{"requestId":' + json.dumps(request_id) + "," + res.body[1:].decode("utf-8")
+        return json.dumps({"requestId": request_id, "status": "success", "data": res})
+
+    async def _verify_face(self, session: Session, request_id, message: dict) -> str:
+        fields = ("subjectId", "subjectType", "faceImage", "scanTimestamp")
+        verify = FaceVerifyRequest(gateId=self.gate_id, **{k: v for k, v in message.items() if k in fields})
+        face_image, _ = decode_base64_image(verify.faceImage, settings.MAX_IMAGE_UPLOAD_BYTES)
+        key = scan_replays.key("verify_face", self.gate_id, message.get("idempotencyKey"), verify.subjectType,
+                               verify.subjectId, verify.scanTimestamp, hashlib.sha256(face_image).digest())
+        with scan_latency.timed(session, "verify_face", self.gate_id):
+            self.validate(session)
+            res, _ = await scan_replays.run(key, lambda: FaceMatchService.verify(
+                session, verify.subjectId, verify.subjectType, face_image, self.gate_id, verify.scanTimestamp
+            ))
+        return json.dumps({"requestId": request_id, "status": "success", "data": res})
+
+    @staticmethod
+    def _error(request_id, code: str, message: str) -> str:
+        return json.dumps({"requestId": request_id, "status": "error", "code": code, "message": message})
@@ -0,0 +1,81 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models.gate import Gate
+from app.models import cache_generation
+from app.models.enums import GateStatusEnum
+
+@dataclass(frozen=True)
+class GateRecord:
+    id: str
+    name: str
+    location: str
+    status: GateStatusEnum
+
+class GateRegistry:
+    """
+    In-memory copy of the `gates` table. Any committed insert, update or delete
+    of a Gate row (including a status change) drops the copy, and the next
+    lookup reloads it. The same commit bumps the "gates" cache generation, which
+    every worker re-reads at most once per CACHE_CHECK_SECONDS, so a gate taken
+    offline through another worker stops admitting scans here within that time.
+    `generation` counts reloads, so long-lived holders of a GateRecord can tell
+    when to look again.
+    """
+
+    def __init__(self):
+        self._gates: Dict[str, GateRecord] = {}
+        self.loaded = False
+        self.generation = 0
+        self._stored = 0
+        self._checked = 0.0
+
+    def load(self, session: Session):
+        self._stored = cache_generation.current(session, "gates")
+        self._checked = time.monotonic()
+        self._gates = {g.id: GateRecord(g.id, g.name, g.location, g.status) for g in session.exec(select(Gate)).all()}
+        self.loaded = True
+        self.generation += 1
+
+    def current(self, session: Session) -> int:
+        """Generation of the up-to-date copy, reloading first if it was dropped."""
+        self._refresh(session)
+        return self.generation
+
+    def get(self, session: Session, gate_id: str) -> Optional[GateRecord]:
+        self._refresh(session)
+        return self._gates.get(gate_id)
+
+    def all(self, session: Session) -> List[GateRecord]:
+        self._refresh(session)
+        return list(self._gates.values())
+
+    def _refresh(self, session: Session):
+        if not self.loaded:
+            self.load(session)
+        elif time.monotonic() - self._checked >= settings.CACHE_CHECK_SECONDS:
+            self._checked = time.monotonic()
+            if cache_generation.current(session, "gates") != self._stored: self.load(session)
+
+    def invalidate(self):
+        self.loaded = False
+
+gate_registry = GateRegistry()
+
+@event.listens_for(Session, "after_flush")
+def _track_gate_changes(session, flush_context):
+    if any(isinstance(obj, Gate) for obj in (*session.new, *session.dirty, *session.deleted)):
+        cache_generation.bump(session, "gates")
+        session.info["gates_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("gates_changed", False):
+        gate_registry.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("gates_changed", None)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+from app.core.config import settings
+
+class IdempotencyCache:
+    """
+    Bounded, TTL-evicted map of recent scan results, so gate retries replay the
+    first answer instead of recording another violation. A retry that arrives
+    while the original is still running waits for it. Failures (raised
+    exceptions) are not cached.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._pending: dict = {}
+
+    @staticmethod
+    def key(pipeline: str, gate_id: str, header: Optional[str], *fields) -> Hashable:
+        """
+        The request's identifying fields, plus the Idempotency-Key if one was
+        sent: reusing a key for a different request (another QR code, subject
+        or image) starts a new computation instead of replaying someone else's
+        answer.
+        """
+        return (pipeline, gate_id, header, *fields)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, replayed)."""
+        cached = self._results.get(key)
+        if cached is not None:
+            if time.monotonic() < cached[0]:
+                self._results.move_to_end(key)
+                return cached[1], True
+            del self._results[key]
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            result = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            self._results[key] = (time.monotonic() + self.ttl_seconds, result)
+            while len(self._results) > self.max_size: self._results.popitem(last=False)
+            return result, False
+        finally:
+            del self._pending[key]
+
+    def clear(self):
+        self._results.clear()
+        self._pending.clear()
+
+scan_replays = IdempotencyCache(settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_TTL_SECONDS)
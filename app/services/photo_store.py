@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Iterator, List, Optional, Set, Tuple
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.models.visitor import Visitor
+
+HASH_NAME = re.compile(r"[0-9a-f]{64}\.[a-z0-9]+")
+# Names the photo route will look up: hashed or legacy `{studentId}_{timestamp}` photos
+PHOTO_NAME = re.compile(r"[A-Za-z0-9_-]+\.(jpg|jpeg|png|gif)")
+DERIVATIVE_NAME = re.compile(r"[A-Za-z0-9_-]+\.\d+\.jpg")
+SHARD_NAME = re.compile(r"[0-9a-f]{2}")
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif"}
+
+def normalize(image_bytes: bytes, extension: str, max_side: int) -> Tuple[bytes, str]:
+    """
+    Downscale a photo to `max_side` and apply its EXIF rotation, re-encoded as
+    JPEG. Photos that need neither, or don't decode, are kept byte for byte.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            rotated = image.getexif().get(0x0112, 1) != 1
+            if max(image.size) <= max_side and not rotated: return image_bytes, extension
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = BytesIO()
+            image.convert("RGB").save(buffer, "JPEG", quality=90)
+            return buffer.getvalue(), "jpg"
+    except (UnidentifiedImageError, OSError):
+        return image_bytes, extension
+
+class PhotoStore:
+    """
+    Enrolled photos keyed by the SHA-256 of their bytes, in two levels of shard
+    directories (`ab/cd/abcd….jpg`) so no directory grows past a few thousand
+    entries. Identical uploads share one file and a photo's URL never changes.
+
+    A file is written under a temporary name in its shard and renamed into
+    place, so readers see either nothing or the whole photo. Files named the
+    old way (`{studentId}_{timestamp}.jpg`, directly under the root) still
+    resolve. Resized copies are transcoded on first request and kept next to
+    the photo as `<name>.<side>.jpg`. Photos no subject refers to any more are
+    removed by `collect`.
+    """
+
+    def __init__(self, root: str, url_base: str, max_side: int):
+        self.url_base = url_base.rstrip("/")
+        self.max_side = max_side
+        self.open(root)
+
+    def open(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def name(image_bytes: bytes, extension: str) -> str:
+        return f"{hashlib.sha256(image_bytes).hexdigest()}.{extension}"
+
+    def path(self, name: str) -> str:
+        if HASH_NAME.fullmatch(name):
+            return os.path.join(self.root, name[:2], name[2:4], name)
+        return os.path.join(self.root, name)
+
+    def derivative_path(self, name: str, side: int) -> str:
+        return f"{os.path.splitext(self.path(name))[0]}.{side}.jpg"
+
+    def url(self, name: str) -> str:
+        return f"{self.url_base}/{name}"
+
+    def path_for_url(self, photo_url: str) -> str:
+        return self.path(os.path.basename(photo_url))
+
+    def signed_url(self, photo_url: Optional[str], expires: Optional[int] = None) -> Optional[str]:
+        """
+        One of our photo URLs with an expiring signature, for clients that can't
+        send a token (gate screens); other URLs are returned unchanged. Expiry
+        is rounded up to whole PHOTO_URL_TTL_SECONDS periods, so a photo keeps
+        one URL, and stays in browser caches, for a whole period.
+        """
+        if not photo_url or not photo_url.startswith(self.url_base + "/"): return photo_url
+        expires = expires or self.signature_expiry()
+        name = photo_url[len(self.url_base) + 1:]
+        return f"{photo_url}?expires={expires}&signature={self.signature(name, expires)}"
+
+    @staticmethod
+    def signature_expiry(now: Optional[float] = None) -> int:
+        """Expiry of URLs signed now: the end of the next period, so at least one period away."""
+        ttl = settings.PHOTO_URL_TTL_SECONDS
+        return (int(now or time.time()) // ttl + 2) * ttl
+
+    @staticmethod
+    def signature(name: str, expires: int) -> str:
+        key = hashlib.sha256(b"photo-url:" + settings.SECRET_KEY.encode()).digest()
+        return hmac.new(key, f"{name}:{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def verify_signature(self, name: str, expires: Optional[int], signature: Optional[str]) -> bool:
+        if expires is None or not signature or expires <= time.time(): return False
+        return hmac.compare_digest(signature.encode(), self.signature(name, expires).encode())
+
+    def write(self, image_bytes: bytes, extension: str) -> Tuple[str, bytes]:
+        """
+        Normalize and store a photo unless an identical one is already there;
+        returns its URL and the stored bytes, which are what to embed.
+        """
+        image_bytes, extension = normalize(image_bytes, extension, self.max_side)
+        name = self.name(image_bytes, extension)
+        path = self.path(name)
+        if os.path.exists(path):
+            # Reused: restart its grace period so a collection already running can't remove it
+            os.utime(path)
+        else:
+            _write_atomic(path, image_bytes)
+        return self.url(name), image_bytes
+
+    async def save(self, image_bytes: bytes, extension: str) -> Tuple[str, bytes]:
+        """`write` on a worker thread, so decoding, hashing and disk I/O don't block the event loop."""
+        return await asyncio.to_thread(self.write, image_bytes, extension)
+
+    def read(self, photo_url: str) -> Optional[bytes]:
+        """A photo by URL or file name; None if it isn't stored."""
+        return _read(self.path_for_url(photo_url))
+
+    def derivative(self, name: str, side: int) -> Optional[bytes]:
+        """The photo scaled to fit side×side as JPEG, transcoded once and then read from disk."""
+        path = self.derivative_path(name, side)
+        cached = _read(path)
+        if cached is not None: return cached
+        original = self.read(name)
+        if original is None: return None
+        try:
+            with Image.open(BytesIO(original)) as image:
+                image.draft("RGB", (side, side))
+                image = image.convert("RGB")
+                image.thumbnail((side, side), Image.LANCZOS)
+                buffer = BytesIO()
+                image.save(buffer, "JPEG", quality=85)
+        except (UnidentifiedImageError, OSError):
+            return None
+        _write_atomic(path, buffer.getvalue())
+        return buffer.getvalue()
+
+    def collect(self, session: Session, grace_seconds: float, dry_run: bool = False, now: Optional[float] = None,
+                batch_size: int = 500) -> dict:
+        """
+        Remove photos no student, staff member or visitor refers to, with their
+        resized copies and abandoned temporary files, once they are older than
+        the grace period. Shard directories are listed one at a time and the
+        database is asked about a few hundred names per query, so neither the
+        file tree nor the subject tables are ever held in memory.
+        """
+        now = now or time.time()
+        started = time.perf_counter()
+        prefixes = self._url_prefixes(session)
+        stats = {"scanned": 0, "removed": 0, "reclaimedBytes": 0, "dryRun": dry_run}
+        pending: List[os.DirEntry] = []
+        for directory in self._directories():
+            with os.scandir(directory) as it:
+                pending.extend(e for e in it if e.is_file(follow_symlinks=False))
+            if len(pending) >= batch_size:
+                self._sweep(session, prefixes, pending, grace_seconds, dry_run, now, stats)
+                pending = []
+        self._sweep(session, prefixes, pending, grace_seconds, dry_run, now, stats)
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+    def _sweep(self, session: Session, prefixes: Set[str], entries: List[os.DirEntry], grace_seconds: float,
+               dry_run: bool, now: float, stats: dict):
+        stats["scanned"] += len(entries)
+        aged = {e.path: e for e in entries if now - e.stat().st_mtime >= grace_seconds}
+        referenced = self._referenced(session, prefixes, [e.name for e in aged.values() if PHOTO_NAME.fullmatch(e.name)])
+        # Stems (hash or legacy name without extension) whose photo stays; their resized copies stay too
+        live = {e.name.split(".")[0] for e in entries if PHOTO_NAME.fullmatch(e.name) and e.path not in aged} | \
+               {name.split(".")[0] for name in referenced}
+        for path, entry in aged.items():
+            name = entry.name
+            if PHOTO_NAME.fullmatch(name): garbage = name not in referenced
+            elif DERIVATIVE_NAME.fullmatch(name): garbage = name.split(".")[0] not in live
+            else: garbage = name.startswith(".") and name.endswith(".tmp")
+            if not garbage: continue
+            size = entry.stat().st_size
+            if not dry_run:
+                try:
+                    # Re-check the age: an identical upload may have just reused it
+                    if now - os.stat(path).st_mtime < grace_seconds: continue
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+            stats["removed"] += 1
+            stats["reclaimedBytes"] += size
+
+    async def run(self, engine, interval: float, grace_seconds: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stats = await asyncio.to_thread(self._collect_with_session, engine, grace_seconds)
+                print(f"Photo collection removed {stats['removed']} files, reclaimed {stats['reclaimedBytes']} bytes")
+            except Exception as e:
+                print(f"Photo collection failed, will retry: {e}")
+
+    def _collect_with_session(self, engine, grace_seconds: float) -> dict:
+        with Session(engine) as session:
+            return self.collect(session, grace_seconds)
+
+    def _directories(self) -> Iterator[str]:
+        """The root (legacy flat photos) and every shard directory below it."""
+        if not os.path.isdir(self.root): return
+        yield self.root
+        with os.scandir(self.root) as level_one:
+            for first in level_one:
+                if not (SHARD_NAME.fullmatch(first.name) and first.is_dir(follow_symlinks=False)): continue
+                with os.scandir(first.path) as level_two:
+                    for second in level_two:
+                        if SHARD_NAME.fullmatch(second.name) and second.is_dir(follow_symlinks=False):
+                            yield second.path
+
+    @staticmethod
+    def _url_prefixes(session: Session) -> Set[str]:
+        """Distinct URL prefixes in front of stored photo names, e.g. an old CDN base and PHOTO_URL_BASE."""
+        prefixes = set()
+        for model in (Student, StaffMember, Visitor):
+            query = select(model.photo_url).where(model.photo_url != None).execution_options(yield_per=1000)
+            for photo_url in session.exec(query):
+                prefix, _, name = photo_url.rpartition("/")
+                if PHOTO_NAME.fullmatch(name): prefixes.add(prefix)
+        return prefixes
+
+    @staticmethod
+    def _referenced(session: Session, prefixes: Set[str], names: List[str], batch_size: int = 500) -> Set[str]:
+        referenced = set()
+        if not prefixes: return referenced
+        step = max(1, batch_size // len(prefixes))
+        for i in range(0, len(names), step):
+            urls = [f"{prefix}/{name}" if prefix else name for prefix in prefixes for name in names[i:i + step]]
+            for model in (Student, StaffMember, Visitor):
+                for photo_url in session.exec(select(model.photo_url).where(model.photo_url.in_(urls))):
+                    referenced.add(photo_url.rpartition("/")[2])
+        return referenced
+
+class ThumbnailCache:
+    """LRU of served thumbnails bounded by total bytes, so gate screens skip the disk."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > self.max_bytes: return
+        previous = self._entries.pop(key, None)
+        if previous is not None: self.size -= len(previous)
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path): os.unlink(temp_path)
+        raise
+
+photo_store = PhotoStore(settings.PHOTO_STORE_PATH, settings.PHOTO_URL_BASE, settings.PHOTO_MAX_SIDE)
+thumbnails = ThumbnailCache(settings.PHOTO_CACHE_BYTES)
@@ -1,73 +1,189 @@
 import json
 from datetime import datetime
+from typing import Dict, List
 from sqlmodel import Session, select
 from fastapi import HTTPException
+from app.core.config import settings
 from app.models.student import Student
 from app.models.staff import StaffMember
-from app.models.gate import Gate
+from app.models.visitor import Visitor
+from app.models.credential import Credential, current_version
 from app.models.violation import Violation
-from app.models.enums import ViolationTypeEnum
+from app.models.enums import ViolationTypeEnum, GateStatusEnum
+from app.schemas.scan import QRScanRequest
 from app.utils.ids import generate_violation_id
+from app.utils.timing import stage
 from app.services.visitor_qr_service import VisitorQRService
 from app.services.alert_service import alert_service
+from app.services.gate_registry import gate_registry
+from app.services.rejected_scan_cache import rejected_scans, RejectedScan
+from app.services.violation_journal import violation_journal
+from app.services.failure_tracker import failure_tracker
+from app.services.credential_index import (
+    CredentialEntry, credential_index, entry_for_credential, build_entries
+)
+
+UNAVAILABLE_GATE_STATUSES = {GateStatusEnum.MAINTENANCE, GateStatusEnum.OFFLINE}
 
 class QRService:
     @staticmethod
     def validate_gate(session: Session, gate_id: str):
-        gate = session.get(Gate, gate_id)
+        gate = gate_registry.get(session, gate_id)
         if not gate:
             raise HTTPException(status_code=400, detail="Invalid gate ID")
+        if gate.status in UNAVAILABLE_GATE_STATUSES:
+            raise HTTPException(status_code=503, detail=f"Gate is {gate.status.value}")
         return gate
 
     @staticmethod
-    def check_student(session: Session, qr_code: str):
-        statement = select(Student).where(Student.qr_code == qr_code)
-        student = session.exec(statement).first()
-        if student and student.enrollment_status.value == "active":
-            return {
-                "valid": True, "subjectType": "student", "accessGranted": True,
-                "message": "Access granted", "requiresFaceVerification": True,
-                "subject": {
-                    "id": student.id, "name": student.name, "photoUrl": student.photo_url,
-                    "department": student.department.name if student.department else None,
-                    "enrollmentStatus": student.enrollment_status.value
-                }
-            }
-        return None
+    def resolve(session: Session, qr_code: str):
+        if settings.CREDENTIAL_INDEX_ENABLED:
+            return credential_index.lookup(session, qr_code)
+        credential = session.get(Credential, qr_code)
+        return entry_for_credential(session, credential) if credential and not credential.revoked else None
+
+    @staticmethod
+    def credential_version(session: Session) -> int:
+        """The credential version scans are resolved against; for the index, checks other workers' changes when due."""
+        if settings.CREDENTIAL_INDEX_ENABLED:
+            return credential_index.seen_version(session)
+        return current_version(session)
+
+    @staticmethod
+    async def scan(session: Session, qr_code: str, gate_id: str, scan_timestamp: datetime):
+        with stage("gate"):
+            QRService.validate_gate(session, gate_id)
+        return await QRService.scan_at_gate(session, qr_code, gate_id, scan_timestamp)
+
+    @staticmethod
+    async def scan_at_gate(session: Session, qr_code: str, gate_id: str, scan_timestamp: datetime):
+        """`scan` for a gate the caller has already validated."""
+        with stage("lookup"):
+            # Taken first: a code rejected below stays rejected only until a newer credential shows up
+            version = QRService.credential_version(session)
+            entry = None if rejected_scans.is_rejected(qr_code, version) else QRService.resolve(session, qr_code)
+        locked = entry and QRService.locked_out(session, entry, gate_id)
+        if locked:
+            return locked
+        if entry and entry.subject_type == "visitor":
+            return await VisitorQRService.check_visitor(session, entry, gate_id, scan_timestamp)
+        if entry and entry.status == "active":
+            return entry
+        return await QRService.handle_unauthorized_qr(session, qr_code, gate_id, scan_timestamp, version)
+
+    @staticmethod
+    async def scan_batch(session: Session, scans: List[QRScanRequest]):
+        """Resolve a buffered batch with set-based lookups, one commit and one alert broadcast."""
+        gate_errors = {}
+        for gate_id in {s.gateId for s in scans}:
+            try:
+                QRService.validate_gate(session, gate_id)
+                gate_errors[gate_id] = None
+            except HTTPException as e:
+                gate_errors[gate_id] = e.detail
+        version = QRService.credential_version(session)
+        entries = QRService._resolve_many(session, {s.qrCode for s in scans if not gate_errors[s.gateId]})
+        
+        results, violations, alerts, repeats = [], [], [], []
+        for scan in scans:
+            if gate_errors[scan.gateId]:
+                results.append({"valid": False, "accessGranted": False, "message": gate_errors[scan.gateId]})
+                continue
+            entry = entries.get(scan.qrCode)
+            locked = entry and QRService.locked_out(session, entry, scan.gateId)
+            if locked:
+                results.append(locked)
+                continue
+            if entry and entry.subject_type == "visitor":
+                if datetime.utcnow() > entry.valid_until:
+                    built = VisitorQRService.expired_violation(entry, scan.gateId, scan.scanTimestamp)
+                else:
+                    res = VisitorQRService.check_unexpired(entry, scan.gateId)
+                    results.append(res.payload if isinstance(res, CredentialEntry) else res)
+                    continue
+            elif entry and entry.status == "active":
+                results.append(entry.payload)
+                continue
+            else:
+                repeat = rejected_scans.repeat(scan.qrCode, scan.gateId)
+                if repeat:
+                    repeats.append((repeat, scan.scanTimestamp))
+                    results.append({**repeat.response, "occurrenceCount": repeat.count})
+                    continue
+                built = QRService.unauthorized_violation(scan.qrCode, scan.gateId, scan.scanTimestamp)
+                rejected_scans.remember(scan.qrCode, scan.gateId, built[0].id, built[2], json.loads(built[0].details), version)
+            violation, alert, res = built
+            violations.append(violation)
+            alerts.append(alert)
+            results.append(res)
+        
+        if violations or repeats:
+            updates = [QRService._record_repeat(repeat, scan_timestamp) for repeat, scan_timestamp in repeats]
+            try:
+                await violation_journal.save(session, violations, updates)
+            except Exception:
+                rejected_scans.forget(s.qrCode for s in scans)
+                raise
+        if alerts:
+            await alert_service.broadcast_violations(alerts)
+        return results
+
+    @staticmethod
+    def locked_out(session: Session, entry: CredentialEntry, gate_id: str):
+        """Rejection for a subject locked out at this gate after failed face verifications, else None."""
+        until = failure_tracker.locked_until(session, entry.subject_type, entry.subject_id, gate_id)
+        if until is None: return None
+        return {"valid": True, "subjectType": entry.subject_type, "accessGranted": False, "lockedOut": True,
+                "message": "Access blocked: too many failed face verifications", "lockoutUntil": until.isoformat() + "Z",
+                "subject": entry.payload["subject"]}
 
     @staticmethod
-    def check_staff(session: Session, qr_code: str):
-        statement = select(StaffMember).where(StaffMember.qr_code == qr_code)
-        staff = session.exec(statement).first()
-        if staff and staff.employment_status.value == "active":
-            return {
-                "valid": True, "subjectType": "staff", "accessGranted": True,
-                "message": "Access granted", "requiresFaceVerification": True,
-                "subject": {
-                    "id": staff.id, "name": staff.name, "photoUrl": staff.photo_url,
-                    "department": staff.department.name if staff.department else None,
-                    "position": staff.position, "employmentStatus": staff.employment_status.value
-                }
-            }
-        return None
+    def _resolve_many(session: Session, codes: set) -> Dict[str, CredentialEntry]:
+        if not codes: return {}
+        students = session.exec(select(Student).where(Student.qr_code.in_(codes))).all()
+        staff_members = session.exec(select(StaffMember).where(StaffMember.qr_code.in_(codes))).all()
+        visitors = session.exec(select(Visitor).where(Visitor.qr_code.in_(codes))).all()
+        return dict(build_entries(session, students, staff_members, visitors))
 
     @staticmethod
-    async def handle_unauthorized_qr(session: Session, qr_code: str, gate_id: str, scan_timestamp: datetime):
+    async def handle_unauthorized_qr(session: Session, qr_code: str, gate_id: str, scan_timestamp: datetime, version: int):
+        repeat = rejected_scans.repeat(qr_code, gate_id)
+        if repeat:
+            with stage("commit"):
+                await violation_journal.save(session, [], [QRService._record_repeat(repeat, scan_timestamp)])
+            return {**repeat.response, "occurrenceCount": repeat.count}
+        
+        violation, alert, res = QRService.unauthorized_violation(qr_code, gate_id, scan_timestamp)
+        with stage("commit"):
+            await violation_journal.save(session, [violation])
+        rejected_scans.remember(qr_code, gate_id, violation.id, res, json.loads(violation.details), version)
+        
+        with stage("broadcast"):
+            await alert_service.broadcast_violation(alert)
+        
+        return res
+
+    @staticmethod
+    def _record_repeat(repeat: RejectedScan, scan_timestamp: datetime):
+        """Fold a rescan into the existing violation instead of adding a row and an alert."""
+        repeat.details["occurrenceCount"] = repeat.count
+        repeat.details["lastOccurredAt"] = scan_timestamp.isoformat()
+        return Violation, repeat.violation_id, {"details": json.dumps(repeat.details)}
+
+    @staticmethod
+    def unauthorized_violation(qr_code: str, gate_id: str, scan_timestamp: datetime):
         violation_id = generate_violation_id()
         violation = Violation(
             id=violation_id, type=ViolationTypeEnum.UNAUTHORIZED_QR_SCAN,
             gate_id=gate_id, occurred_at=scan_timestamp, scanned_qr_code=qr_code,
             details=json.dumps({"scannedQrCode": qr_code, "reason": "Invalid or tampered QR code"})
         )
-        session.add(violation)
-        session.commit()
-        
-        await alert_service.broadcast_violation({
+        alert = {
             "id": violation_id,
             "type": "unauthorized_qr_scan",
             "gateId": gate_id,
             "scannedQrCode": qr_code
-        })
-        
-        return {"valid": False, "accessGranted": False, "violationType": "unauthorized_qr_scan",
-                "message": "Invalid or tampered QR code", "violationId": violation_id, "subjectPersisted": False}
+        }
+        res = {"valid": False, "accessGranted": False, "violationType": "unauthorized_qr_scan",
+               "message": "Invalid or tampered QR code", "violationId": violation_id, "subjectPersisted": False}
+        return violation, alert, res
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Iterable, Tuple
+from sqlalchemy import event
+from sqlmodel import Session
+from app.core.config import settings
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.models.visitor import Visitor
+from app.models.credential import Credential
+
+@dataclass
+class RejectedScan:
+    violation_id: str
+    response: dict
+    details: dict
+    first_seen: float
+    count: int = 1
+
+class RejectedScanCache:
+    """
+    Bounded LRU of recently rejected QR codes.
+
+    A code rejected within the window skips credential resolution entirely, and
+    repeats of the same (code, gate) are folded into the violation recorded for
+    the first one. Codes are dropped as soon as a commit attaches them to a
+    subject. Each code also keeps the credential version it was rejected at;
+    once the caller's version moves past it (e.g. the credential index saw
+    another worker issue credentials), the code is resolved again.
+    """
+
+    def __init__(self, max_size: int, window_seconds: float):
+        self.max_size = max_size
+        self.window_seconds = window_seconds
+        self._codes: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()  # code -> (rejected at, credential version)
+        self._scans: "OrderedDict[tuple, RejectedScan]" = OrderedDict()
+
+    def is_rejected(self, qr_code: str, version: int) -> bool:
+        """Whether `qr_code` was rejected within the window, with no credential issued since (as of `version`)."""
+        seen = self._codes.get(qr_code)
+        if seen is None: return False
+        if time.monotonic() - seen[0] > self.window_seconds or version > seen[1]:
+            del self._codes[qr_code]
+            return False
+        self._codes.move_to_end(qr_code)
+        return True
+
+    def repeat(self, qr_code: str, gate_id: str) -> Optional[RejectedScan]:
+        """Count another occurrence of a recently rejected (code, gate), if still in the window."""
+        key = (qr_code, gate_id)
+        scan = self._scans.get(key)
+        if scan is None: return None
+        if time.monotonic() - scan.first_seen > self.window_seconds:
+            del self._scans[key]
+            return None
+        scan.count += 1
+        self._scans.move_to_end(key)
+        return scan
+
+    def remember(self, qr_code: str, gate_id: str, violation_id: str, response: dict, details: dict,
+                 version: int) -> RejectedScan:
+        """Record a rejection; `version` is the credential version the code was resolved against."""
+        now = time.monotonic()
+        scan = RejectedScan(violation_id, response, details, now)
+        self._scans[(qr_code, gate_id)] = scan
+        self._scans.move_to_end((qr_code, gate_id))
+        self._codes[qr_code] = (now, version)
+        self._codes.move_to_end(qr_code)
+        while len(self._scans) > self.max_size: self._scans.popitem(last=False)
+        while len(self._codes) > self.max_size: self._codes.popitem(last=False)
+        return scan
+
+    def forget(self, qr_codes: Iterable[str]):
+        codes = set(qr_codes)
+        for code in codes: self._codes.pop(code, None)
+        for key in [k for k in self._scans if k[0] in codes]:
+            del self._scans[key]
+
+    def clear(self):
+        self._codes.clear()
+        self._scans.clear()
+
+rejected_scans = RejectedScanCache(settings.REJECTED_SCAN_CACHE_SIZE, settings.UNAUTHORIZED_SCAN_COALESCE_SECONDS)
+
+@event.listens_for(Session, "after_flush")
+def _track_new_codes(session, flush_context):
+    codes = [obj.qr_code for obj in (*session.new, *session.dirty)
+             if isinstance(obj, (Student, StaffMember, Visitor, Credential))]
+    if codes: session.info.setdefault("issued_qr_codes", set()).update(codes)
+
+@event.listens_for(Session, "after_commit")
+def _forget_on_commit(session):
+    codes = session.info.pop("issued_qr_codes", None)
+    if codes: rejected_scans.forget(codes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("issued_qr_codes", None)
@@ -0,0 +1,86 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session
+from app.utils.timing import StageTimer, timed_request
+from app.services.gate_registry import gate_registry
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms: self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (max for the overflow bucket)."""
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count, "meanMs": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            "p50Ms": self.quantile(0.5), "p95Ms": self.quantile(0.95), "p99Ms": self.quantile(0.99),
+            "maxMs": round(self.max_ms, 3),
+            "buckets": [{"leMs": bound, "count": n} for bound, n in zip((*BUCKET_BOUNDS_MS, None), self.counts)]
+        }
+
+class ScanLatencyMetrics:
+    """
+    Fixed-bucket latency histograms per (pipeline, gate, stage), fed by the scan
+    routes. Recording is a bisect plus a few increments, so it stays on in production.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str, str], _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, pipeline: str, gate_id: str, timer: StageTimer):
+        with self._lock:
+            for name, seconds in (*timer.stages, ("total", timer.total)):
+                key = (pipeline, gate_id, name)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram()
+                histogram.observe(seconds * 1000)
+
+    @contextmanager
+    def timed(self, session: Session, pipeline: str, gate_id: str):
+        """Time one request's stages and record them, also when the request fails."""
+        try:
+            with timed_request() as timer:
+                yield timer
+        finally:
+            # Unknown gate ids come from clients; don't let them grow the table
+            known = gate_registry.get(session, gate_id) is not None
+            self.record(pipeline, gate_id if known else "unknown", timer)
+
+    def snapshot(self, gate_id: Optional[str] = None, pipeline: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            return [
+                {"pipeline": p, "gateId": g, "stage": s, **h.summary()}
+                for (p, g, s), h in sorted(self._histograms.items())
+                if (gate_id is None or g == gate_id) and (pipeline is None or p == pipeline)
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+scan_latency = ScanLatencyMetrics()
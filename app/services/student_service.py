@@ -1,22 +1,21 @@
-import os
-import base64
+import asyncio
 import secrets
 from datetime import datetime
 from typing import Optional
 from sqlmodel import Session, select
 from fastapi import HTTPException
+from app.core.config import settings
 from app.models.student import Student
 from app.models.department import Department
+from app.models.credential import Credential
 from app.models.enums import EnrollmentStatusEnum
+from app.services.credential_index import credential_index
+from app.services.embedding_store import embedding_store
+from app.services.photo_store import photo_store
+from app.utils.images import decode_base64_image
+from app.utils.pagination import paginate
 
 class StudentService:
-    PHOTO_DIR = "student_photos"
-    
-    @staticmethod
-    def _ensure_photo_directory():
-        if not os.path.exists(StudentService.PHOTO_DIR):
-            os.makedirs(StudentService.PHOTO_DIR)
-    
     @staticmethod
     def _generate_student_id() -> str:
         return f"stu_{secrets.token_hex(4)}"
@@ -28,32 +27,10 @@ class StudentService:
     
     @staticmethod
     def _decode_base64_image(base64_string: str) -> tuple:
-        try:
-            if base64_string.startswith('data:'):
-                header, encoded = base64_string.split(',', 1)
-                image_type = header.split(';')[0].split('/')[1]
-                extension = image_type if image_type in ['jpg', 'jpeg', 'png', 'gif'] else 'jpg'
-            else:
-                encoded = base64_string
-                extension = 'jpg'
-            image_bytes = base64.b64decode(encoded)
-            return image_bytes, extension
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 image format: {str(e)}")
+        return decode_base64_image(base64_string, settings.MAX_IMAGE_UPLOAD_BYTES)
     
     @staticmethod
-    def _save_image_file(image_bytes: bytes, student_id: str, extension: str) -> str:
-        StudentService._ensure_photo_directory()
-        timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        filename = f"{student_id}_{timestamp}.{extension}"
-        filepath = os.path.join(StudentService.PHOTO_DIR, filename)
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
-        photo_url = f"https://cdn.campus-security.example.com/photos/{filename}"
-        return photo_url
-    
-    @staticmethod
-    def create_student(session: Session, data: dict) -> dict:
+    async def create_student(session: Session, data: dict) -> dict:
         existing = session.exec(select(Student).where(Student.email == data.get('email'))).first()
         if existing:
             raise HTTPException(status_code=400, detail={"status": "error", "code": "EMAIL_EXISTS", "message": "A student with this email already exists"})
@@ -67,14 +44,14 @@ class StudentService:
         student_id = StudentService._generate_student_id()
         qr_code = data.get('qrCode') or StudentService._generate_qr_code(student_id)
         
-        existing_qr = session.exec(select(Student).where(Student.qr_code == qr_code)).first()
-        if existing_qr:
+        existing_qr = session.get(Credential, qr_code)
+        if existing_qr and not existing_qr.revoked:
             raise HTTPException(status_code=400, detail={"status": "error", "code": "QR_CODE_EXISTS", "message": "This QR code is already in use"})
         
         photo_url = None
         if data.get('photo'):
             image_bytes, extension = StudentService._decode_base64_image(data['photo'])
-            photo_url = StudentService._save_image_file(image_bytes, student_id, extension)
+            photo_url, image_bytes = await photo_store.save(image_bytes, extension)
         
         student = Student(
             id=student_id,
@@ -89,34 +66,26 @@ class StudentService:
         session.add(student)
         session.commit()
         session.refresh(student)
+        credential_index.put_student(student, department.name if department else None)
+        if photo_url:
+            await asyncio.to_thread(embedding_store.put_image, "student", student.id, image_bytes)
         
         return StudentService._format_student_response(student, department)
     
     @staticmethod
-    def get_students(session: Session, page: int = 1, limit: int = 20) -> dict:
-        offset = (page - 1) * limit
-        total_query = select(Student)
-        total_count = len(session.exec(total_query).all())
-        query = select(Student).offset(offset).limit(limit)
-        students = session.exec(query).all()
-        
-        students_data = []
-        for student in students:
-            department = None
-            if student.department_id:
-                department = session.exec(select(Department).where(Department.id == student.department_id)).first()
-            students_data.append(StudentService._format_student_response(student, department))
+    def get_students(session: Session, page: int = 1, limit: int = 20,
+                     cursor: Optional[str] = None, include_total: Optional[bool] = None) -> dict:
+        # Oldest first, as enrolled
+        students, pagination = paginate(session, select(Student), Student.created_at, Student.id, limit, page, cursor,
+                                        include_total, descending=False)
+        department_ids = {s.department_id for s in students if s.department_id}
+        departments = {}
+        if department_ids:
+            departments = {d.id: d for d in session.exec(select(Department).where(Department.id.in_(department_ids)))}
         
         return {
-            "students": students_data,
-            "pagination": {
-                "currentPage": page,
-                "totalPages": (total_count + limit - 1) // limit,
-                "totalItems": total_count,
-                "itemsPerPage": limit,
-                "hasNextPage": offset + limit < total_count,
-                "hasPreviousPage": page > 1
-            }
+            "students": [StudentService._format_student_response(s, departments.get(s.department_id)) for s in students],
+            "pagination": pagination.model_dump()
         }
     
     @staticmethod
@@ -154,8 +123,8 @@ class StudentService:
             student.department_id = data['departmentId']
         
         if data.get('qrCode'):
-            existing_qr = session.exec(select(Student).where(Student.qr_code == data['qrCode'], Student.id != student_id)).first()
-            if existing_qr:
+            existing_qr = session.get(Credential, data['qrCode'])
+            if existing_qr and not existing_qr.revoked and existing_qr.subject_id != student_id:
                 raise HTTPException(status_code=400, detail={"status": "error", "code": "QR_CODE_EXISTS", "message": "This QR code is already in use"})
             student.qr_code = data['qrCode']
         
@@ -173,23 +142,24 @@ class StudentService:
         department = None
         if student.department_id:
             department = session.exec(select(Department).where(Department.id == student.department_id)).first()
+        credential_index.put_student(student, department.name if department else None)
         
         return StudentService._format_student_response(student, department)
     
     @staticmethod
-    def enroll_photo(session: Session, student_id: str, photo_base64: str) -> dict:
+    async def enroll_photo(session: Session, student_id: str, image_bytes: bytes, extension: str) -> dict:
         student = session.exec(select(Student).where(Student.id == student_id)).first()
         if not student:
             raise HTTPException(status_code=404, detail={"status": "error", "code": "STUDENT_NOT_FOUND", "message": f"Student with ID '{student_id}' not found"})
         
-        image_bytes, extension = StudentService._decode_base64_image(photo_base64)
-        photo_url = StudentService._save_image_file(image_bytes, student_id, extension)
-        
-        student.photo_url = photo_url
+        # Embed the stored photo, upright and downscaled, not the upload: the matcher ignores EXIF
+        student.photo_url, image_bytes = await photo_store.save(image_bytes, extension)
         student.updated_at = datetime.utcnow()
         session.add(student)
         session.commit()
         session.refresh(student)
+        credential_index.put_student(student, student.department.name if student.department else None)
+        await asyncio.to_thread(embedding_store.put_image, "student", student.id, image_bytes)
         
         return {
             "studentId": student.id,
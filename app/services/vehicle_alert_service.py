@@ -1,25 +1,18 @@
-import math
 from datetime import datetime
-from sqlmodel import Session, select, func
+from typing import Optional
+from sqlmodel import Session, select
 from app.models.vehicle_alert import VehicleAlert
 from app.models.security_staff import SecurityStaff
-from app.schemas.common import PaginationInfo
+from app.utils.pagination import paginate
 
 class VehicleAlertService:
     @staticmethod
-    def list_alerts(session: Session, page: int, limit: int, alert_type: str = None, resolved: bool = None):
-        query = select(VehicleAlert).order_by(VehicleAlert.timestamp.desc())
+    def list_alerts(session: Session, page: int, limit: int, alert_type: str = None, resolved: bool = None,
+                    cursor: Optional[str] = None, include_total: Optional[bool] = None):
+        query = select(VehicleAlert)
         if alert_type: query = query.where(VehicleAlert.alert_type == alert_type)
         if resolved is not None: query = query.where(VehicleAlert.resolved == resolved)
-        
-        total = session.exec(select(func.count()).select_from(query.subquery())).one()
-        alerts = session.exec(query.offset((page - 1) * limit).limit(limit)).all()
-        
-        pagination = PaginationInfo(
-            currentPage=page, totalPages=math.ceil(total / limit), totalItems=total,
-            itemsPerPage=limit, hasNextPage=page * limit < total, hasPreviousPage=page > 1
-        )
-        return alerts, pagination
+        return paginate(session, query, VehicleAlert.timestamp, VehicleAlert.id, limit, page, cursor, include_total)
 
     @staticmethod
     def resolve(session: Session, alert_id: int, notes: str, user: SecurityStaff):
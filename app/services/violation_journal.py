@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Sequence, Tuple
+from sqlalchemy import update
+from sqlmodel import Session, SQLModel, select
+from app.core.config import settings
+from app.models.violation import Violation
+from app.models.fail_attempt import FailAttempt
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker only
+    fcntl = None
+
+JOURNALED_MODELS = {"violation": Violation, "fail_attempt": FailAttempt}
+MODEL_KEYS = {model: key for key, model in JOURNALED_MODELS.items()}
+
+class ViolationJournal:
+    """
+    Optional write-behind path for violations and fail attempts.
+
+    With VIOLATION_WRITE_BEHIND on, `save` appends the rows to a local JSON-lines
+    journal and returns; a background task batch-inserts them into the DB and
+    advances a checkpoint file holding the applied byte offset. Entries past the
+    checkpoint are replayed at startup. Replays are idempotent: violations are
+    skipped if their id exists, fail attempts if one already points at the same
+    violation. Without write-behind, `save` is a plain add and commit.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+
+    @property
+    def checkpoint_path(self) -> str:
+        return self.path + ".applied"
+
+    async def save(self, session: Session, rows: Sequence[SQLModel], updates: Sequence[Tuple[type, str, dict]] = ()):
+        """Persist new rows plus (model, id, values) updates, either now or via the journal."""
+        if not settings.VIOLATION_WRITE_BEHIND:
+            session.add_all(rows)
+            for model, row_id, values in updates:
+                session.exec(update(model).where(model.id == row_id).values(**values))
+            session.commit()
+            return
+        records = [{"model": MODEL_KEYS[type(r)], "op": "insert", "data": r.model_dump(mode="json")} for r in rows]
+        records += [{"model": MODEL_KEYS[m], "op": "update", "id": row_id, "values": values} for m, row_id, values in updates]
+        # The write and fsync happen on a worker thread, off the event loop
+        await asyncio.to_thread(self.append, records)
+
+    def append(self, records: List[dict]):
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode("utf-8")
+        with self._lock, self._locked(".lock"):
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync: os.fsync(self._file.fileno())
+
+    def apply_pending(self, engine) -> int:
+        """Insert every complete journal entry past the checkpoint; returns the number applied."""
+        with self._apply_lock, self._locked(".apply.lock"):
+            return self._apply_pending(engine)
+
+    def pending(self) -> List[dict]:
+        """Complete journal entries past the checkpoint, i.e. not yet in the database."""
+        return self._read_pending()[2]
+
+    def _read_pending(self) -> Tuple[int, int, List[dict]]:
+        """(checkpoint offset, length of the complete entries after it, those entries)."""
+        if not os.path.exists(self.path): return 0, 0, []
+        offset = self._read_checkpoint()
+        if offset > os.path.getsize(self.path): offset = 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1  # ignore a trailing partial line from an interrupted append
+        return offset, end, [json.loads(line) for line in chunk[:end].splitlines() if line.strip()]
+
+    def _apply_pending(self, engine) -> int:
+        offset, end, records = self._read_pending()
+        if end == 0: return 0
+
+        with Session(engine) as session:
+            self._apply(session, records)
+            session.commit()
+        self._advance(offset + end)
+        return len(records)
+
+    def _apply(self, session: Session, records: List[dict]):
+        inserts = [r for r in records if r["op"] == "insert"]
+        violation_ids = [r["data"]["id"] for r in inserts if r["model"] == "violation"]
+        attempt_violation_ids = [r["data"]["violation_id"] for r in inserts if r["model"] == "fail_attempt"]
+        existing = set(session.exec(select(Violation.id).where(Violation.id.in_(violation_ids))).all()) if violation_ids else set()
+        existing_attempts = set(session.exec(
+            select(FailAttempt.violation_id).where(FailAttempt.violation_id.in_(attempt_violation_ids))
+        ).all()) if attempt_violation_ids else set()
+
+        for r in inserts:
+            data = r["data"]
+            if r["model"] == "violation" and data["id"] in existing: continue
+            if r["model"] == "fail_attempt" and data["violation_id"] in existing_attempts: continue
+            data = {k: v for k, v in data.items() if not (k == "id" and v is None)}
+            session.add(JOURNALED_MODELS[r["model"]].model_validate(data))
+        session.flush()
+        for r in records:
+            if r["op"] == "update":
+                model = JOURNALED_MODELS[r["model"]]
+                session.exec(update(model).where(model.id == r["id"]).values(**r["values"]))
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self.checkpoint_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _advance(self, offset: int):
+        with self._lock, self._locked(".lock"):
+            # Fully applied: start over instead of growing the journal forever. The
+            # checkpoint is reset first, so a crash in between only causes a replay.
+            fully_applied = os.path.getsize(self.path) == offset
+            self._write_checkpoint(0 if fully_applied else offset)
+            if fully_applied:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                open(self.path, "wb").close()
+
+    def _write_checkpoint(self, offset: int):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    @contextmanager
+    def _locked(self, suffix: str):
+        with open(self.path + suffix, "a") as lock:
+            if fcntl: fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl: fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def run(self, engine, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.apply_pending, engine)
+            except Exception as e:
+                print(f"Violation journal apply failed, will retry: {e}")
+
+violation_journal = ViolationJournal(settings.VIOLATION_JOURNAL_PATH, settings.VIOLATION_JOURNAL_FSYNC)
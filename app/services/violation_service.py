@@ -1,35 +1,35 @@
 import json
-import math
 from datetime import datetime
-from typing import Optional, List
-from sqlmodel import Session, select, func
+from typing import Dict, Optional, List
+from sqlmodel import Session, select
 from app.models.violation import Violation
-from app.models.gate import Gate
 from app.models.student import Student
 from app.models.staff import StaffMember
 from app.models.visitor import Visitor
 from app.models.security_staff import SecurityStaff
 from app.models.enums import ViolationTypeEnum, SubjectTypeEnum
-from app.schemas.violation import ViolationItem, ViolationSubject, ViolationResolvedBy, PaginationInfo
+from app.schemas.violation import ViolationItem, ViolationSubject, ViolationResolvedBy
+from app.services.gate_registry import gate_registry
+from app.utils.pagination import paginate
+
+# (subject type, model, Violation column holding its id)
+SUBJECT_MODELS = (
+    (SubjectTypeEnum.STUDENT, Student, "student_id"),
+    (SubjectTypeEnum.STAFF, StaffMember, "staff_id"),
+    (SubjectTypeEnum.VISITOR, Visitor, "visitor_id"),
+)
 
 class ViolationService:
     @staticmethod
-    def list_violations(session: Session, page: int, limit: int, filters: dict):
+    def list_violations(session: Session, page: int, limit: int, filters: dict,
+                        cursor: Optional[str] = None, include_total: Optional[bool] = None):
         query = ViolationService._build_query(filters)
-        total_items = session.exec(select(func.count()).select_from(query.subquery())).one()
-        total_pages = math.ceil(total_items / limit)
-        violations = session.exec(query.offset((page - 1) * limit).limit(limit)).all()
-        
-        items = [ViolationService._build_item(session, v) for v in violations]
-        pagination = PaginationInfo(
-            currentPage=page, totalPages=total_pages, totalItems=total_items,
-            itemsPerPage=limit, hasNextPage=page < total_pages, hasPreviousPage=page > 1
-        )
-        return items, pagination
+        violations, pagination = paginate(session, query, Violation.occurred_at, Violation.id, limit, page, cursor, include_total)
+        return ViolationService._build_items(session, violations), pagination
 
     @staticmethod
     def _build_query(filters: dict):
-        query = select(Violation).order_by(Violation.occurred_at.desc())
+        query = select(Violation)
         if filters.get("type"): query = query.where(Violation.type == ViolationTypeEnum(filters["type"]))
         if filters.get("subjectType"): query = query.where(Violation.subject_type == SubjectTypeEnum(filters["subjectType"]))
         if filters.get("gateId"): query = query.where(Violation.gate_id == filters["gateId"])
@@ -39,13 +39,32 @@ class ViolationService:
         return query
 
     @staticmethod
-    def _build_item(session: Session, v: Violation):
-        gate = session.get(Gate, v.gate_id)
-        subject = ViolationService._get_subject(session, v)
+    def _build_items(session: Session, violations: List[Violation]) -> List[ViolationItem]:
+        """Items for a page of violations: one IN query per subject type and for resolvers, gates from the registry."""
+        subjects = ViolationService._prefetch_subjects(session, violations)
+        resolver_ids = {v.resolved_by_staff_id for v in violations if v.resolved_by_staff_id}
+        resolvers = {}
+        if resolver_ids:
+            resolvers = dict(session.exec(select(SecurityStaff.id, SecurityStaff.name).where(SecurityStaff.id.in_(resolver_ids))).all())
+        return [ViolationService._build_item(session, v, subjects, resolvers) for v in violations]
+
+    @staticmethod
+    def _prefetch_subjects(session: Session, violations: List[Violation]) -> Dict[tuple, ViolationSubject]:
+        subjects = {}
+        for subject_type, model, column in SUBJECT_MODELS:
+            ids = {getattr(v, column) for v in violations if v.subject_type == subject_type and getattr(v, column)}
+            if not ids: continue
+            for sub_id, name, photo_url in session.exec(select(model.id, model.name, model.photo_url).where(model.id.in_(ids))):
+                subjects[(subject_type, sub_id)] = ViolationSubject(id=sub_id, name=name, photoUrl=photo_url)
+        return subjects
+
+    @staticmethod
+    def _build_item(session: Session, v: Violation, subjects: Dict[tuple, ViolationSubject], resolvers: Dict[str, str]):
+        gate = gate_registry.get(session, v.gate_id)
+        subject = ViolationService._get_subject(v, subjects)
         resolved_by = None
-        if v.resolved_by_staff_id:
-            staff = session.get(SecurityStaff, v.resolved_by_staff_id)
-            if staff: resolved_by = ViolationResolvedBy(id=staff.id, name=staff.name)
+        if v.resolved_by_staff_id in resolvers:
+            resolved_by = ViolationResolvedBy(id=v.resolved_by_staff_id, name=resolvers[v.resolved_by_staff_id])
         
         details = json.loads(v.details) if v.details else {}
         if v.scanned_qr_code: details["scannedQrCode"] = v.scanned_qr_code
@@ -59,13 +78,11 @@ class ViolationService:
         )
 
     @staticmethod
-    def _get_subject(session: Session, v: Violation):
+    def _get_subject(v: Violation, subjects: Dict[tuple, ViolationSubject]):
         if not v.subject_type: return None
-        sub = None
-        if v.subject_type == SubjectTypeEnum.STUDENT and v.student_id: sub = session.get(Student, v.student_id)
-        elif v.subject_type == SubjectTypeEnum.STAFF and v.staff_id: sub = session.get(StaffMember, v.staff_id)
-        elif v.subject_type == SubjectTypeEnum.VISITOR and v.visitor_id: sub = session.get(Visitor, v.visitor_id)
-        return ViolationSubject(id=sub.id, name=sub.name, photoUrl=sub.photo_url) if sub else None
+        for subject_type, _, column in SUBJECT_MODELS:
+            if v.subject_type == subject_type: return subjects.get((subject_type, getattr(v, column)))
+        return None
 
     @staticmethod
     def resolve(session: Session, violation_id: str, notes: str, user: SecurityStaff):
@@ -1,71 +1,68 @@
 import json
 from datetime import datetime
-from sqlmodel import Session, select
-from app.models.visitor import Visitor
+from sqlmodel import Session
 from app.models.violation import Violation
 from app.models.enums import ViolationTypeEnum, SubjectTypeEnum
 from app.utils.ids import generate_violation_id
+from app.utils.timing import stage
 from app.services.alert_service import alert_service
+from app.services.credential_index import CredentialEntry
+from app.services.violation_journal import violation_journal
 
 class VisitorQRService:
     @staticmethod
-    async def check_visitor(session: Session, qr_code: str, gate_id: str, scan_timestamp: datetime):
-        statement = select(Visitor).where(Visitor.qr_code == qr_code)
-        visitor = session.exec(statement).first()
-        if not visitor: return None
-        
-        current_time = datetime.utcnow()
-        if current_time > visitor.valid_until:
-            return await VisitorQRService._handle_expired_visitor(session, visitor, gate_id, scan_timestamp)
+    async def check_visitor(session: Session, entry: CredentialEntry, gate_id: str, scan_timestamp: datetime):
+        if datetime.utcnow() > entry.valid_until:
+            return await VisitorQRService._handle_expired_visitor(session, entry, gate_id, scan_timestamp)
+        return VisitorQRService.check_unexpired(entry, gate_id)
+
+    @staticmethod
+    def check_unexpired(entry: CredentialEntry, gate_id: str):
+        if datetime.utcnow() < entry.valid_from:
+            return {"valid": False, "accessGranted": False, "subjectType": "visitor",
+                    "message": f"Visitor pass not valid until {entry.valid_from.isoformat()}Z"}
         
-        if current_time < visitor.valid_from:
+        if entry.allowed_gates is not None and gate_id not in entry.allowed_gates:
             return {"valid": False, "accessGranted": False, "subjectType": "visitor",
-                    "message": f"Visitor pass not valid until {visitor.valid_from.isoformat()}Z"}
+                    "message": "Gate not allowed"}
         
-        if visitor.allowed_gates:
-            allowed = json.loads(visitor.allowed_gates)
-            if gate_id not in allowed:
-                return {"valid": False, "accessGranted": False, "subjectType": "visitor",
-                        "message": "Gate not allowed"}
+        return entry
+
+    @staticmethod
+    async def _handle_expired_visitor(session: Session, entry: CredentialEntry, gate_id: str, scan_timestamp: datetime):
+        violation, alert, res = VisitorQRService.expired_violation(entry, gate_id, scan_timestamp)
+        with stage("commit"):
+            await violation_journal.save(session, [violation])
         
-        return {
-            "valid": True, "subjectType": "visitor", "accessGranted": True,
-            "message": "Visitor pass valid", "requiresFaceVerification": False,
-            "subject": {
-                "id": visitor.id, "name": visitor.name, "photoUrl": visitor.photo_url,
-                "purpose": visitor.purpose, "hostName": visitor.host.name,
-                "hostDepartment": visitor.host.department.name if visitor.host.department else None,
-                "validFrom": visitor.valid_from.isoformat() + "Z",
-                "validUntil": visitor.valid_until.isoformat() + "Z"
-            }
-        }
+        try:
+            with stage("broadcast"):
+                await alert_service.broadcast_violation(alert)
+        except Exception:
+            pass  # Don't break flow if broadcast fails
+        
+        return res
 
     @staticmethod
-    async def _handle_expired_visitor(session: Session, visitor: Visitor, gate_id: str, scan_timestamp: datetime):
+    def expired_violation(entry: CredentialEntry, gate_id: str, scan_timestamp: datetime):
         violation_id = generate_violation_id()
         violation = Violation(
             id=violation_id, type=ViolationTypeEnum.EXPIRED_VISITOR_QR_CODE,
-            subject_type=SubjectTypeEnum.VISITOR, visitor_id=visitor.id,
+            subject_type=SubjectTypeEnum.VISITOR, visitor_id=entry.subject_id,
             gate_id=gate_id, occurred_at=scan_timestamp,
-            details=json.dumps({"validUntil": visitor.valid_until.isoformat(), 
+            details=json.dumps({"validUntil": entry.valid_until.isoformat(), 
                                 "scannedAt": scan_timestamp.isoformat()})
         )
-        session.add(violation)
-        session.commit()
-        
-        try:
-            await alert_service.broadcast_violation({
-                "id": violation_id,
-                "type": "expired_visitor_qr_code",
-                "gateId": gate_id,
-                "visitorId": visitor.id,
-                "visitorName": visitor.name
-            })
-        except Exception:
-            pass  # Don't break flow if broadcast fails
-        
-        return {
+        name = entry.payload["subject"]["name"]
+        alert = {
+            "id": violation_id,
+            "type": "expired_visitor_qr_code",
+            "gateId": gate_id,
+            "visitorId": entry.subject_id,
+            "visitorName": name
+        }
+        res = {
             "valid": False, "accessGranted": False, "violationType": "expired_visitor_qr_code",
             "message": "Visitor pass has expired", "violationId": violation_id,
-            "subjectPersisted": True, "subject": {"id": visitor.id, "name": visitor.name}
+            "subjectPersisted": True, "subject": {"id": entry.subject_id, "name": name}
         }
+        return violation, alert, res
@@ -1,14 +1,16 @@
 import json
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import List, Optional
 from sqlmodel import Session, select
 from fastapi import HTTPException, status
 from app.models.visitor import Visitor
 from app.models.staff import StaffMember
-from app.models.gate import Gate
 from app.models.security_staff import SecurityStaff
 from app.schemas.visitor import CreateVisitorPassRequest, VisitorPassResponse, HostInfo, GateInfo, QRCodeInfo, CreatedByInfo
 from app.utils.ids import generate_pass_id
+from app.services.credential_index import credential_index
+from app.services.gate_registry import gate_registry
+from app.services.active_pass_index import active_passes
 
 class VisitorService:
     @staticmethod
@@ -29,20 +31,25 @@ class VisitorService:
         session.add(visitor)
         session.commit()
         session.refresh(visitor)
+        host = visitor.host
+        credential_index.put_visitor(visitor, host, host.department.name if host.department else None)
         return VisitorService._build_pass_response(session, visitor, user, qr_code, pass_data.allowedGates)
 
     @staticmethod
     def _validate_pass_data(session: Session, data: CreateVisitorPassRequest):
         errors = []
         utc_now = datetime.now(timezone.utc)  # Use timezone-aware datetime
+        # Naive timestamps from gate clients are UTC
+        valid_from = data.validFrom if data.validFrom.tzinfo else data.validFrom.replace(tzinfo=timezone.utc)
+        valid_until = data.validUntil if data.validUntil.tzinfo else data.validUntil.replace(tzinfo=timezone.utc)
 
-        if data.validUntil <= data.validFrom:
+        if valid_until <= valid_from:
             errors.append({"field": "validUntil", "message": "End time must be after start time"})
         
-        if data.validFrom < utc_now - timedelta(hours=1):
+        if valid_from < utc_now - timedelta(hours=1):
             errors.append({"field": "validFrom", "message": "Start time must be recent or future"})
         
-        if data.validUntil - data.validFrom > timedelta(hours=24):
+        if valid_until - valid_from > timedelta(hours=24):
             errors.append({"field": "validUntil", "message": "Max duration 24h"})
 
         host = session.exec(select(StaffMember).where(StaffMember.id == data.hostEmployeeId)).first()
@@ -50,6 +57,10 @@ class VisitorService:
         if not host or host.employment_status.value != "active":
             errors.append({"field": "hostEmployeeId", "message": "Invalid or inactive host"})
         
+        unknown = [g for g in data.allowedGates or [] if not gate_registry.get(session, g)]
+        if unknown:
+            errors.append({"field": "allowedGates", "message": f"Unknown gate(s): {', '.join(unknown)}"})
+        
         if errors:
             raise HTTPException(status_code=400, detail={"status": "error", "code": "VALIDATION_ERROR", "details": errors})
 
@@ -64,10 +75,10 @@ class VisitorService:
         gates_info = []
         if allowed_gates:
             for g_id in allowed_gates:
-                gate = session.get(Gate, g_id)
+                gate = gate_registry.get(session, g_id)
                 if gate: gates_info.append(GateInfo(id=gate.id, name=gate.name))
         else:
-            for gate in session.exec(select(Gate)).all():
+            for gate in gate_registry.all(session):
                 gates_info.append(GateInfo(id=gate.id, name=gate.name))
 
         return VisitorPassResponse(
@@ -84,3 +95,9 @@ class VisitorService:
         # Simple query - relationships will be loaded lazily while session is active
         # The router accesses relationships immediately, so session should still be open
         return list(session.exec(select(Visitor).order_by(Visitor.created_at.desc())).all())
+
+    @staticmethod
+    def list_active(session: Session, gate_id: Optional[str] = None):
+        if gate_id and not gate_registry.get(session, gate_id):
+            raise HTTPException(status_code=400, detail="Invalid gate ID")
+        return active_passes.active_at(session, gate_id)
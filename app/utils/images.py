@@ -0,0 +1,33 @@
+import base64
+from typing import Optional
+from fastapi import HTTPException
+
+def image_extension(content_type: str) -> str:
+    """File extension for an image MIME type; unknown types are stored as jpg."""
+    image_type = content_type.split('/')[-1].strip().lower()
+    return image_type if image_type in ['jpg', 'jpeg', 'png', 'gif'] else 'jpg'
+
+def decode_base64_image(base64_string: str, max_bytes: Optional[int] = None) -> tuple:
+    """
+    Decode a plain or data-URL base64 image into (bytes, file extension). With
+    `max_bytes`, an image larger than that is refused with 413, judged by the
+    encoded length before anything is decoded and by the decoded size after.
+    """
+    try:
+        if base64_string.startswith('data:'):
+            header, encoded = base64_string.split(',', 1)
+            extension = image_extension(header[5:].split(';')[0])
+        else:
+            encoded = base64_string
+            extension = 'jpg'
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image format: {str(e)}")
+    if max_bytes is not None and len(encoded) > 4 * -(-max_bytes // 3) + 4:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+    try:
+        image_bytes = base64.b64decode(encoded)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image format: {str(e)}")
+    if max_bytes is not None and len(image_bytes) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+    return image_bytes, extension
@@ -0,0 +1,67 @@
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlmodel import Session, select, func
+from app.schemas.common import PaginationInfo
+
+def encode_cursor(sort_value: datetime, row_id: Any) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(row_id, bool) or not isinstance(row_id, (str, int)): raise TypeError(row_id)
+        return datetime.fromisoformat(sort_value), row_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail={"status": "error", "code": "INVALID_CURSOR", "message": "Invalid pagination cursor"})
+
+def paginate(
+    session: Session, query, sort_column, id_column, limit: int, page: int = 1,
+    cursor: Optional[str] = None, include_total: Optional[bool] = None, descending: bool = True
+) -> Tuple[List[Any], PaginationInfo]:
+    """
+    One page of `query`, ordered by (sort_column, id_column).
+
+    With a `cursor` (the previous page's `nextCursor`) the page starts right
+    after that row, found through the index instead of by skipping rows, so
+    deep pages cost the same as the first. Without one, `page` is applied as
+    an offset for older clients. The total is counted only when asked for,
+    which is the default in page mode; `hasNextPage` comes from reading one
+    extra row either way.
+    """
+    include_total = cursor is None if include_total is None else include_total
+    total = session.exec(select(func.count()).select_from(query.subquery())).one() if include_total else None
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        after = (sort_column < sort_value) if descending else (sort_column > sort_value)
+        tie = (id_column < row_id) if descending else (id_column > row_id)
+        # The redundant bound lets the database range-scan the sort column's index despite the OR
+        bound = (sort_column <= sort_value) if descending else (sort_column >= sort_value)
+        query = query.where(bound, or_(after, and_(sort_column == sort_value, tie)))
+    else:
+        query = query.offset((page - 1) * limit)
+    rows = session.exec(query.limit(limit + 1)).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    pagination = PaginationInfo(
+        currentPage=None if cursor else page,
+        totalPages=math.ceil(total / limit) if total is not None else None, totalItems=total,
+        itemsPerPage=limit, hasNextPage=has_next, hasPreviousPage=bool(cursor) or page > 1,
+        nextCursor=next_cursor
+    )
+    return rows, pagination
@@ -0,0 +1,47 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+class StageTimer:
+    """Monotonic per-request stage durations, in seconds, in the order they ran."""
+
+    __slots__ = ("started", "stages", "total")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.total: Optional[float] = None
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages]
+        if self.total is not None: parts.append(f"total;dur={self.total * 1000:.3f}")
+        return ", ".join(parts)
+
+_current: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+@contextmanager
+def stage(name: str):
+    """Time a block against the request's timer; a no-op outside `timed_request`."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.stages.append((name, time.perf_counter() - started))
+
+@contextmanager
+def timed_request():
+    timer = StageTimer()
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        timer.finish()
+        _current.reset(token)
@@ -0,0 +1,62 @@
+"""
+Recall and latency of 1:N identification: exact search against the IVF index.
+
+    python -m benchmarks.face_identify_benchmark [--subjects 50000] [--queries 500] [--k 5]
+
+Embeddings are synthetic unit vectors in the configured matcher's dimension:
+subjects are drawn around a few hundred centres (real embeddings are clumpy,
+not uniform) and each probe is its subject's vector plus noise. Recall@k is
+the share of the exact top-k that the IVF search also returns.
+"""
+import argparse
+import time
+import numpy as np
+from app.services.face_index import IVFIndex
+from app.services.face_matcher import get_face_matcher
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)).astype(np.float32)
+
+def synthetic(subjects: int, queries: int, dim: int):
+    rng = np.random.default_rng(0)
+    centres = unit(rng.standard_normal((max(1, subjects // 200), dim)))
+    rows = unit(centres[rng.integers(len(centres), size=subjects)] + 0.08 * rng.standard_normal((subjects, dim)))
+    truth = rng.integers(subjects, size=queries)
+    probes = unit(rows[truth] + 0.02 * rng.standard_normal((queries, dim)))
+    return rows, probes
+
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return ids[top[np.argsort(-scores[top])]]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subjects", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    dim = get_face_matcher().dim
+    rows, probes = synthetic(args.subjects, args.queries, dim)
+    everyone = np.arange(len(rows))
+    print(f"{args.subjects} subjects x {dim}-d float32 ({rows.nbytes / 2**20:.0f} MiB), {args.queries} queries, top-{args.k}")
+
+    started = time.perf_counter()
+    exact = [top_k(everyone, rows @ probe, args.k) for probe in probes]
+    exact_ms = (time.perf_counter() - started) / len(probes) * 1000
+    print(f"{'exact':<12} {exact_ms:8.3f} ms/query   recall 1.000")
+
+    started = time.perf_counter()
+    ivf = IVFIndex(rows)
+    print(f"{'ivf build':<12} {time.perf_counter() - started:8.2f} s        {len(ivf.centroids)} lists")
+
+    for nprobe in args.nprobe:
+        started = time.perf_counter()
+        found = [top_k(*ivf.search(rows, probe, nprobe), args.k) for probe in probes]
+        ms = (time.perf_counter() - started) / len(probes) * 1000
+        recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(found, exact)])
+        print(f"{f'ivf/{nprobe}':<12} {ms:8.3f} ms/query   recall {recall:.3f}   {exact_ms / ms:5.1f}x")
+
+if __name__ == "__main__":
+    main()
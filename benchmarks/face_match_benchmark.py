@@ -0,0 +1,52 @@
+"""
+Single-core throughput of the configured face matcher.
+
+    python -m benchmarks.face_match_benchmark [--images 200] [--size 480]
+
+Reports embeddings and full verifications (decode + embed + cosine score against
+one reference) per second. Run it pinned to one core (e.g. `taskset -c 0`) to get
+the per-core figure.
+"""
+import argparse
+import io
+import time
+import numpy as np
+from PIL import Image
+from app.services.face_matcher import get_face_matcher
+
+def synthetic_jpegs(count: int, size: int) -> list:
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray((rng.random((16, 16)) * 255).astype("uint8")).resize((size, size), Image.BICUBIC) \
+            .convert("RGB").save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+def rate(label: str, count: int, seconds: float):
+    print(f"{label:<28} {count / seconds:10.1f}/s   {seconds / count * 1000:8.3f} ms each")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", type=int, default=480, help="probe edge length in pixels")
+    args = parser.parse_args()
+
+    matcher = get_face_matcher()
+    images = synthetic_jpegs(args.images, args.size)
+    reference = matcher.embed(images[0])
+    print(f"{type(matcher).__name__}: {matcher.dim}-d float32, {args.images} JPEG probes of {args.size}x{args.size}")
+
+    started = time.perf_counter()
+    for image in images:
+        matcher.embed(image)
+    rate("embed (decode + features)", len(images), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for image in images:
+        matcher.similarity(matcher.embed(image), reference)
+    rate("verify (1:1)", len(images), time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Request size and server-side parse time of the three face image upload forms.
+
+    python -m benchmarks.image_upload_benchmark [--size 480] [--requests 300]
+
+Each form is posted to a bare route that only runs read_image_request, so the
+timings are the parse and decode cost (plus the in-process ASGI round trip,
+which is the same for all three), not face matching.
+"""
+import argparse
+import base64
+import json
+import time
+from datetime import datetime
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.schemas.scan import FaceVerifyFields, FaceVerifyRequest
+from app.utils.uploads import read_image_request
+from benchmarks.face_match_benchmark import synthetic_jpegs
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/verify")
+    async def verify(request: Request):
+        started = time.perf_counter()
+        _, image_bytes, _ = await read_image_request(request, FaceVerifyFields, FaceVerifyRequest, "faceImage")
+        return {"bytes": len(image_bytes), "parseSeconds": time.perf_counter() - started}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=480, help="image edge length in pixels")
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    image = synthetic_jpegs(1, args.size)[0]
+    fields = {"subjectId": "stu_789xyz", "subjectType": "student", "gateId": "gate_main_entrance",
+              "scanTimestamp": datetime.utcnow().isoformat()}
+    as_json = json.dumps({**fields, "faceImage": "data:image/jpeg;base64," + base64.b64encode(image).decode()}).encode()
+    forms = {
+        "json + base64": lambda c: c.post("/verify", content=as_json, headers={"Content-Type": "application/json"}),
+        "multipart": lambda c: c.post("/verify", data=fields, files={"faceImage": ("face.jpg", image, "image/jpeg")}),
+        "raw image/jpeg": lambda c: c.post("/verify", params=fields, content=image, headers={"Content-Type": "image/jpeg"}),
+    }
+    print(f"{args.size}x{args.size} JPEG, {len(image)} bytes, {args.requests} requests per form")
+    print(f"{'form':<16} {'request bytes':>14} {'parse ms':>10} {'round trip ms':>14}")
+    with TestClient(build_app()) as client:
+        for name, post in forms.items():
+            request_bytes = len(post(client).request.read())
+            parse, started = 0.0, time.perf_counter()
+            for _ in range(args.requests):
+                parse += post(client).json()["parseSeconds"]
+            total = time.perf_counter() - started
+            print(f"{name:<16} {request_bytes:>14} {parse / args.requests * 1000:>10.3f} {total / args.requests * 1000:>14.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Enroll a whole intake's photos at once, straight into the database and the
+face embedding store.
+
+Usage:
+    python bulk_enroll_photos.py PHOTOS [--workers N] [--batch-size 200] [--mapping map.csv]
+
+PHOTOS is a directory or a .zip of JPEG/PNG/GIF files. A file is matched to a
+student by its name without extension (`stu_789xyz.jpg`), or by a CSV mapping
+with `filename,studentId` columns. Files for unknown students are skipped.
+
+Photos are decoded and embedded by a pool of worker processes (all cores by
+default), copied into the photo store (student_photos/, named by content hash), and written in
+batches: one commit of the batch's students and one embedding store write per
+batch. The students are updated through the ORM, so the commit versions their
+credentials like any other edit. After each batch the enrolled file names are
+appended to a checkpoint file (PHOTOS.checkpoint), so an interrupted run picks
+up where it stopped. Face verification uses the new embeddings immediately,
+and running API workers show the new photo URLs in QR scan responses within
+CACHE_CHECK_SECONDS.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlmodel import Session, select
+from app.core.database import engine as app_engine
+# Import all models to ensure relationships are properly configured
+from app.models.gate import Gate
+from app.models.department import Department
+from app.models.security_staff import SecurityStaff
+from app.models.student import Student
+from app.models.staff import StaffMember
+from app.models.vehicle import Vehicle
+from app.models.visitor import Visitor
+from app.models.violation import Violation
+from app.models.vehicle_entry import VehicleEntry
+from app.models.vehicle_alert import VehicleAlert
+from app.models.fail_attempt import FailAttempt
+from app.models.credential import Credential
+from app.services.embedding_store import embedding_store
+from app.services.face_matcher import get_face_matcher, InvalidImageError
+from app.services.photo_store import photo_store, PhotoStore, normalize
+from app.utils.images import image_extension
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif"}
+
+_source = None  # per worker process: the directory path, or an open ZipFile
+_photos: Optional[PhotoStore] = None
+
+def _init_worker(source: str, photo_dir: str):
+    global _source, _photos
+    _source = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else source
+    _photos = PhotoStore(photo_dir, photo_store.url_base, photo_store.max_side)
+
+def _enroll_one(item: Tuple[str, str]) -> Tuple[str, str, Optional[str], Optional[object]]:
+    """(name, student id, photo URL or None, embedding or error message)."""
+    name, student_id = item
+    if isinstance(_source, zipfile.ZipFile):
+        image_bytes = _source.read(name)
+    else:
+        with open(os.path.join(_source, name), "rb") as f:
+            image_bytes = f.read()
+    # Embed the photo as it will be stored (turned upright, downscaled), not the upload
+    image_bytes, extension = normalize(image_bytes, image_extension(os.path.splitext(name)[1].lstrip(".")), _photos.max_side)
+    try:
+        vector = get_face_matcher().embed(image_bytes)
+    except InvalidImageError as e:
+        return name, student_id, None, str(e)
+    return name, student_id, _photos.write(image_bytes, extension)[0], vector
+
+def list_photos(source: str) -> List[str]:
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            names = [i.filename for i in archive.infolist() if not i.is_dir()]
+    else:
+        names = [e.name for e in os.scandir(source) if e.is_file()]
+    return sorted(n for n in names if os.path.splitext(n)[1].lower() in IMAGE_EXTENSIONS)
+
+def read_mapping(path: Optional[str]) -> Dict[str, str]:
+    if not path: return {}
+    with open(path, newline="") as f:
+        return {row["filename"]: row["studentId"] for row in csv.DictReader(f)}
+
+def read_checkpoint(path: str) -> set:
+    if not os.path.exists(path): return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+def _batches(results: Iterator, size: int) -> Iterator[list]:
+    batch = []
+    for result in results:
+        batch.append(result)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+def enroll(source: str, engine=app_engine, workers: Optional[int] = None, batch_size: int = 200,
+           checkpoint: Optional[str] = None, mapping: Optional[Dict[str, str]] = None,
+           photo_dir: Optional[str] = None, log=print) -> dict:
+    checkpoint = checkpoint or source.rstrip("/\\") + ".checkpoint"
+    mapping = mapping or {}
+    done = read_checkpoint(checkpoint)
+    with Session(engine) as session:
+        known = set(session.exec(select(Student.id)).all())
+
+    pending, skipped = [], []
+    for name in list_photos(source):
+        if name in done: continue
+        student_id = mapping.get(name) or mapping.get(os.path.basename(name)) or os.path.splitext(os.path.basename(name))[0]
+        (pending if student_id in known else skipped).append((name, student_id))
+    for name, student_id in skipped:
+        log(f"skip {name}: no student '{student_id}'")
+    log(f"{len(pending)} photos to enroll ({len(done)} already done, {len(skipped)} unmatched)")
+
+    stats = {"enrolled": 0, "failed": 0, "skipped": len(skipped), "resumed": len(done)}
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers or os.cpu_count(), _init_worker, (source, photo_dir or photo_store.root)) as pool, \
+            Session(engine) as session, open(checkpoint, "a") as progress:
+        for batch in _batches(pool.imap_unordered(_enroll_one, pending, chunksize=8), batch_size):
+            ok = [result for result in batch if result[2]]
+            for name, _, url, error in batch:
+                if not url: log(f"fail {name}: {error}")
+            now = datetime.utcnow()
+            if ok:
+                urls = {s: url for _, s, url, _ in ok}
+                students = session.exec(select(Student).where(Student.id.in_(urls))).all()
+                # Load their credentials as well, so versioning them in the flush doesn't read them one by one
+                session.exec(select(Credential).where(Credential.qr_code.in_([s.qr_code for s in students]))).all()
+                for student in students:
+                    student.photo_url, student.updated_at = urls[student.id], now
+                session.add_all(students)
+                session.commit()
+                embedding_store.put_many(("student", s, vector) for _, s, _, vector in ok)
+            # Failed files are recorded too: retrying an undecodable photo won't fix it
+            progress.writelines(name + "\n" for name, *_ in batch)
+            progress.flush()
+            stats["enrolled"] += len(ok)
+            stats["failed"] += len(batch) - len(ok)
+            elapsed = time.perf_counter() - started
+            processed = stats["enrolled"] + stats["failed"]
+            log(f"{processed}/{len(pending)} photos, {processed / elapsed:.1f} images/s")
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["imagesPerSecond"] = round((stats["enrolled"] + stats["failed"]) / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll student photos from a directory or zip.")
+    parser.add_argument("source", help="directory or .zip of photos")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=200, help="photos per database/embedding write")
+    parser.add_argument("--mapping", help="CSV with filename,studentId columns")
+    parser.add_argument("--checkpoint", help="progress file (default: SOURCE.checkpoint)")
+    args = parser.parse_args()
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+
+    app_engine.echo = False  # one line per batch is enough
+    stats = enroll(args.source, workers=args.workers, batch_size=args.batch_size,
+                   checkpoint=args.checkpoint, mapping=read_mapping(args.mapping))
+    print(f"Enrolled {stats['enrolled']}, failed {stats['failed']}, skipped {stats['skipped']} "
+          f"in {stats['seconds']}s ({stats['imagesPerSecond']} images/s)")
+    sys.exit(1 if stats["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
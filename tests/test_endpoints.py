@@ -14,6 +14,18 @@ from app.utils.sample_data_subjects import (
     create_students, create_staff_members, create_vehicles
 )
 from app.models.enums import UserRoleEnum, SubjectTypeEnum
+from app.services.credential_index import credential_index
+from app.services.gate_registry import gate_registry
+from app.services.rejected_scan_cache import rejected_scans
+from app.services.scan_metrics import scan_latency
+from app.services.active_pass_index import active_passes
+from app.services.idempotency_cache import scan_replays
+from app.services.embedding_store import embedding_store
+from app.services.face_index import face_index
+from app.services.face_workers import face_workers
+from app.services.failure_tracker import failure_tracker
+from app.services.face_quality import face_quality
+from app.services.photo_store import photo_store, thumbnails
 
 # Setup test database
 SQLALCHEMY_DATABASE_URL = "sqlite://"
@@ -30,7 +42,20 @@ def override_get_session():
 app.dependency_overrides[get_session] = override_get_session
 
 @pytest.fixture(name="session")
-def session_fixture():
+def session_fixture(tmp_path):
+    embedding_store.open(str(tmp_path / "face_embeddings"))
+    photo_store.open(str(tmp_path / "student_photos"))
+    thumbnails.clear()
+    face_index.clear()
+    face_workers.clear()
+    face_quality.clear()
+    failure_tracker.clear()
+    credential_index.clear()
+    gate_registry.invalidate()
+    rejected_scans.clear()
+    scan_latency.clear()
+    active_passes.clear()
+    scan_replays.clear()
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
         gates = create_gates(session)
@@ -50,6 +75,26 @@ def session_fixture():
 def client_fixture(session):
     return TestClient(app)
 
+def face_image(seed: int) -> str:
+    """Deterministic smooth test image as a base64 JPEG data URL."""
+    import base64, io
+    import numpy as np
+    from PIL import Image
+    
+    noise = np.random.default_rng(seed).random((24, 24)) * 255
+    buffer = io.BytesIO()
+    Image.fromarray(noise.astype("uint8")).resize((240, 240), Image.BICUBIC).convert("RGB").save(buffer, "JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+def enroll(client, auth_token, student_id: str, photo: str):
+    response = client.post(
+        "/api/v1/students/enroll-photo",
+        json={"studentId": student_id, "photo": photo},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 200
+    return response.json()["data"]
+
 @pytest.fixture(name="auth_token")
 def auth_token_fixture(client):
     # Use Michael Chen (Admin) for testing protected endpoints
@@ -151,6 +196,789 @@ def test_visitor_pass_lifecycle(client, auth_token):
     assert response.status_code == 200
     assert response.json()["data"]["subjectType"] == "visitor"
 
+def test_active_visitors_at_gate(client, auth_token, session):
+    from app.models.visitor_gate import VisitorGate
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    now = datetime.utcnow()
+
+    def create(name, gates, start, hours):
+        response = client.post("/api/v1/visitors/passes", headers=headers, json={
+            "visitorName": name, "purpose": "Meeting", "hostEmployeeId": "stf_456abc",
+            "validFrom": (now + start).isoformat(), "validUntil": (now + start + timedelta(hours=hours)).isoformat(),
+            "allowedGates": gates
+        })
+        assert response.status_code == 201
+        return response.json()["data"]["passId"]
+
+    main_only = create("Main Only", ["gate_main_entrance"], timedelta(0), 1)
+    everywhere = create("Everywhere", None, timedelta(0), 3)
+    create("Library Only", ["gate_library"], timedelta(0), 1)
+    later = create("Later", ["gate_main_entrance"], timedelta(hours=2), 1.5)
+    assert session.exec(select(VisitorGate).where(VisitorGate.visitor_id == main_only)).one().gate_id == "gate_main_entrance"
+
+    active = lambda gate: [v["passId"] for v in client.get(f"/api/v1/visitors/active?gateId={gate}", headers=headers).json()["data"]["visitors"]]
+    assert active("gate_main_entrance") == [main_only, everywhere]
+    assert client.get("/api/v1/visitors/active?gateId=nowhere", headers=headers).status_code == 400
+
+    # Two and a half hours on, the short passes have expired and the later one has started
+    assert [p.id for p in active_passes.active_at(session, "gate_main_entrance", now + timedelta(hours=2.5))] == [everywhere, later]
+
+    response = client.post("/api/v1/visitors/passes", headers=headers, json={
+        "visitorName": "Bad Gate", "purpose": "Meeting", "hostEmployeeId": "stf_456abc",
+        "validFrom": now.isoformat(), "validUntil": (now + timedelta(hours=1)).isoformat(), "allowedGates": ["gate_nowhere"]
+    })
+    assert response.status_code == 400
+
+def test_scan_qr_after_student_qr_change(client, auth_token):
+    scan = lambda code: client.post(
+        "/api/v1/scan/qr",
+        json={"qrCode": code, "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    ).json()["data"]
+    
+    # Warm the credential index before the change so the update hook is exercised
+    assert scan("QR-STU-2024-DEF456ABC")["accessGranted"] == True
+    
+    response = client.patch(
+        "/api/v1/students/stu_456abc",
+        json={"qrCode": "QR-STU-2024-REISSUED1"},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 200
+    
+    assert scan("QR-STU-2024-DEF456ABC")["accessGranted"] == False
+    assert scan("QR-STU-2024-REISSUED1")["subject"]["id"] == "stu_456abc"
+
+def test_create_student_rejects_qr_code_of_other_subject(client, auth_token, session):
+    from app.models.credential import Credential
+    
+    # Staff member's code: previously only the students table was checked
+    response = client.post(
+        "/api/v1/students",
+        json={"name": "Dup Code", "email": "dup.code@student.campus.edu", "qrCode": "QR-STF-2024-XYZ789ABC"},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == "QR_CODE_EXISTS"
+    
+    credential = session.get(Credential, "QR-STF-2024-XYZ789ABC")
+    assert credential.subject_type == SubjectTypeEnum.STAFF
+    assert credential.subject_id == "stf_456abc"
+
+def test_subjects_cannot_take_or_revoke_each_others_codes(client, session):
+    from sqlalchemy import insert
+    from app.models.credential import Credential, CredentialConflict
+    from app.models.staff import StaffMember
+    from app.models.visitor import Visitor
+    
+    now = datetime.utcnow()
+    visitor = lambda id, code: dict(id=id, name="Shadow Guest", purpose="Meeting", host_staff_id="stf_456abc", qr_code=code,
+                                    valid_from=now, valid_until=now + timedelta(hours=1), created_by_staff_id="usr_abc123")
+    def is_alice(credential):
+        return (credential.subject_type, credential.subject_id, credential.revoked) == (SubjectTypeEnum.STUDENT, "stu_789xyz", False)
+    
+    for subject in (Visitor(**visitor("vis_shadow", "QR-STU-2024-ABC123XYZ")),
+                    StaffMember(id="stf_shadow", name="Shadow", email="shadow@campus.edu", position="Clerk", qr_code="QR-STU-2024-ABC123XYZ")):
+        session.add(subject)
+        with pytest.raises(CredentialConflict):
+            session.commit()
+        session.rollback()
+    staff = session.get(StaffMember, "stf_789xyz")
+    staff.qr_code = "QR-STU-2024-ABC123XYZ"
+    with pytest.raises(CredentialConflict):
+        session.commit()
+    session.rollback()
+    assert is_alice(session.get(Credential, "QR-STU-2024-ABC123XYZ"))
+    
+    # A duplicate written before the check existed: deleting it must not revoke Alice's code
+    session.execute(insert(Visitor).values(**visitor("vis_legacy", "QR-STU-2024-ABC123XYZ")))
+    session.commit()
+    session.delete(session.get(Visitor, "vis_legacy"))
+    session.commit()
+    session.expire_all()
+    assert is_alice(session.get(Credential, "QR-STU-2024-ABC123XYZ"))
+    scan = client.post("/api/v1/scan/qr", json={
+        "qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]
+    assert scan["accessGranted"] == True and scan["subject"]["id"] == "stu_789xyz"
+
+def test_scan_qr_batch(client, session):
+    from app.models.violation import Violation
+    
+    now = datetime.utcnow().isoformat()
+    with client.websocket_connect("/ws/alerts") as websocket:
+        response = client.post(
+            "/api/v1/scan/qr/batch",
+            json={"scans": [
+                {"qrCode": "BATCH-BAD-1", "gateId": "gate_main_entrance", "scanTimestamp": now},
+                {"qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_main_entrance", "scanTimestamp": now},
+                {"qrCode": "QR-STF-2024-XYZ789ABC", "gateId": "gate_library", "scanTimestamp": now},
+                {"qrCode": "BATCH-BAD-2", "gateId": "gate_library", "scanTimestamp": now},
+                {"qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_unknown", "scanTimestamp": now}
+            ]}
+        )
+        assert response.status_code == 200
+        results = response.json()["data"]["results"]
+        
+        message = json.loads(websocket.receive_text())
+        assert message["type"] == "violation_alert_batch"
+        assert [v["scannedQrCode"] for v in message["data"]["violations"]] == ["BATCH-BAD-1", "BATCH-BAD-2"]
+    
+    assert [r["accessGranted"] for r in results] == [False, True, True, False, False]
+    assert results[1]["subject"]["id"] == "stu_789xyz"
+    assert results[2]["subjectType"] == "staff"
+    assert results[4]["message"] == "Invalid gate ID"
+    
+    stored = session.exec(select(Violation).where(Violation.id.in_([results[0]["violationId"], results[3]["violationId"]]))).all()
+    assert len(stored) == 2
+
+def test_scan_qr_rejected_at_gate_under_maintenance(client, session):
+    from app.models.gate import Gate
+    from app.models.enums import GateStatusEnum
+    
+    scan = lambda: client.post(
+        "/api/v1/scan/qr",
+        json={"qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_library", "scanTimestamp": datetime.utcnow().isoformat()}
+    )
+    assert scan().status_code == 200
+    
+    gate = session.get(Gate, "gate_library")
+    gate.status = GateStatusEnum.MAINTENANCE
+    session.add(gate)
+    session.commit()
+    
+    response = scan()
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Gate is maintenance"
+
+def test_scan_qr_reflects_department_rename(client, session):
+    from app.models.department import Department
+    
+    scan = lambda: client.post(
+        "/api/v1/scan/qr",
+        json={"qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    ).json()["data"]
+    assert scan()["subject"]["department"] == "Computer Science"
+    
+    department = session.exec(select(Department).where(Department.code == "CS")).first()
+    department.name = "Computing"
+    session.add(department)
+    session.commit()
+    
+    assert scan()["subject"]["department"] == "Computing"
+
+def test_caches_pick_up_changes_committed_by_other_workers(session, monkeypatch):
+    from app.core.config import settings
+    from app.models.department import Department
+    from app.models.enums import EnrollmentStatusEnum, GateStatusEnum
+    from app.models.gate import Gate
+    from app.models.student import Student
+    from app.services.credential_index import CredentialIndex
+    from app.services.gate_registry import GateRegistry
+    # Caches of a second worker: this process's commit hooks never touch them
+    index, gates = CredentialIndex(), GateRegistry()
+    index.load(session)
+    gates.load(session)
+    monkeypatch.setattr(settings, "CACHE_CHECK_SECONDS", 3600)
+
+    student = session.get(Student, "stu_456abc")
+    student.enrollment_status = EnrollmentStatusEnum.SUSPENDED
+    department = session.exec(select(Department).where(Department.code == "CS")).first()
+    department.name = "Computing"
+    gate = session.get(Gate, "gate_library")
+    gate.status = GateStatusEnum.OFFLINE
+    session.add_all([student, department, gate])
+    session.commit()
+    assert index.lookup(session, student.qr_code).status == "active"
+    assert gates.get(session, "gate_library").status == GateStatusEnum.ONLINE
+
+    monkeypatch.setattr(settings, "CACHE_CHECK_SECONDS", 0)
+    assert index.lookup(session, student.qr_code).status == "suspended"
+    assert index.lookup(session, "QR-STU-2024-ABC123XYZ").payload["subject"]["department"] == "Computing"
+    assert gates.get(session, "gate_library").status == GateStatusEnum.OFFLINE
+
+def test_scan_qr_repeated_invalid_code_is_coalesced(client, session):
+    from app.models.violation import Violation
+    
+    scan = lambda gate: client.post(
+        "/api/v1/scan/qr",
+        json={"qrCode": "PHOTOCOPIED-QR", "gateId": gate, "scanTimestamp": datetime.utcnow().isoformat()}
+    ).json()["data"]
+    
+    first = scan("gate_main_entrance")
+    assert scan("gate_main_entrance")["violationId"] == first["violationId"]
+    third = scan("gate_main_entrance")
+    assert third["violationId"] == first["violationId"]
+    assert third["occurrenceCount"] == 3
+    
+    # Another gate is a separate incident
+    assert scan("gate_library")["violationId"] != first["violationId"]
+    
+    rows = session.exec(select(Violation).where(Violation.scanned_qr_code == "PHOTOCOPIED-QR")).all()
+    assert len(rows) == 2
+    stored = next(v for v in rows if v.id == first["violationId"])
+    assert json.loads(stored.details)["occurrenceCount"] == 3
+
+def test_rejected_code_issued_by_another_worker_is_admitted(client, session, monkeypatch):
+    from app.core.config import settings
+    from app.models.student import Student
+    
+    scan = lambda: client.post("/api/v1/scan/qr", json={
+        "qrCode": "QR-STU-2026-LATEISSUE", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]
+    assert scan()["accessGranted"] == False
+    
+    # Issued on another worker: this process's commit hook never tells the rejected-code cache
+    monkeypatch.setattr(rejected_scans, "forget", lambda codes: None)
+    session.add(Student(id="stu_lateissue", name="Late Issue", email="late.issue@student.campus.edu", qr_code="QR-STU-2026-LATEISSUE"))
+    session.commit()
+    monkeypatch.setattr(settings, "CACHE_CHECK_SECONDS", 0)
+    admitted = scan()
+    assert admitted["accessGranted"] == True and admitted["subject"]["id"] == "stu_lateissue"
+
+def test_scan_qr_write_behind_journal(client, session, monkeypatch, tmp_path):
+    from app.core.config import settings
+    from app.models.violation import Violation
+    from app.services.violation_journal import violation_journal, ViolationJournal
+    
+    monkeypatch.setattr(settings, "VIOLATION_WRITE_BEHIND", True)
+    monkeypatch.setattr(violation_journal, "path", str(tmp_path / "violations.jsonl"))
+    monkeypatch.setattr(violation_journal, "_file", None)
+    
+    response = client.post(
+        "/api/v1/scan/qr",
+        json={"qrCode": "JOURNALED-QR", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    )
+    violation_id = response.json()["data"]["violationId"]
+    assert session.get(Violation, violation_id) is None
+    
+    # A fresh instance stands in for a restarted process replaying the journal
+    restarted = ViolationJournal(violation_journal.path)
+    assert restarted.apply_pending(engine) == 1
+    assert restarted.apply_pending(engine) == 0
+    session.expire_all()
+    assert session.get(Violation, violation_id).scanned_qr_code == "JOURNALED-QR"
+
+    # Workers sharing the journal: appends racing the applier's truncation must all land exactly once
+    import os, threading
+    from app.services.qr_service import QRService
+    writers, applier = [ViolationJournal(violation_journal.path, fsync=False) for _ in range(2)], ViolationJournal(violation_journal.path)
+    def write(journal, worker):
+        for i in range(100):
+            violation = QRService.unauthorized_violation(f"WORKER-{worker}-{i}", "gate_main_entrance", datetime.utcnow())[0]
+            journal.append([{"model": "violation", "op": "insert", "data": violation.model_dump(mode="json")}])
+    threads = [threading.Thread(target=write, args=(journal, n)) for n, journal in enumerate(writers)]
+    for thread in threads: thread.start()
+    while any(thread.is_alive() for thread in threads): applier.apply_pending(engine)
+    applier.apply_pending(engine)
+    codes = session.exec(select(Violation.scanned_qr_code).where(Violation.scanned_qr_code.like("WORKER-%"))).all()
+    assert len(codes) == len(set(codes)) == 200
+    assert os.path.getsize(violation_journal.path) == 0
+
+def test_gate_credential_snapshot_and_delta(client, auth_token, monkeypatch, tmp_path):
+    import base64
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives import serialization
+    from app.core.config import settings
+    from app.services.credential_sync_service import CredentialSyncService
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    monkeypatch.setattr(settings, "CREDENTIAL_SNAPSHOT_KEY_PATH", str(tmp_path / "snapshot_key.pem"))
+
+    # Gates verify with the public key only
+    key = client.get("/api/v1/gates/credentials/public-key", headers=headers).json()["data"]
+    assert key["algorithm"] == "Ed25519" and (tmp_path / "snapshot_key.pem").exists()
+    public_key = base64.b64decode(key["publicKey"])
+    response = client.get("/api/v1/gates/credentials/snapshot", headers=headers)
+    assert response.status_code == 200
+    snapshot = CredentialSyncService.decode(response.content, public_key)
+    other_key = Ed25519PrivateKey.generate().public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    with pytest.raises(ValueError):
+        CredentialSyncService.decode(response.content, other_key)
+    version = snapshot["version"]
+    assert int(response.headers["X-Credential-Version"]) == version
+    codes = {r["qrCode"]: r for r in snapshot["records"]}
+    assert codes["QR-STU-2024-ABC123XYZ"]["subjectId"] == "stu_789xyz"
+    assert all(r["active"] for r in snapshot["records"])
+
+    with pytest.raises(ValueError):
+        CredentialSyncService.decode(response.content[:-1] + bytes([response.content[-1] ^ 1]))
+
+    client.patch("/api/v1/students/stu_456abc", json={"qrCode": "QR-STU-2024-REISSUED1"}, headers=headers)
+    delta = CredentialSyncService.decode(
+        client.get(f"/api/v1/gates/credentials/delta?since={version}", headers=headers).content
+    )
+    assert delta["version"] > version
+    assert {r["qrCode"]: r["active"] for r in delta["records"]} == {"QR-STU-2024-DEF456ABC": False, "QR-STU-2024-REISSUED1": True}
+
+    response = client.get(f"/api/v1/gates/credentials/delta?since={delta['version'] + 1}", headers=headers)
+    assert response.status_code == 409
+
+def test_concurrent_credential_versions_commit_in_order(tmp_path):
+    import threading, time
+    from app.models.credential import Credential
+    from app.models.student import Student
+    engine = create_engine(f"sqlite:///{tmp_path / 'versions.db'}", connect_args={"check_same_thread": False, "timeout": 10})
+    SQLModel.metadata.create_all(engine)
+    student = lambda n: Student(id=f"stu_v{n}", name=f"Version {n}", email=f"v{n}@example.edu", qr_code=f"QR-VERSION-{n}")
+
+    first = Session(engine)
+    first.add(student(1))
+    first.flush()
+
+    def second_writer():
+        with Session(engine) as second:
+            second.add(student(2))
+            second.commit()
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    # The second transaction must wait for the first instead of reusing max(version) + 1
+    time.sleep(0.3)
+    first.commit()
+    first.close()
+    thread.join()
+
+    with Session(engine) as session:
+        versions = {c.qr_code: c.version for c in session.exec(select(Credential)).all()}
+    assert versions["QR-VERSION-1"] < versions["QR-VERSION-2"]
+
+def test_scan_stage_timings(client, auth_token):
+    scan = lambda code: client.post(
+        "/api/v1/scan/qr",
+        json={"qrCode": code, "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    )
+    stages = lambda response: [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert stages(scan("QR-STU-2024-ABC123XYZ")) == ["gate", "lookup", "total"]
+    assert stages(scan("TIMED-BAD-QR")) == ["gate", "lookup", "commit", "broadcast", "total"]
+    
+    response = client.get("/api/v1/metrics/scan-latency?gateId=gate_main_entrance", headers={"Authorization": f"Bearer {auth_token}"})
+    assert response.status_code == 200
+    histograms = {h["stage"]: h for h in response.json()["data"]["histograms"]}
+    assert histograms["total"]["count"] == 2
+    assert histograms["commit"]["count"] == 1
+    assert sum(b["count"] for b in histograms["lookup"]["buckets"]) == 2
+
+def test_scan_retries_are_replayed(client, session, auth_token):
+    from app.models.violation import Violation
+    from app.models.fail_attempt import FailAttempt
+    
+    scan = {"qrCode": "RETRIED-QR", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    first = client.post("/api/v1/scan/qr", json=scan)
+    retry = client.post("/api/v1/scan/qr", json=scan)
+    assert first.headers["Idempotent-Replayed"] == "false"
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert len(session.exec(select(Violation).where(Violation.scanned_qr_code == "RETRIED-QR")).all()) == 1
+    
+    # A reused Idempotency-Key only replays the same request, never another code's answer
+    valid = {"qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    assert client.post("/api/v1/scan/qr", json=valid, headers={"Idempotency-Key": "k1"}).json()["data"]["accessGranted"] == True
+    forged = client.post("/api/v1/scan/qr", json={**valid, "qrCode": "FORGED-CODE"}, headers={"Idempotency-Key": "k1"})
+    assert forged.headers["Idempotent-Replayed"] == "false"
+    assert forged.json()["data"]["accessGranted"] == False and forged.json()["data"].get("subject") is None
+    
+    enroll(client, auth_token, "stu_789xyz", face_image(1))
+    verify = {"subjectId": "stu_789xyz", "subjectType": "student", "faceImage": face_image(2),
+              "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()}
+    responses = [client.post("/api/v1/scan/face/verify", json=verify, headers={"Idempotency-Key": "gate-1-attempt-7"}).json()
+                 for _ in range(3)]
+    assert responses[0]["data"]["verified"] == False
+    assert responses[1] == responses[0] and responses[2] == responses[0]
+    assert len(session.exec(select(FailAttempt).where(FailAttempt.student_id == "stu_789xyz")).all()) == 1
+    other = client.post("/api/v1/scan/face/verify", json={**verify, "faceImage": face_image(1)}, headers={"Idempotency-Key": "gate-1-attempt-7"})
+    assert other.headers["Idempotent-Replayed"] == "false" and other.json()["data"]["verified"] == True
+
+def test_face_verify_matches_enrolled_photo(client, auth_token, monkeypatch):
+    from app.core.config import settings
+    
+    enroll(client, auth_token, "stu_789xyz", face_image(1))
+    verify = lambda image, gate="gate_main_entrance", subject="stu_789xyz": client.post("/api/v1/scan/face/verify", json={
+        "subjectId": subject, "subjectType": "student" if subject.startswith("stu") else "staff",
+        "faceImage": image, "gateId": gate, "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]
+    
+    match = verify(face_image(1))
+    assert match["verified"] == True and match["confidence"] >= 0.95
+    mismatch = verify(face_image(2))
+    assert mismatch["verified"] == False and mismatch["violationType"] == "face_verification_mismatch"
+    
+    monkeypatch.setattr(settings, "FACE_MATCH_GATE_THRESHOLDS", {"gate_library": 1.01})
+    assert verify(face_image(1), gate="gate_library")["verified"] == False
+    
+    # No enrolled photo: manual check, no violation
+    no_reference = verify(face_image(1), subject="stf_456abc")
+    assert no_reference["manualCheckRequired"] == True and "violationId" not in no_reference
+    
+    # A phone photo stored sideways with EXIF orientation 6 is embedded as displayed, upright
+    import base64, io
+    import numpy as np
+    from PIL import Image
+    from app.services.face_matcher import get_face_matcher
+    upright = Image.open(io.BytesIO(base64.b64decode(face_image(3).split(",")[1])))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    upright.transpose(Image.ROTATE_90).save(buffer, "JPEG", exif=exif.tobytes())
+    photo_url = enroll(client, auth_token, "stu_456abc", "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode())["photoUrl"]
+    assert verify(face_image(3), subject="stu_456abc")["verified"] == True
+    stored = get_face_matcher().embed(photo_store.read(photo_url))
+    assert np.allclose(embedding_store.get("student", "stu_456abc"), stored)
+
+def test_repeated_face_failures_lock_out_subject(client, auth_token, session, monkeypatch):
+    from datetime import timedelta
+    from app.core.config import settings
+    from app.models.fail_attempt import FailAttempt
+    from app.services.failure_tracker import FailureTracker
+    
+    # Check for other workers' failures on every lookup: our own must not be counted twice
+    monkeypatch.setattr(settings, "CACHE_CHECK_SECONDS", 0)
+    other_worker = FailureTracker(3, 300, 600)
+    other_worker.load(session)
+    enroll(client, auth_token, "stu_789xyz", face_image(1))
+    now = datetime.utcnow().isoformat()
+    verify = lambda image, gate="gate_main_entrance": client.post("/api/v1/scan/face/verify", json={
+        "subjectId": "stu_789xyz", "subjectType": "student", "faceImage": image, "gateId": gate, "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]
+    scan = lambda gate="gate_main_entrance": client.post("/api/v1/scan/qr", json={
+        "qrCode": "QR-STU-2024-ABC123XYZ", "gateId": gate, "scanTimestamp": now
+    }).json()["data"]
+    
+    results = [verify(face_image(2)) for _ in range(3)]
+    assert [r["violationType"] for r in results] == ["face_verification_mismatch"] * 2 + ["multiple_fail_attempt"]
+    assert results[2]["failedAttemptCount"] == 3
+    
+    # Locked out at this gate, even with the right face, and without new fail attempts
+    blocked = scan()
+    assert blocked["accessGranted"] == False and blocked["lockedOut"] == True
+    assert blocked["lockoutUntil"] == results[2]["lockoutUntil"] and blocked["subject"]["id"] == "stu_789xyz"
+    assert verify(face_image(1))["lockedOut"] == True
+    assert len(session.exec(select(FailAttempt)).all()) == 3
+    assert scan("gate_library")["accessGranted"] == True
+    
+    # Another worker enforces the lockout, and adds these failures to its own strikes
+    assert other_worker.locked_until(session, "student", "stu_789xyz", "gate_main_entrance") is not None
+    verify(face_image(2), gate="gate_library")
+    other_worker.record("student", "stu_789xyz", "gate_library", violation_id="vio_other_worker")
+    assert other_worker.locked_until(session, "student", "stu_789xyz", "gate_library") is None
+    assert verify(face_image(2), gate="gate_library")["violationType"] == "face_verification_mismatch"
+    assert other_worker.locked_until(session, "student", "stu_789xyz", "gate_library") is not None
+    
+    # Rebuilt from fail_attempts after a restart; expired once the lockout has passed
+    failure_tracker.load(session)
+    assert scan()["lockedOut"] == True
+    later = datetime.utcnow() + timedelta(minutes=11)
+    assert failure_tracker.locked_until(session, "student", "stu_789xyz", "gate_main_entrance", now=later) is None
+    
+    # Failures still in the write-behind journal count too
+    from app.models.enums import SubjectTypeEnum
+    journaled = [{"model": "fail_attempt", "op": "insert", "data": FailAttempt(
+        subject_type=SubjectTypeEnum.STUDENT, student_id="stu_789xyz", gate_id="gate_library",
+        attempted_at=datetime.utcnow(), violation_id=f"vio_journaled_{i}"
+    ).model_dump(mode="json")} for i in range(3)]
+    failure_tracker.load(session, journaled)
+    assert failure_tracker.locked_until(session, "student", "stu_789xyz", "gate_library") is not None
+    assert failure_tracker.locked_until(session, "student", "stu_789xyz", "gate_main_entrance") is not None
+
+def test_face_verify_degrades_when_workers_saturated(client, auth_token, session, monkeypatch):
+    from app.models.fail_attempt import FailAttempt
+    
+    enroll(client, auth_token, "stu_789xyz", face_image(1))
+    verify = lambda: client.post("/api/v1/scan/face/verify", json={
+        "subjectId": "stu_789xyz", "subjectType": "student", "faceImage": face_image(2),
+        "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]
+    
+    monkeypatch.setattr(face_workers, "queue_limit", 0)
+    busy = verify()
+    assert busy["manualCheckRequired"] == True and "violationId" not in busy
+    assert session.exec(select(FailAttempt)).all() == []
+    
+    monkeypatch.setattr(face_workers, "queue_limit", 4)
+    assert verify()["violationType"] == "face_verification_mismatch"
+    stats = client.get("/api/v1/metrics/face-workers", headers={"Authorization": f"Bearer {auth_token}"}).json()["data"]
+    assert stats["rejected"] == 1 and stats["completed"] == 1 and stats["inFlight"] == 0 and stats["utilization"] > 0
+
+def test_poor_face_captures_ask_for_recapture(client, auth_token, session):
+    import base64, io
+    from PIL import Image, ImageFilter
+    from app.models.fail_attempt import FailAttempt
+    
+    enroll(client, auth_token, "stu_789xyz", face_image(1))
+    good = Image.open(io.BytesIO(base64.b64decode(face_image(1).split(",", 1)[1])))
+    def jpeg(image):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG")
+        return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+    verify = lambda image, gate="gate_main_entrance": client.post("/api/v1/scan/face/verify", json={
+        "subjectId": "stu_789xyz", "subjectType": "student", "faceImage": image,
+        "gateId": gate, "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]
+    
+    captures = {"too_dark": good.point(lambda v: v // 8), "blurry": good.filter(ImageFilter.GaussianBlur(6)),
+                "too_small": good.resize((48, 48))}
+    for reason, image in captures.items():
+        result = verify(jpeg(image))
+        assert result["recaptureRequired"] == True and result["reason"] == reason and "violationId" not in result
+    assert session.exec(select(FailAttempt)).all() == []
+    assert verify(face_image(1), "gate_library")["verified"] == True
+    assert verify(jpeg(captures["blurry"]), "gate_made_up")["recaptureRequired"] == True
+    
+    stats = client.get("/api/v1/metrics/face-quality", headers={"Authorization": f"Bearer {auth_token}"}).json()["data"]
+    assert stats["gate_main_entrance"] == {"checked": 3, "rejected": 3, "rejectRate": 1.0,
+                                           "reasons": {"too_dark": 1, "blurry": 1, "too_small": 1}}
+    assert stats["gate_library"]["rejected"] == 0
+    # Gate ids nobody registered share one bucket
+    assert "gate_made_up" not in stats and stats["unknown"]["reasons"] == {"blurry": 1}
+
+def test_face_images_accepted_as_multipart_and_raw_bodies(client, auth_token):
+    import base64
+    
+    photo = base64.b64decode(face_image(1).split(",", 1)[1])
+    auth = {"Authorization": f"Bearer {auth_token}"}
+    enrolled = client.post("/api/v1/students/enroll-photo?studentId=stu_789xyz", content=photo,
+                           headers={**auth, "Content-Type": "image/png"})
+    assert enrolled.status_code == 200 and enrolled.json()["data"]["photoUrl"].endswith(".png")
+    
+    fields = {"subjectId": "stu_789xyz", "subjectType": "student", "gateId": "gate_main_entrance",
+              "scanTimestamp": datetime.utcnow().isoformat()}
+    multipart = client.post("/api/v1/scan/face/verify", data=fields, files={"faceImage": ("face.jpg", photo, "image/jpeg")})
+    assert multipart.status_code == 200 and multipart.json()["data"]["verified"] == True
+    raw = client.post("/api/v1/scan/face/verify", params=fields, content=photo, headers={"Content-Type": "image/jpeg"})
+    assert raw.json()["data"]["verified"] == True
+    
+    missing = client.post("/api/v1/scan/face/verify", params={k: v for k, v in fields.items() if k != "subjectId"}, content=photo, headers={"Content-Type": "image/jpeg"})
+    assert missing.status_code == 422 and missing.json()["detail"][0]["loc"] == ["query", "subjectId"]
+    no_image = client.post("/api/v1/scan/face/verify", data=fields, files={"note": ("note.txt", b"x", "text/plain")})
+    assert no_image.status_code == 400
+
+
+def test_oversized_images_refused_in_every_form(client, monkeypatch):
+    import base64
+    from app.core.config import settings
+    from app.utils.uploads import FIELDS_MAX_BYTES
+    
+    photo = base64.b64decode(face_image(1).split(",", 1)[1])
+    monkeypatch.setattr(settings, "MAX_IMAGE_UPLOAD_BYTES", len(photo) - 1)
+    fields = {"subjectId": "stu_789xyz", "subjectType": "student", "gateId": "gate_main_entrance",
+              "scanTimestamp": datetime.utcnow().isoformat()}
+    verify = lambda **kwargs: client.post("/api/v1/scan/face/verify", **kwargs).status_code
+    body = json.dumps({**fields, "faceImage": face_image(1)}).encode()
+    assert verify(content=body, headers={"Content-Type": "application/json"}) == 413
+    assert verify(data=fields, files={"faceImage": ("face.jpg", photo, "image/jpeg")}) == 413
+    assert verify(params=fields, content=photo, headers={"Content-Type": "image/jpeg"}) == 413
+    # Chunked bodies have no Content-Length and are cut off while streaming
+    padded = body[:-1] + b', "pad": "' + b"x" * 2 * FIELDS_MAX_BYTES + b'"}'
+    assert verify(content=iter([padded[i:i + 4096] for i in range(0, len(padded), 4096)]), headers={"Content-Type": "application/json"}) == 413
+    multipart_chunks = iter([b"--b\r\nContent-Disposition: form-data; name=\"faceImage\"; filename=\"f.jpg\"\r\n\r\n"] + [b"x" * 4096] * 64)
+    assert verify(content=multipart_chunks, headers={"Content-Type": "multipart/form-data; boundary=b"}) == 413
+
+def test_face_identify_ranks_enrolled_subjects(client, auth_token, monkeypatch):
+    from app.core.config import settings
+    from app.utils.images import decode_base64_image
+    
+    enroll(client, auth_token, "stu_789xyz", face_image(1))
+    embedding_store.put_image("staff", "stf_456abc", decode_base64_image(face_image(2))[0])
+    embedding_store.put_image("student", "stu_456abc", decode_base64_image(face_image(3))[0])
+    identify = lambda image, **extra: client.post("/api/v1/scan/face/identify", json={
+        "faceImage": image, "gateId": "gate_main_entrance", **extra
+    }, headers={"Authorization": f"Bearer {auth_token}"}).json()["data"]
+    
+    result = identify(face_image(2), topK=2)
+    assert result["matched"] == True and result["searchMethod"] == "exact" and len(result["candidates"]) == 2
+    assert result["candidates"][0] == {"subjectId": "stf_456abc", "subjectType": "staff", "name": "Dr. Robert Chen",
+                                       "confidence": 1.0, "aboveThreshold": True}
+    assert result["candidates"][1]["aboveThreshold"] == False
+    
+    monkeypatch.setattr(settings, "FACE_IVF_MIN_ROWS", 2)
+    face_index.rebuild()
+    result = identify(face_image(1))
+    assert result["searchMethod"] == "ivf" and result["candidates"][0]["subjectId"] == "stu_789xyz"
+    assert client.post("/api/v1/scan/face/identify", json={"faceImage": face_image(1), "gateId": "gate_main_entrance"}).status_code in (401, 403)
+
+def test_photos_stored_by_content_hash(client, auth_token, tmp_path):
+    import base64, hashlib
+    
+    photo = face_image(1)
+    urls = {enroll(client, auth_token, student_id, photo)["photoUrl"] for student_id in ("stu_789xyz", "stu_789xyz", "stu_456abc")}
+    digest = hashlib.sha256(base64.b64decode(photo.split(",", 1)[1])).hexdigest()
+    assert len(urls) == 1 and urls.pop().startswith(f"/api/v1/photos/{digest}.")
+    # One file, in its shard, and no temporary files left behind
+    files = [p for p in (tmp_path / "student_photos").rglob("*") if p.is_file()]
+    assert len(files) == 1 and files[0].parent == tmp_path / "student_photos" / digest[:2] / digest[2:4]
+    assert files[0].name.startswith(digest)
+
+def test_photos_served_with_thumbnails_etags_and_ranges(client, auth_token, tmp_path):
+    import base64, io, time
+    from app.core.config import settings
+    import numpy as np
+    from PIL import Image
+    
+    buffer = io.BytesIO()
+    Image.fromarray((np.random.default_rng(0).random((30, 40, 3)) * 255).astype("uint8")).resize((1600, 1200)).save(buffer, "PNG")
+    url = enroll(client, auth_token, "stu_789xyz", "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode())["photoUrl"]
+    # Normalized at enrollment: capped resolution, re-encoded as JPEG
+    assert url.endswith(".jpg")
+    auth = {"Authorization": f"Bearer {auth_token}"}
+    get = lambda url, headers={}, **kwargs: client.get(url, headers={**auth, **headers}, **kwargs)
+    full = get(url)
+    assert full.status_code == 200 and full.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(full.content)).size == (1024, 768)
+    
+    thumb = get(url, params={"size": "thumb"})
+    assert thumb.status_code == 200 and Image.open(io.BytesIO(thumb.content)).size == (160, 120)
+    assert thumb.headers["etag"] != full.headers["etag"] and "immutable" in thumb.headers["cache-control"]
+    assert len(list((tmp_path / "student_photos").rglob("*.160.jpg"))) == 1
+    assert get(url, params={"size": "thumb"}).content == thumb.content and thumbnails.hits == 1
+    assert full.headers["cache-control"].startswith("private")
+    
+    assert get(url, headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+    part = get(url, headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206 and part.content == full.content[100:200]
+    assert part.headers["content-range"] == f"bytes 100-199/{len(full.content)}"
+    assert get(url, headers={"Range": f"bytes={len(full.content)}-"}).status_code == 416
+    assert get("/api/v1/photos/" + "0" * 64 + ".jpg").status_code == 404
+    assert get("/api/v1/photos/..%2Fcampus_security.db").status_code == 404
+    
+    # Gate screens can't send a token: scan responses carry a signed URL instead
+    assert client.get(url).status_code == 401
+    signed = client.post("/api/v1/scan/qr", json={
+        "qrCode": "QR-STU-2024-ABC123XYZ", "gateId": "gate_main_entrance", "scanTimestamp": datetime.utcnow().isoformat()
+    }).json()["data"]["subject"]["photoUrl"]
+    assert signed.startswith(url + "?expires=")
+    response = client.get(signed, params={"size": "thumb"})
+    assert response.status_code == 200 and response.content == thumb.content
+    assert response.headers["cache-control"].startswith("private, max-age=")
+    assert client.get(signed[:-1] + ("0" if signed[-1] != "0" else "1")).status_code == 401
+    expired = photo_store.signature_expiry(time.time() - 3 * settings.PHOTO_URL_TTL_SECONDS)
+    assert client.get(photo_store.signed_url(url, expired)).status_code == 401
+
+def test_photo_collection_removes_unreferenced_files(client, auth_token, session, tmp_path):
+    import os, time
+    from app.models.student import Student
+    
+    root = tmp_path / "student_photos"
+    old_url = enroll(client, auth_token, "stu_789xyz", face_image(1))["photoUrl"]
+    auth = {"Authorization": f"Bearer {auth_token}"}
+    client.get(old_url, params={"size": "thumb"}, headers=auth)
+    current_url = enroll(client, auth_token, "stu_789xyz", face_image(2))["photoUrl"]
+    enroll(client, auth_token, "stu_456abc", face_image(3))  # replaced below, so orphaned
+    # A photo from before content addressing, referenced under the old CDN prefix
+    (root / "stu_111aaa_20260103065758.jpeg").write_bytes(b"legacy")
+    student = session.get(Student, "stu_111aaa")
+    student.photo_url = "https://cdn.campus-security.example.com/photos/stu_111aaa_20260103065758.jpeg"
+    session.add(student)
+    session.commit()
+    (root / "stu_222bbb_20260103065758.jpeg").write_bytes(b"orphan")
+    (root / ".abandoned.tmp").write_bytes(b"partial")
+    (root / "notes.txt").write_bytes(b"not ours")
+    day_ago = time.time() - 2 * 86400
+    for path in root.rglob("*"):
+        if path.is_file(): os.utime(path, (day_ago, day_ago))
+    young = photo_store.path_for_url(enroll(client, auth_token, "stu_456abc", face_image(4))["photoUrl"])
+    
+    collect = lambda dry_run: client.post("/api/v1/photos/collect", params={"dryRun": dry_run}, headers=auth).json()["data"]
+    preview = collect(True)
+    assert preview["removed"] == 5 and os.path.exists(photo_store.path_for_url(old_url))
+    stats = collect(False)
+    assert stats["removed"] == 5 and stats["reclaimedBytes"] == preview["reclaimedBytes"] > 0
+    
+    left = sorted(p.name for p in root.rglob("*") if p.is_file())
+    assert left == sorted([os.path.basename(current_url), os.path.basename(young), "notes.txt", "stu_111aaa_20260103065758.jpeg"])
+    assert client.get(current_url, headers=auth).status_code == 200 and client.get(old_url, headers=auth).status_code == 404
+    assert collect(False)["removed"] == 0
+
+def test_bulk_enrollment_embeds_and_resumes(session, tmp_path):
+    import base64
+    from bulk_enroll_photos import enroll
+    from app.models.credential import Credential, current_version
+    from app.models.student import Student
+    
+    photos = tmp_path / "intake"
+    photos.mkdir()
+    for student_id, seed in (("stu_456abc", 1), ("stu_111aaa", 2), ("stu_unknown", 3)):
+        (photos / f"{student_id}.jpg").write_bytes(base64.b64decode(face_image(seed).split(",", 1)[1]))
+    (photos / "stu_222bbb.jpg").write_bytes(b"not an image")
+    
+    run = lambda: enroll(str(photos), engine=engine, workers=2, batch_size=2, photo_dir=str(tmp_path / "photos"), log=lambda _: None)
+    credential_index.load(session)
+    version = current_version(session)
+    stats = run()
+    assert (stats["enrolled"], stats["failed"], stats["skipped"]) == (2, 1, 1)
+    session.expire_all()
+    assert session.get(Student, "stu_456abc").photo_url.endswith(".jpg") and session.get(Student, "stu_222bbb").photo_url is None
+    # Enrolled students get new credential versions, and scans show their photos right away
+    assert session.get(Credential, "QR-STU-2024-DEF456ABC").version > version
+    entry = credential_index.lookup(session, "QR-STU-2024-DEF456ABC")
+    assert entry.photo_url == session.get(Student, "stu_456abc").photo_url and entry.payload["subject"]["photoUrl"].startswith(entry.photo_url + "?")
+    assert embedding_store.get("student", "stu_111aaa") is not None
+    assert len(list((tmp_path / "photos").rglob("*.jpg"))) == 2
+    
+    # The checkpoint makes a second run a no-op
+    assert run()["resumed"] == 3 and run()["enrolled"] == 0
+
+def test_embedding_store_shares_rows_across_workers(tmp_path, monkeypatch):
+    import numpy as np
+    from app.services import embedding_store as store_module
+    from app.services.embedding_store import EmbeddingStore
+    from app.services.face_matcher import get_face_matcher
+    
+    monkeypatch.setattr(store_module, "INITIAL_CAPACITY", 2)
+    writer, reader = EmbeddingStore(str(tmp_path / "emb")), EmbeddingStore(str(tmp_path / "emb"))
+    dim = get_face_matcher().dim
+    vectors = np.eye(5, dim, dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        writer.put("student", f"stu_{i}", vector)
+    assert reader.get("student", "stu_4")[4] == 1.0
+    
+    writer.remove("student", "stu_1")
+    keys, rows = reader.matrix()
+    assert rows.shape == (5, dim) and keys[1] is None and not rows[1].any()
+    assert reader.get("student", "stu_1") is None
+    
+    writer.put("student", "stu_0", vectors[3])
+    assert reader.get("student", "stu_0")[3] == 1.0 and len(reader.matrix()[0]) == 6 and reader.removed == 2
+
+def test_gate_channel_pipelines_scans(client, session, auth_token, monkeypatch):
+    from starlette.websockets import WebSocketDisconnect
+    from app.models.gate import Gate
+    from app.models.enums import GateStatusEnum
+    from app.services.qr_service import QRService
+    
+    now = datetime.utcnow().isoformat()
+    with client.websocket_connect("/ws/gate/gate_main_entrance", headers={"Authorization": f"Bearer {auth_token}"}) as websocket:
+        websocket.send_text(json.dumps({"requestId": "r1", "type": "scan_qr", "qrCode": "QR-STU-2024-ABC123XYZ", "scanTimestamp": now}))
+        websocket.send_text(json.dumps({"requestId": "r2", "type": "scan_qr", "qrCode": "CHANNEL-BAD-QR", "scanTimestamp": now}))
+        websocket.send_text(json.dumps({"requestId": "r3", "type": "scan_qr", "qrCode": "QR-STU-2024-ABC123XYZ"}))
+        replies = [json.loads(websocket.receive_text()) for _ in range(3)]
+        assert [r["requestId"] for r in replies] == ["r1", "r2", "r3"]
+        assert replies[0]["data"]["subject"]["id"] == "stu_789xyz"
+        assert replies[1]["data"]["accessGranted"] == False
+        assert replies[2]["code"] == "VALIDATION_ERROR"
+        
+        # An unexpected failure answers that one request and keeps the channel open
+        scan_at_gate = QRService.scan_at_gate
+        async def failing(session, qr_code, *args):
+            if qr_code == "CHANNEL-CRASH": raise RuntimeError("boom")
+            return await scan_at_gate(session, qr_code, *args)
+        monkeypatch.setattr(QRService, "scan_at_gate", staticmethod(failing))
+        websocket.send_text(json.dumps({"requestId": "c1", "type": "scan_qr", "qrCode": "CHANNEL-CRASH", "scanTimestamp": now}))
+        assert json.loads(websocket.receive_text())["code"] == "INTERNAL_ERROR"
+        websocket.send_text(json.dumps({"requestId": "c2", "type": "scan_qr", "qrCode": "QR-STU-2024-ABC123XYZ", "scanTimestamp": now}))
+        assert json.loads(websocket.receive_text())["data"]["accessGranted"] == True
+        
+        gate = session.get(Gate, "gate_main_entrance")
+        gate.status = GateStatusEnum.MAINTENANCE
+        session.add(gate)
+        session.commit()
+        websocket.send_text(json.dumps({"requestId": "r4", "type": "scan_qr", "qrCode": "QR-STU-2024-ABC123XYZ", "scanTimestamp": now}))
+        assert json.loads(websocket.receive_text())["code"] == "503"
+    
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/gate/gate_unknown?token={auth_token}"):
+            pass
+    for query in ("", "?token=not-a-token"):
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect(f"/ws/gate/gate_library{query}"):
+                pass
+
 def test_vehicle_endpoints(client, auth_token):
     # 1. Vehicle Entry (Registered)
     response = client.post(
@@ -250,6 +1078,91 @@ def test_violations_and_resolution(client, auth_token):
     assert response.status_code == 200
     assert response.json()["data"]["resolved"] == True
 
+def test_violation_list_query_count_independent_of_page_size(client, auth_token, session, monkeypatch):
+    from sqlalchemy import event
+    from app.core.config import settings
+    from app.models.violation import Violation
+    from app.models.student import Student
+    from app.models.staff import StaffMember
+    from app.models.security_staff import SecurityStaff
+    from app.models.enums import ViolationTypeEnum, SubjectTypeEnum
+    
+    students = session.exec(select(Student)).all()
+    staff = session.exec(select(StaffMember)).all()
+    resolvers = session.exec(select(SecurityStaff)).all()
+    for i in range(60):
+        by_student = i % 2 == 0
+        subject = students[i % len(students)] if by_student else staff[i % len(staff)]
+        resolver = resolvers[i % len(resolvers)] if i % 3 == 0 else None
+        session.add(Violation(
+            id=f"vio_n1_{i:03d}", type=ViolationTypeEnum.FACE_VERIFICATION_MISMATCH,
+            subject_type=SubjectTypeEnum.STUDENT if by_student else SubjectTypeEnum.STAFF,
+            student_id=subject.id if by_student else None, staff_id=None if by_student else subject.id,
+            gate_id="gate_main_entrance", occurred_at=datetime.utcnow() - timedelta(minutes=i),
+            resolved=resolver is not None, resolved_by_staff_id=resolver.id if resolver else None
+        ))
+    session.commit()
+    
+    statements = []
+    count = lambda conn, cursor, statement, *args: statements.append(statement)
+    page = lambda limit: client.get("/api/v1/violations", params={"limit": limit},
+                                    headers={"Authorization": f"Bearer {auth_token}"}).json()["data"]["violations"]
+    monkeypatch.setattr(settings, "CACHE_CHECK_SECONDS", 3600)
+    page(1)  # warm the gate registry
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        small = page(5)
+        small_queries, statements[:] = len(statements), []
+        large = page(60)
+        large_queries = len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(small) == 5 and len(large) == 60
+    assert small_queries == large_queries
+    assert all(v["subject"] and v["gateName"] != "Unknown" for v in large)
+    assert sum(1 for v in large if v["resolvedBy"]) == 20 and large[:5] == small
+
+def test_cursor_pagination_matches_page_mode(client, auth_token, session):
+    import base64, json
+    from app.models.violation import Violation
+    from app.models.vehicle_alert import VehicleAlert
+    from app.models.enums import ViolationTypeEnum, VehicleAlertTypeEnum
+    
+    start = datetime(2026, 1, 1)
+    for i in range(25):
+        # Pairs of rows share a timestamp, so the id tie-break matters
+        session.add(Violation(id=f"vio_page_{i:03d}", type=ViolationTypeEnum.UNAUTHORIZED_QR_SCAN, gate_id="gate_main_entrance",
+                              occurred_at=start + timedelta(minutes=i // 2)))
+        session.add(VehicleAlert(license_plate=f"PLT-{i}", alert_type=VehicleAlertTypeEnum.UNKNOWN_VEHICLE,
+                                 timestamp=start + timedelta(minutes=i // 2)))
+    session.commit()
+    auth = {"Authorization": f"Bearer {auth_token}"}
+    
+    def walk(path, key, limit):
+        ids, cursor, pages = [], None, 0
+        while True:
+            data = client.get(path, params={"limit": limit, **({"cursor": cursor} if cursor else {})}, headers=auth).json()["data"]
+            pages += 1
+            ids += [row["id"] for row in data[key]]
+            cursor = data["pagination"]["nextCursor"]
+            if pages > 1: assert data["pagination"]["totalItems"] is None and data["pagination"]["currentPage"] is None
+            if not cursor: return ids, data["pagination"]
+    
+    for path, key, limit in (("/api/v1/violations", "violations", 7), ("/api/v1/vehicles/alerts", "alerts", 7),
+                             ("/api/v1/students", "students", 2)):
+        everything = client.get(path, params={"limit": 100}, headers=auth).json()["data"]
+        ids, last = walk(path, key, limit)
+        assert ids == [row["id"] for row in everything[key]] and len(set(ids)) == everything["pagination"]["totalItems"]
+        assert last["hasNextPage"] == False and last["hasPreviousPage"] == True
+    
+    uncounted = client.get("/api/v1/violations", params={"limit": 5, "includeTotal": False}, headers=auth).json()["data"]["pagination"]
+    assert uncounted["totalItems"] is None and uncounted["currentPage"] == 1 and uncounted["hasNextPage"] == True
+    assert client.get("/api/v1/violations", params={"cursor": "not-a-cursor"}, headers=auth).status_code == 400
+    for row_id in ({"a": 1}, [1], None, True, 1.5):
+        forged = base64.urlsafe_b64encode(json.dumps(["2026-01-01T00:00:00", row_id]).encode()).decode()
+        response = client.get("/api/v1/violations", params={"cursor": forged}, headers=auth)
+        assert response.status_code == 400 and response.json()["detail"]["code"] == "INVALID_CURSOR"
+
 def test_websocket_violation_broadcast(client):
     with client.websocket_connect("/ws/alerts") as websocket:
         # Trigger an unauthorized QR scan violation